@@ -0,0 +1,67 @@
+"""Benchmark of the JSON codec layer on large transaction feeds.
+
+For each feed size, compares the stdlib json module with orjson (when installed) for
+decoding a transactions response and encoding an API Gateway body of the same size, and
+shows what decoding a response only once saves over the old decode-per-use. Run from the
+starlingtestapp directory:
+
+    python benchmarks/bench_codec.py [feed size ...]
+"""
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from bench_round_up import build_feed               # noqa: E402
+from codec import StdlibCodec, build_codec, decode_response               # noqa: E402
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+REPEATS = 5
+
+
+class Response:
+    """Response with a body, like a preloaded urllib3 response"""
+    def __init__(self, data):
+        self.data = data
+
+
+def bench(function):
+    """ Best time in ms of REPEATS runs """
+    return min(timeit.repeat(function, number=1, repeat=REPEATS)) * 1000
+
+
+def decode_twice(codec, data):
+    """ The old pattern: every use of a response decodes its body again """
+    codec.loads(data)
+    return codec.loads(data)
+
+
+def decode_once(data):
+    response = Response(data)
+    decode_response(response)
+    return decode_response(response)
+
+
+def main(sizes):
+    stdlib = StdlibCodec()
+    fast = build_codec('auto')
+    print("codec in use: " + fast.name)
+    print("%10s %-26s %12s %12s %8s" % ("items", "operation", "json ms", fast.name + " ms", "speedup"))
+    for size in sizes:
+        document = build_feed(size)
+        data = stdlib.dumps(document).encode('utf-8')
+        assert fast.loads(data) == document
+        rows = [
+            ("decode feed", bench(lambda: stdlib.loads(data)), bench(lambda: fast.loads(data))),
+            ("encode body", bench(lambda: stdlib.dumps(document)), bench(lambda: fast.dumps(document))),
+        ]
+        for name, slow_ms, fast_ms in rows:
+            print("%10d %-26s %12.2f %12.2f %7.2fx" % (size, name, slow_ms, fast_ms, slow_ms / fast_ms))
+        twice = bench(lambda: decode_twice(fast, data))
+        once = bench(lambda: decode_once(data))
+        print("%10d %-26s %12.2f %12.2f %7.2fx" % (size, "two uses: decode each/once", twice, once, twice / once))
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES)
@@ -0,0 +1,77 @@
+"""Benchmark of compressed transaction feeds against the fake Starling API.
+
+For each feed size, requests the transactions of a week with and without
+FEED_COMPRESSION, read whole or streamed into the feed parser, and reports the bytes on
+the wire, the latency of the request and round up, and its peak memory (tracemalloc).
+--bandwidth limits how fast the fake API sends each response, as over a real network;
+without it loopback is so fast that compression only adds CPU time. Run from the
+starlingtestapp directory:
+
+    python benchmarks/bench_compression.py --bandwidth 5000000 [feed size ...]
+"""
+import argparse
+import os
+import sys
+import time
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from fake_starling import FakeStarling, ACCOUNT_UID, CATEGORY_UID     # noqa: E402
+from feed import iter_feed_items                                       # noqa: E402
+from path import RequestBuilder                                        # noqa: E402
+from user import User                                                  # noqa: E402
+import codec                                                           # noqa: E402
+
+DEFAULT_SIZES = [1000, 10000, 50000]
+REQUESTS = 5
+
+
+def round_up(builder, stream):
+    response = builder.send_transaction_request("token", ACCOUNT_UID, CATEGORY_UID, "2022-10-20", stream=stream)
+    if stream:
+        return User("token", None).round_up_stream(iter_feed_items(response))
+    return User("token", None).round_up_transactions(codec.loads(response.data))
+
+
+def measure(server, compression, stream):
+    """ Bytes sent per request, best latency in ms and peak memory in KiB of REQUESTS requests """
+    builder = RequestBuilder(base_url=server.url, compression=compression)
+    round_up(builder, stream)                   # Connect and warm up first
+    sent = server.bytes_sent
+    latencies = []
+    for _ in range(REQUESTS):
+        start = time.perf_counter()
+        amount = round_up(builder, stream)
+        latencies.append(time.perf_counter() - start)
+    wire = (server.bytes_sent - sent) // REQUESTS
+    tracemalloc.start()
+    round_up(builder, stream)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return amount, wire, min(latencies) * 1000, peak / 1024.0
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('sizes', type=int, nargs='*', default=DEFAULT_SIZES)
+    parser.add_argument('--bandwidth', type=float, default=0.0, help="bytes per second per response, 0 for no limit")
+    args = parser.parse_args()
+    print("%10s %-22s %12s %10s %10s" % ("items", "feed", "wire bytes", "ms", "peak KiB"))
+    for size in args.sizes:
+        server = FakeStarling(feed_size=size, bandwidth=args.bandwidth)
+        try:
+            amounts = set()
+            for compression in (False, True):
+                for stream in (False, True):
+                    amount, wire, latency, peak = measure(server, compression, stream)
+                    amounts.add(amount)
+                    name = ("gzip" if compression else "identity") + (", streamed" if stream else ", whole")
+                    print("%10d %-22s %12d %10.1f %10.1f" % (size, name, wire, latency, peak))
+            assert len(amounts) == 1
+        finally:
+            server.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""Memory benchmark of the User model and the round up on large transaction feeds.
+
+For each feed size, reports with tracemalloc:
+- the memory a user keeps once its transactions are rounded up from a response body and
+  the decoded feed is gone: the original dict-based User, which kept a list of ints, and
+  the slotted User, which round_up_transactions leaves holding no amounts at all
+- the peak memory of rounding up a raw response body, decoded whole or streamed
+
+Run from the starlingtestapp directory:
+
+    python benchmarks/bench_memory.py [feed size ...]
+"""
+import gc
+import json
+import os
+import sys
+import tracemalloc
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from bench_round_up import build_feed   # noqa: E402
+from feed import FeedParser             # noqa: E402
+from user import User                   # noqa: E402
+
+DEFAULT_SIZES = [10000, 100000]
+CHUNK_SIZE = 64 * 1024
+
+
+class LegacyUser:
+    """ The original User: attributes in a per-instance __dict__ and amounts in a list """
+
+    def __init__(self, auth, savingsGoalUid):
+        self.__auth = auth
+        self.__savingsGoalUid = savingsGoalUid
+        self.__primary_index = 0
+        self.__accountUid = "0c6a1b4e-6a50-4b3d-9ae2-7d6b1a3f6e10"
+        self.__default_category = "9b0e2c1d-8f4a-4c52-a1c3-2e5d7f9a0b21"
+        self.__currency = "GBP"
+
+    def parse_transaction_out_data(self, response):
+        self.transactions = []
+        for each in response['feedItems']:
+            if each['direction'] == 'OUT' and each['status'] == 'SETTLED':
+                self.transactions.append(each['amount']['minorUnits'])
+
+
+def measure(function):
+    """ Run function under tracemalloc
+
+    Returns:
+        (object, int, int): result, bytes still allocated while the result is alive, peak bytes
+    """
+    gc.collect()
+    tracemalloc.start()
+    before = tracemalloc.get_traced_memory()[0]
+    result = function()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, current - before, peak - before
+
+
+def legacy_user(body):
+    user = LegacyUser("auth", None)
+    user.parse_transaction_out_data(json.loads(body.decode('utf-8')))
+    return user
+
+
+def slotted_user(body):
+    user = User("auth", None)
+    user.set_accountUid("0c6a1b4e-6a50-4b3d-9ae2-7d6b1a3f6e10")
+    user.set_default_category("9b0e2c1d-8f4a-4c52-a1c3-2e5d7f9a0b21")
+    user.set_currency("GBP")
+    user.round_up_transactions(json.loads(body.decode('utf-8')))
+    return user
+
+
+def round_up_decoded(body):
+    return User("auth", None).round_up_transactions(json.loads(body.decode('utf-8')))
+
+
+def round_up_streamed(body):
+    parser = FeedParser()
+
+    def items():
+        for start in range(0, len(body), CHUNK_SIZE):
+            yield from parser.feed(body[start:start + CHUNK_SIZE])
+        parser.close()
+
+    return User("auth", None).round_up_stream(items())
+
+
+def kib(size):
+    return "%10.1f" % (size / 1024.0)
+
+
+def main(sizes):
+    print("%10s %-34s %10s %10s" % ("items", "measure", "kept KiB", "peak KiB"))
+    for size in sizes:
+        body = json.dumps(build_feed(size)).encode('utf-8')
+        for name, function in [("legacy User, list of ints", legacy_user),
+                               ("slotted User, rounded up", slotted_user)]:
+            _, kept, peak = measure(lambda: function(body))
+            print("%10d %-34s %s %s" % (size, name, kib(kept), kib(peak)))
+        decoded, _, decoded_peak = measure(lambda: round_up_decoded(body))
+        streamed, _, streamed_peak = measure(lambda: round_up_streamed(body))
+        assert decoded == streamed
+        print("%10d %-34s %10s %s" % (size, "round up, body decoded whole", "", kib(decoded_peak)))
+        print("%10d %-34s %10s %s" % (size, "round up, body streamed", "", kib(streamed_peak)))
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES)
@@ -0,0 +1,65 @@
+"""Microbenchmark of the round up calculation on large transaction feeds.
+
+Compares the original list-then-loop round up (float math.ceil per item) against
+User.round_up_transactions. Run from the starlingtestapp directory:
+
+    python benchmarks/bench_round_up.py [feed size ...]
+"""
+import math
+import os
+import random
+import sys
+import timeit
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src"))
+
+from user import User   # noqa: E402
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+REPEATS = 5
+
+
+def build_feed(size, seed=0):
+    """ Build a synthetic feedItems response with a mix of directions and statuses """
+    rng = random.Random(seed)
+    items = []
+    for _ in range(size):
+        items.append({
+            "feedItemUid": "%032x" % rng.getrandbits(128),
+            "direction": rng.choice(["OUT", "OUT", "OUT", "IN"]),
+            "status": rng.choice(["SETTLED", "SETTLED", "SETTLED", "PENDING"]),
+            "amount": {"currency": "GBP", "minorUnits": rng.randint(1, 500000)},
+        })
+    return {"feedItems": items}
+
+
+def legacy_round_up(response):
+    """ The original implementation: build a list, then ceil each amount as a float """
+    transactions = []
+    for each in response['feedItems']:
+        if each['direction'] == 'OUT' and each['status'] == 'SETTLED':
+            transactions.append(each['amount']['minorUnits'])
+    round_ups = 0
+    for transaction_amount in transactions:
+        round_ups = round_ups + int(math.ceil(transaction_amount / 100.0)) * 100 - transaction_amount
+    return round_ups
+
+
+def bench(function, response):
+    """ Best time in seconds of REPEATS runs """
+    return min(timeit.repeat(lambda: function(response), number=1, repeat=REPEATS))
+
+
+def main(sizes):
+    user = User("auth", None)
+    print("%10s %12s %12s %8s" % ("items", "legacy ms", "current ms", "speedup"))
+    for size in sizes:
+        response = build_feed(size)
+        assert legacy_round_up(response) == user.round_up_transactions(response)
+        legacy = bench(legacy_round_up, response)
+        current = bench(user.round_up_transactions, response)
+        print("%10d %12.3f %12.3f %7.2fx" % (size, legacy * 1000, current * 1000, legacy / current))
+
+
+if __name__ == "__main__":
+    main([int(arg) for arg in sys.argv[1:]] or DEFAULT_SIZES)
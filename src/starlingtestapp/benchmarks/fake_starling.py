@@ -0,0 +1,154 @@
+"""Local stand-in for the Starling sandbox API, for benchmarks.
+
+Serves the endpoints used by the round up with configurable latency, bandwidth, feed size
+and error rate. Transaction feeds are sent gzip compressed when the request accepts it.
+Run on its own to point a local handler at it:
+
+    python benchmarks/fake_starling.py --port 8080 --latency 0.02 --feed-size 5000
+    STARLING_API_BASE=http://127.0.0.1:8080 ...
+"""
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import argparse
+import gzip
+import json
+import random
+import re
+import threading
+import time
+
+from bench_round_up import build_feed
+
+ACCOUNT_UID = "0c6a1b4e-6a50-4b3d-9ae2-7d6b1a3f6e10"
+CATEGORY_UID = "9b0e2c1d-8f4a-4c52-a1c3-2e5d7f9a0b21"
+GOAL_UID = "8dadbaed-ebdc-4818-9de7-74ce811214e3"
+
+ACCOUNTS = re.compile(r"^/api/v2/accounts$")
+BALANCE = re.compile(r"^/api/v2/accounts/[^/]+/balance$")
+FEED = re.compile(r"^/api/v2/feed/account/[^/]+/category/[^/]+/transactions-between$")
+SAVINGS = re.compile(r"^/api/v2/account/[^/]+/savings-goals$")
+ADD_MONEY = re.compile(r"^/api/v2/account/[^/]+/savings-goals/[^/]+/add-money/[^/]+$")
+
+
+class Server(ThreadingHTTPServer):
+    request_queue_size = 256    # Room for many clients connecting at once, e.g. the async backend
+
+
+class FakeStarling:
+    """
+    This class runs a fake Starling API on a local port in a background thread.
+
+    Example:
+    server = FakeStarling(latency=0.02, feed_size=5000, error_rate=0.01)
+    os.environ['STARLING_API_BASE'] = server.url
+    ...
+    server.close()
+    """
+    def __init__(self, port=0, latency=0.0, feed_size=100, error_rate=0.0, seed=0, bandwidth=0.0):
+        self.latency = latency
+        self.bandwidth = bandwidth      # Bytes per second per response, 0 for no limit
+        self.error_rate = error_rate
+        self.requests = 0
+        self.__random = random.Random(seed)
+        self.__lock = threading.Lock()
+        self.__feed = json.dumps(build_feed(feed_size, seed)).encode('utf-8')
+        self.__gzip_feed = gzip.compress(self.__feed, 6)
+        self.bytes_sent = 0
+        self.__accounts = json.dumps({"accounts": [{
+            "accountUid": ACCOUNT_UID, "accountType": "PRIMARY", "defaultCategory": CATEGORY_UID,
+            "currency": "GBP", "createdAt": "2022-10-01T00:00:00.000Z", "name": "Personal"}]}).encode('utf-8')
+        self.__goals = json.dumps({"savingsGoalList": [{
+            "savingsGoalUid": GOAL_UID, "name": "Round ups", "target": {"currency": "GBP", "minorUnits": 100000},
+            "totalSaved": {"currency": "GBP", "minorUnits": 0}, "savedPercentage": 0}]}).encode('utf-8')
+        self.__balance = json.dumps({"clearedBalance": {"currency": "GBP", "minorUnits": 10 ** 9},
+                                     "effectiveBalance": {"currency": "GBP", "minorUnits": 10 ** 9}}).encode('utf-8')
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"       # Keep-alive, like the real API
+            disable_nagle_algorithm = True      # Headers and body are written separately
+
+            def do_GET(self):
+                server.handle(self)
+
+            def do_PUT(self):
+                server.handle(self)
+
+            def log_message(self, format, *args):
+                pass
+
+        self.server = Server(('127.0.0.1', port), Handler)
+        self.server.daemon_threads = True
+        self.url = "http://127.0.0.1:%d" % self.server.server_address[1]
+        self.__thread = threading.Thread(target=self.server.serve_forever, args=(0.05,), daemon=True)
+        self.__thread.start()
+
+    def should_fail(self):
+        with self.__lock:
+            self.requests += 1
+            return self.__random.random() < self.error_rate
+
+    def route(self, method, path):
+        """ Return the status and body for a request """
+        if method == 'GET' and ACCOUNTS.match(path):
+            return 200, self.__accounts
+        if method == 'GET' and BALANCE.match(path):
+            return 200, self.__balance
+        if method == 'GET' and FEED.match(path):
+            return 200, self.__feed
+        if method == 'GET' and SAVINGS.match(path):
+            return 200, self.__goals
+        if method == 'PUT' and SAVINGS.match(path):
+            return 200, json.dumps({"savingsGoalUid": GOAL_UID, "success": True}).encode('utf-8')
+        if method == 'PUT' and ADD_MONEY.match(path):
+            return 200, json.dumps({"transferUid": path.rsplit('/', 1)[1], "success": True}).encode('utf-8')
+        return 404, json.dumps({"error": "not_found"}).encode('utf-8')
+
+    def handle(self, request):
+        length = int(request.headers.get('Content-Length') or 0)
+        if length:
+            request.rfile.read(length)
+        if self.latency:
+            time.sleep(self.latency)
+        encoding = None
+        if self.should_fail():
+            status, body = 503, json.dumps({"error": "unavailable"}).encode('utf-8')
+        else:
+            status, body = self.route(request.command, request.path.split('?', 1)[0])
+            if body is self.__feed and 'gzip' in request.headers.get('Accept-Encoding', ''):
+                body, encoding = self.__gzip_feed, 'gzip'
+        with self.__lock:
+            self.bytes_sent += len(body)
+        if self.bandwidth:
+            time.sleep(len(body) / self.bandwidth)
+        request.send_response(status)
+        request.send_header('Content-Type', 'application/json')
+        if encoding is not None:
+            request.send_header('Content-Encoding', encoding)
+        request.send_header('Content-Length', str(len(body)))
+        request.end_headers()
+        request.wfile.write(body)
+
+    def close(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument('--feed-size', type=int, default=100, help="feed items per transactions response")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of requests answered with 503")
+    parser.add_argument('--bandwidth', type=float, default=0.0, help="bytes per second per response, 0 for no limit")
+    args = parser.parse_args()
+    server = FakeStarling(args.port, args.latency, args.feed_size, args.error_rate, bandwidth=args.bandwidth)
+    print("Fake Starling API on " + server.url)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.close()
+
+
+if __name__ == "__main__":
+    main()
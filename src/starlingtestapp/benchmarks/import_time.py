@@ -0,0 +1,86 @@
+"""Cold start report for the Lambda handler, in the style of python -X importtime.
+
+Imports app in fresh interpreters and reports the median cumulative import time of app
+and its slowest dependencies. It also times a cold invocation with bad input, which
+must answer without importing the HTTP stack. Save a run with --save and compare later
+runs with --baseline:
+
+    python benchmarks/import_time.py --runs 10 --save imports.json
+    python benchmarks/import_time.py --runs 10 --baseline imports.json
+"""
+import argparse
+import json
+import os
+import re
+import statistics
+import subprocess
+import sys
+
+SRC = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..", "src")
+LINE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)$")
+COLD_ERROR = (
+    "import sys, time\n"
+    "start = time.perf_counter()\n"
+    "import app\n"
+    "response = app.lambda_handler({'queryStringParameters': {}}, None)\n"
+    "elapsed = time.perf_counter() - start\n"
+    "assert response['statusCode'] == 400\n"
+    "print(elapsed, 'urllib3' in sys.modules)\n"
+)
+
+
+def import_times():
+    """ Import app in a new interpreter and return cumulative microseconds per top-level module """
+    result = subprocess.run([sys.executable, "-X", "importtime", "-c", "import app"], cwd=SRC,
+                            capture_output=True, text=True, check=True)
+    times = {}
+    for line in result.stderr.splitlines():
+        match = LINE.match(line)
+        if match and len(match.group(3)) <= 3:        # Modules imported by app and app itself
+            times[match.group(4)] = times.get(match.group(4), 0) + int(match.group(2))
+    return times
+
+
+def cold_error_invocation():
+    """ Seconds to import app and answer a request with no parameters, and whether urllib3 was loaded """
+    result = subprocess.run([sys.executable, "-c", COLD_ERROR], cwd=SRC, capture_output=True, text=True, check=True)
+    elapsed, loaded = result.stdout.split()
+    return float(elapsed), loaded == 'True'
+
+
+def run(runs, top):
+    samples = [import_times() for _ in range(runs)]
+    modules = {name: statistics.median(sample.get(name, 0) for sample in samples) for name in samples[0]}
+    cold = [cold_error_invocation() for _ in range(runs)]
+    return {
+        "runs": runs,
+        "app_import_ms": round(modules.get('app', 0) / 1000.0, 2),
+        "cold_error_ms": round(statistics.median(elapsed for elapsed, _ in cold) * 1000, 2),
+        "error_path_loads_urllib3": any(loaded for _, loaded in cold),
+        "slowest_imports_ms": {name: round(us / 1000.0, 2) for name, us in
+                               sorted(modules.items(), key=lambda item: -item[1])[:top] if name != 'app'},
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=5)
+    parser.add_argument('--top', type=int, default=10, help="slowest imports to list")
+    parser.add_argument('--save', help="write the result to this JSON file")
+    parser.add_argument('--baseline', help="compare against a result saved with --save")
+    args = parser.parse_args()
+
+    result = run(args.runs, args.top)
+    print(json.dumps(result, indent=2))
+    if args.save:
+        with open(args.save, 'w') as out:
+            json.dump(result, out, indent=2)
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            baseline = json.load(baseline_file)
+        for metric in ["app_import_ms", "cold_error_ms"]:
+            print("%-15s %10.2f -> %10.2f ms" % (metric, baseline[metric], result[metric]))
+
+
+if __name__ == "__main__":
+    main()
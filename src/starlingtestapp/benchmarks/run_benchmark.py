@@ -0,0 +1,173 @@
+"""End to end benchmark of app.lambda_handler against a local fake Starling API.
+
+Builds synthetic events from events/event.json and reports throughput, p50/p99 latency
+and peak RSS. Save a run with --save and compare later runs with --baseline:
+
+    python benchmarks/run_benchmark.py --invocations 200 --concurrency 8 --feed-size 5000 --save base.json
+    python benchmarks/run_benchmark.py --invocations 200 --concurrency 8 --feed-size 5000 --baseline base.json
+
+With --backend async the same events go through async_app on one event loop, with
+--concurrency round ups in flight at once instead of one thread each.
+
+Every event has its own token and the transfer ledger is off, so each timed invocation
+runs the whole pipeline rather than being answered from the cache or the ledger.
+"""
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import copy
+import json
+import os
+import resource
+import sys
+import time
+
+from fake_starling import FakeStarling, GOAL_UID
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+EVENT_PATH = os.path.join(HERE, "..", "events", "event.json")
+SRC = os.path.join(HERE, "..", "src")
+
+
+def build_events(count, token="benchmark-token"):
+    """ Copy events/event.json, moving the token into the query string as the handler expects.
+    Each event has its own token, so every invocation fetches its metadata as a new user would
+    instead of being answered from the cache warmed by the one before """
+    with open(EVENT_PATH) as event_file:
+        template = json.load(event_file)
+    events = []
+    for index in range(count):
+        event = copy.deepcopy(template)
+        event['queryStringParameters'] = {"Authorization": token + "-" + str(index), "date": "2022-10-20",
+                                          "savingsGoalUid": GOAL_UID}
+        events.append(event)
+    return events
+
+
+def percentile(values, fraction):
+    """Nearest-rank percentile of a list of values"""
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, max(0, int(round(fraction * len(ordered))) - 1))]
+
+
+def peak_rss_mb():
+    """Peak resident set size of this process in MB (ru_maxrss is KB on Linux, bytes on macOS)"""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024.0 * 1024.0) if sys.platform == 'darwin' else peak / 1024.0
+
+
+def summarise(invocations, concurrency, elapsed, latencies, statuses):
+    """Summary of a run"""
+    return {
+        "invocations": invocations,
+        "concurrency": concurrency,
+        "throughput_per_s": round(invocations / elapsed, 2),
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+        "statuses": {str(status): count for status, count in sorted(statuses.items())},
+    }
+
+
+def run(invocations, concurrency, warmup):
+    """ Invoke the handler and time each call
+
+    Returns:
+        dict: summary of the run
+    """
+    import app      # Imported after STARLING_API_BASE is set
+
+    for event in build_events(warmup, "warmup-token"):
+        app.lambda_handler(event, None)
+    latencies = []
+
+    def invoke(event):
+        start = time.perf_counter()
+        response = app.lambda_handler(event, None)
+        latencies.append(time.perf_counter() - start)
+        return response['statusCode']
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        statuses = Counter(executor.map(invoke, build_events(invocations)))    # Counted here, not from each thread
+    return summarise(invocations, concurrency, time.perf_counter() - start, latencies, statuses)
+
+
+def run_async(invocations, concurrency, warmup):
+    """ Run the round ups as coroutines on async_app's event loop and time each one
+
+    Returns:
+        dict: summary of the run
+    """
+    import asyncio
+    import app
+    import async_app
+
+    for event in build_events(warmup, "warmup-token"):
+        async_app.lambda_handler(event, None)
+    latencies = []
+
+    async def invoke_all(events):
+        slots = asyncio.Semaphore(concurrency)
+        builder = async_app.get_async_builder()
+        stores = (app.get_metadata_cache(), app.get_checkpoint_store(), app.get_transfer_ledger())
+
+        async def invoke(event):
+            async with slots:
+                start = time.perf_counter()
+                status, _ = await async_app.round_up(event, builder, *stores)
+                latencies.append(time.perf_counter() - start)
+            return status
+
+        return Counter(await asyncio.gather(*[invoke(event) for event in events]))
+
+    start = time.perf_counter()
+    statuses = async_app.get_event_loop().run_until_complete(invoke_all(build_events(invocations)))
+    return summarise(invocations, concurrency, time.perf_counter() - start, latencies, statuses)
+
+
+def compare(result, baseline):
+    """Print each metric next to the baseline"""
+    print("%-18s %12s %12s %9s" % ("metric", "baseline", "current", "change"))
+    for metric in ["throughput_per_s", "p50_ms", "p99_ms", "peak_rss_mb"]:
+        before, after = baseline[metric], result[metric]
+        change = (after - before) / before * 100 if before else 0.0
+        print("%-18s %12.2f %12.2f %+8.1f%%" % (metric, before, after, change))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--invocations', type=int, default=100)
+    parser.add_argument('--concurrency', type=int, default=1)
+    parser.add_argument('--warmup', type=int, default=5)
+    parser.add_argument('--latency', type=float, default=0.01, help="seconds the fake API adds to every response")
+    parser.add_argument('--feed-size', type=int, default=100, help="feed items per transactions response")
+    parser.add_argument('--error-rate', type=float, default=0.0, help="fraction of requests answered with 503")
+    parser.add_argument('--backend', choices=['threads', 'async'], default='threads',
+                        help="lambda_handler on a thread pool, or async_app on one event loop")
+    parser.add_argument('--save', help="write the result to this JSON file")
+    parser.add_argument('--baseline', help="compare against a result saved with --save")
+    args = parser.parse_args()
+
+    server = FakeStarling(latency=args.latency, feed_size=args.feed_size, error_rate=args.error_rate)
+    os.environ['STARLING_API_BASE'] = server.url
+    os.environ['LEDGER_STORE'] = 'off'      # Every event is the same week of the fake account, time the transfer each time
+    sys.path.insert(0, SRC)
+    try:
+        backend = run_async if args.backend == 'async' else run
+        result = backend(args.invocations, args.concurrency, args.warmup)
+    finally:
+        server.close()
+    result.update({"backend": args.backend, "latency": args.latency, "feed_size": args.feed_size, "error_rate": args.error_rate,
+                   "requests_served": server.requests})
+    print(json.dumps(result, indent=2))
+    if args.save:
+        with open(args.save, 'w') as out:
+            json.dump(result, out, indent=2)
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            compare(result, json.load(baseline_file))
+
+
+if __name__ == "__main__":
+    main()
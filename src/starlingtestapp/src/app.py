@@ -1,19 +1,97 @@
-from path import RequestBuilder
-from user import User
+# Only light modules are imported here. The HTTP stack (path -> urllib3) and the pipeline modules
+# are imported on first use, so cold starts are shorter and input errors never load them.
+from metrics import recorder
 import exceptions as e
-import json
+import codec
+import profiling
+import os
 
 QUERY_STRING_PARAMETERS = 'queryStringParameters'
 HEADERS = 'headers'
 AUTH = 'Authorization'
 DATE = 'date'
 SAVINGS_ID = 'savingsGoalUid'
-SAVINGS_GOALS_LIST = "savingsGoalList"
+INCREMENTAL = 'incremental'
+ALL_ACCOUNTS = 'allAccounts'
+END_DATE = 'endDate'
+FEED_ITEMS = 'feedItems'
 HTTP_METHOD = 'httpMethod'
 PUT = 'PUT'
 PATH = 'path'
 ROUND = '/round'
 CLI_ERR_STATUS = 400
+SERVER_ERR_STATUS = 500
+UNAVAILABLE_STATUS = 503
+BODY = 'body'
+JOBS = 'jobs'
+RESULTS = 'results'
+STATUS_CODE = 'statusCode'
+ACCOUNTS_RESULTS = 'accounts'
+ACCOUNT_UID = 'accountUid'
+ROUND_UP = 'roundUp'
+MULTI_STATUS = 207
+MAX_WORKERS = int(os.environ.get('ROUND_UP_MAX_WORKERS', '4'))   # 1 = send requests one after another
+BATCH_WORKERS = int(os.environ.get('BATCH_MAX_WORKERS', '8'))     # Jobs in flight at once in batch_handler
+ACCOUNT_WORKERS = int(os.environ.get('ACCOUNT_MAX_WORKERS', '4')) # Accounts rounded up at once with allAccounts
+STREAM_FEED = os.environ.get('STREAM_FEED', 'false').lower() == 'true'   # Parse the feed while it downloads
+BALANCE_POLICY = os.environ.get('BALANCE_POLICY', 'off').lower()  # off, skip or cap a round up above the cleared balance
+BALANCE_OFF = 'off'
+BALANCE_SKIP = 'skip'
+BALANCE_CAP = 'cap'
+
+metadata_cache = None       # Accounts and savings goals, kept across warm invocations
+checkpoint_store = None     # How far each account has been rounded up in incremental mode
+transfer_ledger = None      # Outcome of each week's transfer, so re-runs are answered without a transfer
+
+def get_builder():
+    """ Return the shared RequestBuilder, importing the HTTP stack on first use """
+    from path import get_builder as get_shared_builder
+    return get_shared_builder()
+
+def get_metadata_cache():
+    """ Return the metadata cache, creating it on first use """
+    global metadata_cache
+    if metadata_cache is None:
+        from cache import build_cache
+        metadata_cache = build_cache()
+    return metadata_cache
+
+def get_checkpoint_store():
+    """ Return the checkpoint store, creating it on first use """
+    global checkpoint_store
+    if checkpoint_store is None:
+        from checkpoint import build_checkpoint_store
+        checkpoint_store = build_checkpoint_store()
+    return checkpoint_store
+
+def get_transfer_ledger():
+    """ Return the transfer ledger, creating it on first use. None if LEDGER_STORE is off """
+    global transfer_ledger
+    if transfer_ledger is None:
+        from ledger import build_ledger
+        transfer_ledger = build_ledger()
+    return transfer_ledger
+
+def response_builder(status_code, body=None):
+    """ Builds the API Gateway response message, the one response encoder of both backends
+
+    Args:
+        status_code (int): Status code from REST API doc
+        body (str): Message payload. Defaults to None.
+
+    Returns:
+        response: built response
+    """
+    response = {
+                'statusCode': status_code,
+                'headers': {
+                'Content-Type': 'application/json',
+                'Access-Control-Allow-Origin': '*'
+                }
+            }
+    if body is not None:
+        response['body'] = codec.dumps(body)
+    return response
 
 def error_dict(error):
     """Returns dictionary form of error"""
@@ -42,13 +120,467 @@ def get_inputs(event):
         savingsGoalUid = None
     return auth, date_input, savingsGoalUid
 
+def get_option(event, name):
+    """ Return an optional query string parameter, or None """
+    parameters = event.get(QUERY_STRING_PARAMETERS) or {}
+    return parameters.get(name)
+
+def get_flag(event, name):
+    """ Return True if an optional query string parameter is set to true """
+    return str(get_option(event, name)).lower() == 'true'
+
 def json_encoder(response):
-    """ Uses json lib to encode response from XML """
-    return json.loads(response.data.decode('utf-8'))
+    """ Decode the JSON body of a response with the codec layer, at most once per response """
+    with recorder.timer('json_decode') as timer:
+        timer.size = len(response.data)
+        return codec.decode_response(response)
+
+def stream_round_up(round_up_items, response):
+    """ Round up a feed while it is read, see feed.iter_feed_items. The body is read after
+    send_request has returned, so a body that breaks off (connection lost, read timeout, bad
+    gzip or incomplete JSON) is mapped here to the same error as a request that failed to connect
+
+    Args:
+        round_up_items (function): rounds up an iterable of feed items
+        response (HTTPResponse): transactions response sent with stream=True
+
+    Raises:
+        ServiceUnavailableException: if the body could not be read whole
+
+    Returns:
+        int: round up
+    """
+    import urllib3
+    from feed import iter_feed_items
+    from path import TRANSACTIONS
+    try:
+        return round_up_items(iter_feed_items(response))
+    except (urllib3.exceptions.HTTPError, ValueError) as exc:
+        raise e.ServiceUnavailableException(TRANSACTIONS) from exc
+
+def error_body(response):
+    """ Decoded body of an error response, or an error dict if it is not JSON e.g. a gateway's HTML page """
+    try:
+        return json_encoder(response)
+    except ValueError:
+        return error_dict("Starling API answered " + str(response.status))
+
+
+HANDLED_EXCEPTIONS = (e.DuplicateTransferException, e.DateFormatException, e.GoalNotFoundException,
+                      e.AccountException, e.InputException, e.ServiceUnavailableException,
+                      e.InsufficientFundsException)
+
+def error_response(exc, auth=None, cache=None):
+    """ Map an exception raised by a round up to the status and body of its response
+
+    Args:
+        exc (Exception): one of HANDLED_EXCEPTIONS
+        auth (string): token of the round up, if known. Defaults to None.
+        cache (TTLCache or SQLiteCache): metadata cache. Defaults to None.
+
+    Returns:
+        (int, dict): status code and body of the response
+    """
+    if isinstance(exc, e.DuplicateTransferException):     # Same answer as the transfer already made
+        return exc.entry['status'], exc.entry['body']
+    if isinstance(exc, e.AccountException):
+        if exc.response.status >= 500:              # Still failing once retries ran out
+            return error_response(e.ServiceUnavailableException(None), auth, cache)
+        if cache is not None and auth is not None and 400 <= exc.response.status < 500:
+            cache.invalidate_token(auth)            # Token or account may no longer be valid
+        return exc.response.status, error_body(exc.response)
+    if isinstance(exc, e.ServiceUnavailableException):
+        return UNAVAILABLE_STATUS, error_dict(exc.message)
+    return CLI_ERR_STATUS, error_dict(exc.message)
+
+def check_ledger(ledger, key):
+    """ Raise DuplicateTransferException if the ledger holds a successful transfer for key """
+    if ledger is not None:
+        from ledger import is_done
+        entry = ledger.get(key)
+        if is_done(entry):
+            raise e.DuplicateTransferException(entry)
+
+def apply_balance_policy(policy, amount, balance):
+    """ Amount to transfer once the cleared balance is known, so a transfer that would fail
+    is never sent
+
+    Args:
+        policy (string): BALANCE_SKIP or BALANCE_CAP
+        amount (int): round up in minor units
+        balance (int): cleared balance in minor units
+
+    Raises:
+        InsufficientFundsException: if the balance cannot cover the round up (skip), or any of it (cap)
+
+    Returns:
+        int: amount to transfer
+    """
+    if amount <= balance:
+        return amount
+    if policy == BALANCE_CAP and balance > 0:
+        return balance
+    raise e.InsufficientFundsException(amount, balance, "Round up of " + str(amount)
+                                       + " exceeds cleared balance of " + str(balance))
+
+
+NO_NEW_TRANSACTIONS = {"success": True, "message": "No new transactions to round up"}
+
+
+class RoundUpSteps:
+    """
+    This class makes the decisions of one round up that need no request: the date and ledger
+    checks, the incremental checkpoint, goal resolution, and the ledger and checkpoint
+    bookkeeping around the transfer.
+
+    build_round_up_graph and async_app.run_round_up send the Starling requests in between,
+    blocking or awaited, so the two backends only differ in how they wait for them.
+
+    Example:
+    steps = RoundUpSteps(path_builder, call_user, date, cache, checkpoints, end_date, ledger)
+    steps.set_account(accounts)
+    if not steps.resolve_goal(savings_goals, cached):
+        steps.resolve_goal(fresh_savings_goals)
+    uid = steps.start_transfer(amount)
+    status, body = steps.finish_transfer(path_builder.send_transfer_round_up_request(..., amount, uid))
+    """
+    def __init__(self, path_builder, call_user, date, cache=None, checkpoints=None, end_date=None, ledger=None):
+        self.__builder = path_builder
+        self.__user = call_user
+        self.__date = date
+        self.__cache = cache
+        self.__checkpoints = checkpoints
+        self.__end_date = end_date
+        self.__ledger = ledger
+        self.__period = None
+        self.__checkpoint_key = None
+        self.__checkpoint = None
+        self.__key = None
+        self.__uid = None
+
+    def set_account(self, accounts=None, account=None):
+        """ Take the account to round up, then validate the dates before the goal branch can create
+        a goal. With a savingsGoalUid, a period already transferred is answered before the feed is fetched
+
+        Args:
+            accounts (dict): decoded accounts response, the primary account is used. Defaults to None.
+            account (dict): account to round up instead. Defaults to None.
+
+        Raises:
+            DateFormatException or InputException: if the dates are invalid
+            DuplicateTransferException: if the ledger holds this period's transfer
+        """
+        from ledger import ledger_key
+        if account is not None:
+            self.__user.set_account(account)
+        else:
+            self.__user.parse_account(accounts)
+        self.__period = self.__builder.iso_date(self.__date)    # Every spelling of a period has one transfer UID
+        if self.__end_date is not None:
+            self.__builder.split_date_range(self.__date, self.__end_date)
+            self.__period += ".." + self.__builder.iso_date(self.__end_date)
+        if self.__checkpoints is None and self.__user.get_savingsGoalUid() is not None:
+            check_ledger(self.__ledger, ledger_key(self.__user.get_accountUid(), self.__user.get_savingsGoalUid(),
+                                                   self.__period))
+
+    def start_incremental(self):
+        """ Load the account's checkpoint, starting from date on the first run
+
+        Returns:
+            string: timestamp to fetch transactions from
+        """
+        from checkpoint import Checkpoint, checkpoint_key
+        self.__checkpoint_key = checkpoint_key(self.__user.get_accountUid(), self.__user.get_default_category())
+        self.__checkpoint = self.__checkpoints.load(self.__checkpoint_key) or \
+            Checkpoint(self.__builder.time_parser(self.__date, 0))
+        return self.__checkpoint.get_window_start()
+
+    def round_up_incremental(self, feed_items):
+        """ Round up the transactions not yet rounded up since the checkpoint
+
+        Args:
+            feed_items (iterable): feed items fetched from start_incremental's timestamp
+
+        Returns:
+            int: round up of the new transactions
+        """
+        start = self.__checkpoint.get_window_start()
+        amount = self.__checkpoint.round_up(feed_items)
+        self.__period = start + ".." + self.__checkpoint.get_timestamp()
+        return amount
+
+    def resolve_goal(self, savings_goals, cached=False):
+        """ Find the goal to round up into: the default goal if no savingsGoalUid was given (the user's
+        goal stays None if there is none to use, and one must be created), otherwise the given goal
+
+        Args:
+            savings_goals (dict): decoded savings goals response
+            cached (bool): the response came from the metadata cache. Defaults to False.
+
+        Raises:
+            GoalNotFoundException: if the given goal is not in a fresh goal list
+
+        Returns:
+            bool: False if the given goal is not in a cached list, which is dropped to be fetched again
+        """
+        from goals import GoalRegistry, SAVINGS_GOAL_UID
+        goals = GoalRegistry.from_response(savings_goals)
+        if self.__user.get_savingsGoalUid() is None:
+            goal = goals.default_goal(self.__user.get_currency())
+            if goal is not None:
+                self.__user.set_savingsGoalUid(goal[SAVINGS_GOAL_UID])
+            return True
+        try:
+            self.__user.search_savings_goals(goals, self.__user.get_savingsGoalUid())
+        except e.GoalNotFoundException:
+            if not cached:
+                raise
+            self.__cache.invalidate_token(self.__user.get_auth())     # Goal may be newer than the cache
+            return False
+        return True
+
+    def goal_created(self, goal):
+        """ Round up into the goal just created, taking its UID from the decoded PUT response """
+        from goals import SAVINGS_GOAL_UID
+        if self.__cache is not None:
+            self.__cache.invalidate_token(self.__user.get_auth())     # Goal list has changed
+        self.__user.set_savingsGoalUid(goal[SAVINGS_GOAL_UID])
+
+    def start_transfer(self, amount):
+        """ Check the ledger before the transfer
+
+        Args:
+            amount (int): round up
+
+        Raises:
+            DuplicateTransferException: if the ledger holds this period's transfer
+
+        Returns:
+            string: transfer UID, the same every time this period is retried, or None if an incremental
+            round up found nothing new (the checkpoint is saved and nothing is transferred)
+        """
+        from ledger import ledger_key, transfer_uid
+        if self.__checkpoint is not None and amount == 0:
+            self.save_checkpoint()
+            return None
+        self.__key = ledger_key(self.__user.get_accountUid(), self.__user.get_savingsGoalUid(), self.__period)
+        try:
+            check_ledger(self.__ledger, self.__key)
+        except e.DuplicateTransferException:
+            self.save_checkpoint()                  # Transferred before the checkpoint was saved
+            raise
+        self.__uid = transfer_uid(self.__key)
+        return self.__uid
+
+    def finish_transfer(self, transfer_response):
+        """ Record the transfer in the ledger, and only move the checkpoint on once transferred
+
+        Args:
+            transfer_response (Response): response to the transfer sent with start_transfer's UID
+
+        Returns:
+            (int, dict): status code and body of the transfer response
+        """
+        status = transfer_response.status
+        body = json_encoder(transfer_response) if status == 200 else error_body(transfer_response)
+        if self.__ledger is not None:
+            self.__ledger.record(self.__key, self.__uid, status, body)
+        if status == 200:
+            self.save_checkpoint()
+        return status, body
+
+    def save_checkpoint(self):
+        """Save the checkpoint of an incremental round up"""
+        if self.__checkpoint is not None:
+            self.__checkpoints.save(self.__checkpoint_key, self.__checkpoint)
+
+
+def build_round_up_graph(path_builder, call_user, date, cache=None, checkpoints=None, end_date=None, ledger=None, account=None):
+    """ Build the dependency graph of Starling calls for a round up.
+    The transaction feed and the savings goals only depend on the account, so they are sent together,
+    along with the balance when BALANCE_POLICY is not off.
+    Account and savings goal responses are read from the cache when it holds them.
+
+    Args:
+        path_builder (RequestBuilder): builder used to send requests
+        call_user (User): user making the request
+        date (string): start of week to be rounded up
+        cache (TTLCache or SQLiteCache): metadata cache. Defaults to None.
+        checkpoints (MemoryCheckpointStore or SQLiteCheckpointStore): if given, only transactions
+            since the account's checkpoint are rounded up (date is used for the first run). Defaults to None.
+        end_date (string): last day of a longer range to round up instead of a week. Defaults to None.
+        ledger (MemoryLedger or SQLiteLedger): if given, a period already transferred is answered
+            from the ledger instead of transferring again. Defaults to None.
+        account (dict): account from an accounts response already fetched, instead of requesting
+            /accounts and using the primary account. Defaults to None.
+
+    Returns:
+        RequestGraph: graph whose 'transfer' node holds the status and body of the response
+    """
+    from graph import RequestGraph
+    from cache import cache_key, get_or_fetch, ACCOUNTS, SAVINGS
+    auth = call_user.get_auth()
+    steps = RoundUpSteps(path_builder, call_user, date, cache, checkpoints, end_date, ledger)
+
+    def get_account(results):
+        accounts = None
+        if account is None:
+            accounts, _ = get_or_fetch(cache, cache_key(ACCOUNTS, auth),           # Get account info
+                                       lambda: json_encoder(path_builder.send_account_request(auth)))
+        steps.set_account(accounts, account)
+
+    def get_round_up(results):
+        if checkpoints is not None:
+            # Get transactions since the checkpoint and round up the new ones
+            start = steps.start_incremental()
+            transaction_response = path_builder.send_transactions_between_request(
+                auth, call_user.get_accountUid(), call_user.get_default_category(),
+                start, path_builder.timestamp_now(), stream=STREAM_FEED)
+            if STREAM_FEED:
+                return stream_round_up(steps.round_up_incremental, transaction_response)
+            return steps.round_up_incremental(json_encoder(transaction_response)[FEED_ITEMS])
+        if end_date is not None:
+            # Get the range as concurrent windows and merge them
+            responses = path_builder.send_transaction_range_request(auth, call_user.get_accountUid(), call_user.get_default_category(), date, end_date)
+            return call_user.round_up_feeds(json_encoder(response)[FEED_ITEMS] for response in responses)
+        # Get list of transactions for date period and calculate round up
+        transaction_response = path_builder.send_transaction_request(auth, call_user.get_accountUid(), call_user.get_default_category(), date, stream=STREAM_FEED)
+        if STREAM_FEED:
+            return stream_round_up(call_user.round_up_stream, transaction_response)
+        return call_user.round_up_transactions(json_encoder(transaction_response))
+
+    def get_savings_goals():
+        return get_or_fetch(cache, cache_key(SAVINGS, auth, call_user.get_accountUid()),
+                            lambda: json_encoder(path_builder.check_response(     # Error bodies are never cached
+                                path_builder.send_get_savings_request(auth, call_user.get_accountUid()))))
+
+    def get_goal(results):
+        savings_goals, cached = get_savings_goals()
+        if not steps.resolve_goal(savings_goals, cached):
+            savings_goals, _ = get_savings_goals()
+            steps.resolve_goal(savings_goals)
+        if call_user.get_savingsGoalUid() is None:  # No goal to round up into, create one
+            steps.goal_created(json_encoder(path_builder.create_savings_goal(auth, call_user.get_accountUid(), call_user.get_currency())))
+
+    def get_balance(results):
+        balance_response = path_builder.check_response(
+            path_builder.send_account_balance_request(auth, call_user.get_accountUid()))
+        return call_user.parse_balance_data(json_encoder(balance_response))
+
+    def transfer(results):
+        uid = steps.start_transfer(results['round_up'])
+        if uid is None:                             # Nothing new since the checkpoint
+            return 200, NO_NEW_TRANSACTIONS
+        amount = results['round_up']
+        if 'balance' in results:                    # Checked before the PUT, not by a failed transfer
+            amount = apply_balance_policy(BALANCE_POLICY, amount, results['balance'])
+        # Make transfer request of round up, with the same transfer UID every time this period is retried
+        transfer_response = path_builder.send_transfer_round_up_request(auth, call_user.get_accountUid(), call_user.get_savingsGoalUid(), call_user.get_currency(), amount, uid)
+        return steps.finish_transfer(transfer_response)
+
+    graph = RequestGraph(MAX_WORKERS)
+    graph.add('account', get_account)
+    graph.add('round_up', get_round_up, depends_on=['account'])
+    graph.add('goal', get_goal, depends_on=['account'])
+    if BALANCE_POLICY == BALANCE_OFF:
+        graph.add('transfer', transfer, depends_on=['round_up', 'goal'])
+    else:
+        graph.add('balance', get_balance, depends_on=['account'])
+        graph.add('transfer', transfer, depends_on=['round_up', 'goal', 'balance'])
+    return graph
+
+
+def round_up_all_accounts(path_builder, auth, date, cache=None, checkpoints=None, end_date=None, ledger=None):
+    """ Round up every eligible account of a token from a single /accounts request.
+    The accounts are rounded up concurrently, each with its own feed, goal and transfer, and an
+    error in one account does not stop the others
+
+    Args:
+        path_builder (RequestBuilder): builder used to send requests
+        auth (string): authorization_bearer
+        date (string): start of week to be rounded up
+        cache (TTLCache or SQLiteCache): metadata cache. Defaults to None.
+        checkpoints (MemoryCheckpointStore or SQLiteCheckpointStore): incremental checkpoints. Defaults to None.
+        end_date (string): last day of a longer range to round up. Defaults to None.
+        ledger (MemoryLedger or SQLiteLedger): transfer ledger. Defaults to None.
+
+    Returns:
+        (int, dict): 200 if every account succeeded, otherwise 207, and the result of each account
+    """
+    from concurrent.futures import ThreadPoolExecutor
+    from cache import cache_key, get_or_fetch, ACCOUNTS
+    from user import User, eligible_accounts
+    path_builder.time_parser(date, 0)       # Bad dates fail once rather than once per account
+    if end_date is not None:
+        path_builder.split_date_range(date, end_date)
+    accounts, _ = get_or_fetch(cache, cache_key(ACCOUNTS, auth),
+                               lambda: json_encoder(path_builder.send_account_request(auth)))
+    eligible = eligible_accounts(accounts)
+    if not eligible:
+        raise e.InputException("No accounts to round up")
+
+    def run_account(account):
+        amount = None
+        try:
+            results = build_round_up_graph(path_builder, User(auth, None), date, cache, checkpoints,
+                                           end_date, ledger, account).run()
+            status, body = results['transfer']
+            amount = results['round_up']
+        except HANDLED_EXCEPTIONS as exc:
+            status, body = error_response(exc, auth, cache)
+        return {ACCOUNT_UID: account['accountUid'], STATUS_CODE: status, BODY: body, ROUND_UP: amount}
+
+    with ThreadPoolExecutor(max_workers=min(ACCOUNT_WORKERS, len(eligible))) as executor:
+        results = list(executor.map(recorder.bind(run_account), eligible))
+    status = 200 if all(result[STATUS_CODE] == 200 for result in results) else MULTI_STATUS
+    return status, {ACCOUNTS_RESULTS: results}
+
+
+def round_up(event, path_builder, cache=None, checkpoints=None, ledger=None):
+    """ Run the round up for a single event and map exceptions to client errors
+
+    Args:
+        event (dict): event holding the query string parameters
+        path_builder (RequestBuilder): builder used to send requests
+        cache (TTLCache or SQLiteCache): metadata cache. Defaults to None.
+        checkpoints (MemoryCheckpointStore or SQLiteCheckpointStore): store used when the
+            incremental parameter is true. Defaults to None.
+        ledger (MemoryLedger or SQLiteLedger): transfer ledger. Defaults to None.
+
+    Returns:
+        (int, dict): status code and body of the response
+    """
+    try:
+        auth, date, savingsGoalUid = get_inputs(event)
+
+        if get_flag(event, INCREMENTAL) and checkpoints is None:
+            raise e.InputException("Incremental round up is not available")
+        if get_flag(event, ALL_ACCOUNTS):
+            if savingsGoalUid is not None:      # A goal belongs to one account
+                raise e.InputException("savingsGoalUid cannot be used with allAccounts")
+            return round_up_all_accounts(path_builder, auth, date, cache,
+                                         checkpoints if get_flag(event, INCREMENTAL) else None,
+                                         get_option(event, END_DATE), ledger)
+
+        from user import User
+        call_user = User(auth, savingsGoalUid)                                      # Create User
+        graph = build_round_up_graph(path_builder, call_user, date, cache,
+                                     checkpoints if get_flag(event, INCREMENTAL) else None,
+                                     get_option(event, END_DATE), ledger)
+        return graph.run()['transfer']
+
+    except HANDLED_EXCEPTIONS as exc:
+        return error_response(exc, get_option(event, AUTH), cache)
+
+
+def request_id(context):
+    """ Lambda request id of an invocation, or None without a Lambda context """
+    return getattr(context, 'aws_request_id', None)
 
 
 def lambda_handler(event, context):
-    """ AWS Lambda entry point - handles orchestration of API request and round up
+    """ AWS Lambda entry point - handles orchestration of API request and round up.
+    With PROFILE=param an invocation with profile=true is profiled, with PROFILE=all every one
     Parameters
     ----------
     event: dict, required
@@ -60,41 +592,78 @@ def lambda_handler(event, context):
     ------
     API Gateway Lambda Proxy Output Format: dict
     """
-    path_builder = RequestBuilder()
-    response = path_builder.response_builder(200, "")
-    try:   
-        auth, date, savingsGoalUid = get_inputs(event)
+    try:
+        get_inputs(event)
+    except e.InputException as exc:     # Answer bad input before loading the HTTP stack
+        return response_builder(CLI_ERR_STATUS, error_dict(exc.message))
+    with recorder.invocation(), recorder.timer('handler'), \
+            profiling.profile(get_flag(event, profiling.PROFILE_PARAM), request_id(context)):
+        status, body = round_up(event, get_builder(), get_metadata_cache(), get_checkpoint_store(), get_transfer_ledger())
+    return response_builder(status, body)
 
-        call_user = User(auth, savingsGoalUid)                                      # Create User
-        account_response = path_builder.send_account_request(call_user.get_auth())  # Get account info
-        call_user.parse_account(json_encoder(account_response))                     # Parse account information
-
-        # Get list of transactions for date period
-        transaction_response = path_builder.send_transaction_request(auth, call_user.get_accountUid(), call_user.get_default_category(), date)
-        # Calculate round up
-        round_up = call_user.round_up_transactions(json.loads(transaction_response.data.decode('utf-8')))
-        # Get savings goals
-        savings_goals = path_builder.send_get_savings_request(auth, call_user.get_accountUid())
-        num_goals = len(json.loads(savings_goals.data.decode('utf-8'))[SAVINGS_GOALS_LIST])
-        
-        if call_user.get_savingsGoalUid() is None:  # Create or find savingsGoalUid
-            goal_response = path_builder.get_savingsGoalUid(num_goals, call_user.get_auth(), call_user.get_accountUid(), call_user.get_currency())
-            call_user.set_savingsGoalUid(json_encoder(goal_response)[SAVINGS_GOALS_LIST][0]['savingsGoalUid'])
-        else: # Call to verify provided goal exist
-            call_user.search_savings_goals(json_encoder(savings_goals)[SAVINGS_GOALS_LIST], call_user.get_savingsGoalUid())
-
-
-        # Make transfer request of round up and return status code & message from the response
-        transfer_response = path_builder.send_transfer_round_up_request(auth, call_user.get_accountUid(), call_user.get_savingsGoalUid(), call_user.get_currency(), round_up)
-        response = path_builder.response_builder(transfer_response.status, json_encoder(transfer_response))
-   
-    # Handle exceptions and return respnse
-    except e.DateFormatException as exc:
-        response = path_builder.response_builder(CLI_ERR_STATUS, error_dict(exc.message))
-    except e.GoalNotFoundException as exc:
-        response = path_builder.response_builder(CLI_ERR_STATUS, error_dict(exc.message))
-    except e.AccountException as exc:
-        response = path_builder.response_builder(exc.response.status, json_encoder(exc.response))
+
+def get_jobs(event):
+    """ Function to parse a batch event into a list of jobs
+
+    Args:
+        event (dict): direct invocation {"jobs": [...]} or API Gateway event with the same JSON body
+
+    Returns:
+        list: jobs, each a dict of Authorization, date and optional savingsGoalUid
+    """
+    if BODY in event and JOBS not in event:
+        try:
+            event = codec.loads(event[BODY] or "{}")
+        except ValueError:
+            raise e.InputException("Body is not valid JSON")
+    jobs = event.get(JOBS) if isinstance(event, dict) else None
+    if not isinstance(jobs, list):
+        raise e.InputException("No jobs parameter")
+    return jobs
+
+
+def run_job(job, path_builder):
+    """ Run a single batch job, reusing the same validation as lambda_handler
+
+    Args:
+        job (dict): Authorization, date and optional savingsGoalUid
+        path_builder (RequestBuilder): shared builder
+
+    Returns:
+        dict: status code and body of the job
+    """
+    if not isinstance(job, dict):
+        status, body = CLI_ERR_STATUS, error_dict("Job is not an object")
+    else:
+        try:
+            status, body = round_up({QUERY_STRING_PARAMETERS: job}, path_builder, get_metadata_cache(),
+                                    get_checkpoint_store(), get_transfer_ledger())
+        except Exception as exc:    # One broken job must not fail the rest of the batch
+            status, body = SERVER_ERR_STATUS, error_dict(str(exc))
+    return {STATUS_CODE: status, BODY: body}
+
+
+def batch_handler(event, context):
+    """ AWS Lambda entry point for the scheduler - runs the round up for many jobs in one invocation
+    Parameters
+    ----------
+    event: dict, required
+        {"jobs": [{"Authorization": ..., "date": ..., "savingsGoalUid": ...}, ...]}
+        either directly or as the JSON body of an API Gateway event
+
+    context: object, required
+        Lambda Context runtime methods and attributes
+    Returns
+    ------
+    API Gateway Lambda Proxy Output Format: dict with a body of {"results": [...]} in job order
+    """
+    try:
+        jobs = get_jobs(event)
     except e.InputException as exc:
-        response = path_builder.response_builder(CLI_ERR_STATUS, error_dict(exc.message))
-    return response
+        return response_builder(CLI_ERR_STATUS, error_dict(exc.message))
+
+    from concurrent.futures import ThreadPoolExecutor
+    path_builder = get_builder()
+    with recorder.invocation(), ThreadPoolExecutor(max_workers=BATCH_WORKERS) as executor:
+        results = list(executor.map(recorder.bind(lambda job: run_job(job, path_builder)), jobs))
+    return response_builder(200, {RESULTS: results})
@@ -0,0 +1,270 @@
+# asyncio variant of app. Inputs, stores, error mapping and responses are shared with app,
+# only the Starling calls are coroutines on an AsyncRequestBuilder, so a single thread can
+# keep many round ups in flight.
+from metrics import recorder
+from app import (get_inputs, get_option, get_flag, get_jobs, json_encoder, response_builder, error_dict,
+                 error_response, get_metadata_cache, get_checkpoint_store, get_transfer_ledger, RoundUpSteps, NO_NEW_TRANSACTIONS,
+                 HANDLED_EXCEPTIONS, QUERY_STRING_PARAMETERS, AUTH, INCREMENTAL, ALL_ACCOUNTS, END_DATE, FEED_ITEMS,
+                 CLI_ERR_STATUS, SERVER_ERR_STATUS, BODY, RESULTS, STATUS_CODE, ACCOUNTS_RESULTS, ACCOUNT_UID,
+                 ROUND_UP, MULTI_STATUS, BALANCE_POLICY, BALANCE_OFF, apply_balance_policy, request_id)
+import exceptions as e
+import profiling
+import asyncio
+import os
+
+ASYNC_BATCH_WORKERS = int(os.environ.get('ASYNC_BATCH_MAX_WORKERS', '100'))   # Jobs in flight at once in batch_handler
+
+event_loop = None       # Kept across warm invocations, the builder's connections belong to it
+async_builder = None
+
+def get_event_loop():
+    """ Return the event loop of this module, creating it on first use """
+    global event_loop
+    if event_loop is None or event_loop.is_closed():
+        event_loop = asyncio.new_event_loop()
+    return event_loop
+
+def get_async_builder():
+    """ Return the shared AsyncRequestBuilder, importing the HTTP stack on first use """
+    global async_builder
+    if async_builder is None:
+        from async_path import AsyncRequestBuilder
+        async_builder = AsyncRequestBuilder()
+    return async_builder
+
+
+async def gather_or_cancel(*coroutines):
+    """ Run coroutines together, cancelling the rest as soon as one raises """
+    tasks = [asyncio.ensure_future(coroutine) for coroutine in coroutines]
+    try:
+        return await asyncio.gather(*tasks)
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        raise
+
+
+async def run_round_up(path_builder, call_user, date, cache=None, checkpoints=None, end_date=None, ledger=None,
+                       account=None):
+    """ Run the Starling calls of a round up, the coroutine version of app.build_round_up_graph with
+    the same app.RoundUpSteps in between. The transaction feed and the savings goals only depend on
+    the account, so they are awaited together, along with the balance when BALANCE_POLICY is not off.
+
+    Args:
+        path_builder (AsyncRequestBuilder): builder used to send requests
+        call_user (User): user making the request
+        date (string): start of week to be rounded up
+        cache (TTLCache or SQLiteCache): metadata cache. Defaults to None.
+        checkpoints (MemoryCheckpointStore or SQLiteCheckpointStore): if given, only transactions
+            since the account's checkpoint are rounded up. Defaults to None.
+        end_date (string): last day of a longer range to round up instead of a week. Defaults to None.
+        ledger (MemoryLedger or SQLiteLedger): transfer ledger. Defaults to None.
+        account (dict): account already fetched, instead of requesting /accounts. Defaults to None.
+
+    Returns:
+        (int, dict, int): status code and body of the transfer response, and the round up
+    """
+    from cache import cache_key, get_or_fetch_async, ACCOUNTS, SAVINGS
+    auth = call_user.get_auth()
+    steps = RoundUpSteps(path_builder, call_user, date, cache, checkpoints, end_date, ledger)
+
+    async def fetch_accounts():
+        return json_encoder(await path_builder.send_account_request(auth))
+
+    async def fetch_savings_goals():
+        return json_encoder(path_builder.check_response(         # Error bodies are never cached
+            await path_builder.send_get_savings_request(auth, call_user.get_accountUid())))
+
+    def get_savings_goals():
+        return get_or_fetch_async(cache, cache_key(SAVINGS, auth, call_user.get_accountUid()), fetch_savings_goals)
+
+    async def get_round_up():
+        if checkpoints is not None:
+            # Get transactions since the checkpoint and round up the new ones
+            start = steps.start_incremental()
+            transaction_response = await path_builder.send_transactions_between_request(
+                auth, call_user.get_accountUid(), call_user.get_default_category(), start, path_builder.timestamp_now())
+            return steps.round_up_incremental(json_encoder(transaction_response)[FEED_ITEMS])
+        if end_date is not None:
+            responses = await path_builder.send_transaction_range_request(auth, call_user.get_accountUid(), call_user.get_default_category(), date, end_date)
+            return call_user.round_up_feeds(json_encoder(response)[FEED_ITEMS] for response in responses)
+        transaction_response = await path_builder.send_transaction_request(auth, call_user.get_accountUid(), call_user.get_default_category(), date)
+        return call_user.round_up_transactions(json_encoder(transaction_response))
+
+    async def get_goal():
+        savings_goals, cached = await get_savings_goals()
+        if not steps.resolve_goal(savings_goals, cached):
+            savings_goals, _ = await get_savings_goals()
+            steps.resolve_goal(savings_goals)
+        if call_user.get_savingsGoalUid() is None:  # No goal to round up into, create one
+            steps.goal_created(json_encoder(await path_builder.create_savings_goal(auth, call_user.get_accountUid(), call_user.get_currency())))
+
+    async def get_balance():
+        balance_response = path_builder.check_response(
+            await path_builder.send_account_balance_request(auth, call_user.get_accountUid()))
+        return call_user.parse_balance_data(json_encoder(balance_response))
+
+    accounts = None
+    if account is None:
+        accounts, _ = await get_or_fetch_async(cache, cache_key(ACCOUNTS, auth), fetch_accounts)
+    steps.set_account(accounts, account)
+    if BALANCE_POLICY == BALANCE_OFF:
+        amount, _ = await gather_or_cancel(get_round_up(), get_goal())
+        balance = None
+    else:
+        amount, _, balance = await gather_or_cancel(get_round_up(), get_goal(), get_balance())
+    uid = steps.start_transfer(amount)
+    if uid is None:                             # Nothing new since the checkpoint
+        return 200, NO_NEW_TRANSACTIONS, amount
+    transfer_amount = amount
+    if balance is not None:                     # Checked before the PUT, not by a failed transfer
+        transfer_amount = apply_balance_policy(BALANCE_POLICY, amount, balance)
+    transfer_response = await path_builder.send_transfer_round_up_request(auth, call_user.get_accountUid(), call_user.get_savingsGoalUid(), call_user.get_currency(), transfer_amount, uid)
+    status, body = steps.finish_transfer(transfer_response)
+    return status, body, amount
+
+
+async def round_up_all_accounts(path_builder, auth, date, cache=None, checkpoints=None, end_date=None, ledger=None):
+    """ Round up every eligible account of a token concurrently, the coroutine version of
+    app.round_up_all_accounts
+
+    Returns:
+        (int, dict): 200 if every account succeeded, otherwise 207, and the result of each account
+    """
+    from cache import cache_key, get_or_fetch_async, ACCOUNTS
+    from user import User, eligible_accounts
+    path_builder.time_parser(date, 0)       # Bad dates fail once rather than once per account
+    if end_date is not None:
+        path_builder.split_date_range(date, end_date)
+
+    async def fetch_accounts():
+        return json_encoder(await path_builder.send_account_request(auth))
+
+    accounts, _ = await get_or_fetch_async(cache, cache_key(ACCOUNTS, auth), fetch_accounts)
+    eligible = eligible_accounts(accounts)
+    if not eligible:
+        raise e.InputException("No accounts to round up")
+
+    async def run_account(account):
+        amount = None
+        try:
+            status, body, amount = await run_round_up(path_builder, User(auth, None), date, cache, checkpoints,
+                                                      end_date, ledger, account)
+        except HANDLED_EXCEPTIONS as exc:
+            status, body = error_response(exc, auth, cache)
+        return {ACCOUNT_UID: account['accountUid'], STATUS_CODE: status, BODY: body, ROUND_UP: amount}
+
+    results = list(await asyncio.gather(*[run_account(account) for account in eligible]))
+    status = 200 if all(result[STATUS_CODE] == 200 for result in results) else MULTI_STATUS
+    return status, {ACCOUNTS_RESULTS: results}
+
+
+async def round_up(event, path_builder, cache=None, checkpoints=None, ledger=None):
+    """ Run the round up for a single event and map exceptions to client errors, like app.round_up
+
+    Args:
+        event (dict): event holding the query string parameters
+        path_builder (AsyncRequestBuilder): builder used to send requests
+        cache (TTLCache or SQLiteCache): metadata cache. Defaults to None.
+        checkpoints (MemoryCheckpointStore or SQLiteCheckpointStore): store used when the
+            incremental parameter is true. Defaults to None.
+        ledger (MemoryLedger or SQLiteLedger): transfer ledger. Defaults to None.
+
+    Returns:
+        (int, dict): status code and body of the response
+    """
+    try:
+        auth, date, savingsGoalUid = get_inputs(event)
+
+        if get_flag(event, INCREMENTAL) and checkpoints is None:
+            raise e.InputException("Incremental round up is not available")
+        if get_flag(event, ALL_ACCOUNTS):
+            if savingsGoalUid is not None:      # A goal belongs to one account
+                raise e.InputException("savingsGoalUid cannot be used with allAccounts")
+            return await round_up_all_accounts(path_builder, auth, date, cache,
+                                               checkpoints if get_flag(event, INCREMENTAL) else None,
+                                               get_option(event, END_DATE), ledger)
+
+        from user import User
+        call_user = User(auth, savingsGoalUid)
+        status, body, _ = await run_round_up(path_builder, call_user, date, cache,
+                                             checkpoints if get_flag(event, INCREMENTAL) else None,
+                                             get_option(event, END_DATE), ledger)
+        return status, body
+    except HANDLED_EXCEPTIONS as exc:
+        return error_response(exc, get_option(event, AUTH), cache)
+
+
+def lambda_handler(event, context):
+    """ AWS Lambda entry point - app.lambda_handler with the Starling calls made on asyncio
+    Parameters
+    ----------
+    event: dict, required
+        API Gateway Lambda Proxy Input Format
+
+    context: object, required
+        Lambda Context runtime methods and attributes
+    Returns
+    ------
+    API Gateway Lambda Proxy Output Format: dict
+    """
+    try:
+        get_inputs(event)
+    except e.InputException as exc:     # Answer bad input before loading the HTTP stack
+        return response_builder(CLI_ERR_STATUS, error_dict(exc.message))
+    with recorder.invocation(), recorder.timer('handler'), \
+            profiling.profile(get_flag(event, profiling.PROFILE_PARAM), request_id(context)):
+        status, body = get_event_loop().run_until_complete(
+            round_up(event, get_async_builder(), get_metadata_cache(), get_checkpoint_store(), get_transfer_ledger()))
+    return response_builder(status, body)
+
+
+async def run_jobs(jobs, path_builder, max_workers=ASYNC_BATCH_WORKERS):
+    """ Run batch jobs with at most max_workers in flight, like app.run_job for each
+
+    Args:
+        jobs (list): jobs from get_jobs
+        path_builder (AsyncRequestBuilder): shared builder
+        max_workers (int): jobs in flight at once
+
+    Returns:
+        list: status code and body of each job, in job order
+    """
+    slots = asyncio.Semaphore(max_workers)
+    cache, checkpoints, ledger = get_metadata_cache(), get_checkpoint_store(), get_transfer_ledger()
+
+    async def run_job(job):
+        if not isinstance(job, dict):
+            status, body = CLI_ERR_STATUS, error_dict("Job is not an object")
+        else:
+            try:
+                async with slots:
+                    status, body = await round_up({QUERY_STRING_PARAMETERS: job}, path_builder, cache, checkpoints, ledger)
+            except Exception as exc:    # One broken job must not fail the rest of the batch
+                status, body = SERVER_ERR_STATUS, error_dict(str(exc))
+        return {STATUS_CODE: status, BODY: body}
+
+    return list(await asyncio.gather(*[run_job(job) for job in jobs]))
+
+
+def batch_handler(event, context):
+    """ AWS Lambda entry point for the scheduler - app.batch_handler with every job on one event loop
+    Parameters
+    ----------
+    event: dict, required
+        {"jobs": [{"Authorization": ..., "date": ..., "savingsGoalUid": ...}, ...]}
+        either directly or as the JSON body of an API Gateway event
+
+    context: object, required
+        Lambda Context runtime methods and attributes
+    Returns
+    ------
+    API Gateway Lambda Proxy Output Format: dict with a body of {"results": [...]} in job order
+    """
+    try:
+        jobs = get_jobs(event)
+    except e.InputException as exc:
+        return response_builder(CLI_ERR_STATUS, error_dict(exc.message))
+    with recorder.invocation():     # Tasks copy the context, so every job records into this invocation
+        results = get_event_loop().run_until_complete(run_jobs(jobs, get_async_builder()))
+    return response_builder(200, {RESULTS: results})
@@ -0,0 +1,246 @@
+import asyncio
+import time
+import zlib
+from urllib.parse import urlsplit
+
+DEFAULT_PORTS = {'http': 80, 'https': 443}
+NO_BODY_STATUSES = (204, 304)
+MAX_LINE = 65536                # Longest status or header line accepted
+
+
+class HTTPError(Exception):
+    """Exception raised when a request fails before a complete response is read.
+
+    Attributes:
+        message -- explanation of the error
+    """
+
+    def __init__(self, message):
+        self.message = message
+        super().__init__(self.message)
+
+
+class Headers(dict):
+    """Response headers, looked up without regard to case like urllib3's HTTPHeaderDict"""
+
+    def __init__(self, pairs=()):
+        super().__init__((name.lower(), value) for name, value in pairs)
+
+    def __getitem__(self, name):
+        return super().__getitem__(name.lower())
+
+    def __contains__(self, name):
+        return super().__contains__(name.lower())
+
+    def get(self, name, default=None):
+        return super().get(name.lower(), default)
+
+
+class AsyncResponse:
+    """
+    This class holds a complete response, with the status, headers and data attributes
+    of a preloaded urllib3 response so the same code can read either.
+    """
+    def __init__(self, status, headers, data):
+        self.status = status
+        self.headers = headers
+        self.data = data
+
+
+class Connection:
+    """An open keep-alive connection and when it was last returned to the pool"""
+
+    def __init__(self, reader, writer):
+        self.reader = reader
+        self.writer = writer
+        self.last_used = time.monotonic()
+
+    def is_dropped(self, idle_timeout):
+        """ Return True if the server has closed the connection or it has been idle too long """
+        return self.reader.at_eof() or self.writer.is_closing() or time.monotonic() - self.last_used > idle_timeout
+
+    def close(self):
+        self.writer.close()
+
+
+class AsyncConnectionPool:
+    """
+    This class sends HTTP/1.1 requests with asyncio, keeping connections alive per host.
+
+    At most maxsize requests per host are in flight, the rest wait for a connection.
+    Connections belong to the event loop they were opened on, so a pool must only be
+    used from one loop. Bodies sent with Content-Encoding gzip or br are decompressed.
+
+    Example:
+    pool = AsyncConnectionPool(maxsize=10)
+    response = await pool.request('GET', url, headers={'Accept': 'application/json'})
+    await pool.close()
+    """
+    def __init__(self, maxsize=10, connect_timeout=3.0, read_timeout=10.0, idle_timeout=60.0):
+        self.__maxsize = maxsize
+        self.__connect_timeout = connect_timeout
+        self.__read_timeout = read_timeout
+        self.__idle_timeout = idle_timeout
+        self.__idle = {}            # (scheme, host, port) to list of idle Connection
+        self.__slots = {}           # (scheme, host, port) to Semaphore of maxsize
+        self.__ssl_context = None
+
+    async def request(self, method, url, headers=None, body=None):
+        """ Send a request and read the whole response
+
+        Args:
+            method (string): HTTP method
+            url (string): full http or https url
+            headers (dict): request headers. Defaults to None.
+            body (string or bytes): request body. Defaults to None.
+
+        Raises:
+            HTTPError: if connecting, sending or reading the response fails or times out
+
+        Returns:
+            AsyncResponse: the response
+        """
+        parts = urlsplit(url)
+        if parts.scheme not in DEFAULT_PORTS:
+            raise HTTPError("Unsupported url " + url)
+        key = (parts.scheme, parts.hostname, parts.port or DEFAULT_PORTS[parts.scheme])
+        target = (parts.path or '/') + ('?' + parts.query if parts.query else '')
+        if isinstance(body, str):
+            body = body.encode('utf-8')
+        if key not in self.__slots:
+            self.__slots[key] = asyncio.Semaphore(self.__maxsize)
+        async with self.__slots[key]:
+            connection = await self.acquire(key)
+            keep_alive = False
+            try:
+                response, keep_alive = await asyncio.wait_for(
+                    self.exchange(connection, method, parts.netloc, target, headers or {}, body),
+                    self.__read_timeout)
+            except (OSError, ValueError, asyncio.TimeoutError, asyncio.IncompleteReadError) as exc:
+                raise HTTPError("%s %s failed: %r" % (method, url, exc)) from exc
+            finally:
+                if keep_alive:
+                    connection.last_used = time.monotonic()
+                    self.__idle.setdefault(key, []).append(connection)
+                else:       # Failed or cancelled part way, the connection may hold half a response
+                    connection.close()
+            return response
+
+    async def acquire(self, key):
+        """ Return an idle connection to a host, or open a new one """
+        idle = self.__idle.get(key, [])
+        while idle:
+            connection = idle.pop()
+            if not connection.is_dropped(self.__idle_timeout):
+                return connection
+            connection.close()
+        scheme, host, port = key
+        ssl_context = None
+        if scheme == 'https':
+            if self.__ssl_context is None:
+                import ssl
+                self.__ssl_context = ssl.create_default_context()
+            ssl_context = self.__ssl_context
+        try:
+            reader, writer = await asyncio.wait_for(
+                asyncio.open_connection(host, port, ssl=ssl_context, limit=MAX_LINE), self.__connect_timeout)
+        except (OSError, asyncio.TimeoutError) as exc:
+            raise HTTPError("Cannot connect to %s:%d: %r" % (host, port, exc)) from exc
+        return Connection(reader, writer)
+
+    async def exchange(self, connection, method, host, target, headers, body):
+        """ Write one request on a connection and read its response
+
+        Returns:
+            (AsyncResponse, bool): the response and whether the connection can be reused
+        """
+        lines = [method + " " + target + " HTTP/1.1", "Host: " + host]
+        lines.extend(name + ": " + str(value) for name, value in headers.items())
+        if body is not None:
+            lines.append("Content-Length: " + str(len(body)))
+        connection.writer.write(("\r\n".join(lines) + "\r\n\r\n").encode('latin-1') + (body or b''))
+        await connection.writer.drain()
+
+        reader = connection.reader
+        version, status = self.parse_status_line(await reader.readline())
+        pairs = []
+        while True:
+            line = await reader.readline()
+            if line in (b'\r\n', b'\n'):
+                break
+            if not line:
+                raise ValueError("Connection closed in headers")
+            name, _, value = line.decode('latin-1').partition(':')
+            pairs.append((name.strip(), value.strip()))
+        response_headers = Headers(pairs)
+
+        keep_alive = version == 'HTTP/1.1' and response_headers.get('Connection', '').lower() != 'close'
+        if method == 'HEAD' or status in NO_BODY_STATUSES or 100 <= status < 200:
+            data = b''
+        elif 'chunked' in response_headers.get('Transfer-Encoding', '').lower():
+            data = await self.read_chunked(reader)
+        elif response_headers.get('Content-Length') is not None:
+            data = await reader.readexactly(int(response_headers['Content-Length']))
+        else:                                       # Body ends when the server closes
+            data = await reader.read()
+            keep_alive = False
+        return AsyncResponse(status, response_headers, self.decode_body(response_headers, data)), keep_alive
+
+    def decode_body(self, headers, data):
+        """ Decompress a body sent with Content-Encoding gzip or br. Content-Length stays the compressed size
+
+        Raises:
+            ValueError: if the encoding is not supported or the body does not decompress
+        """
+        encoding = headers.get('Content-Encoding', '').strip().lower()
+        if encoding in ('', 'identity'):
+            return data
+        if encoding == 'gzip':
+            try:
+                return zlib.decompress(data, 16 + zlib.MAX_WBITS)
+            except zlib.error as exc:
+                raise ValueError("Bad gzip body: " + str(exc))
+        if encoding == 'br':
+            try:
+                import brotli
+            except ImportError:     # Only asked for when installed, see path.accept_encoding
+                import brotlicffi as brotli
+            return brotli.decompress(data)
+        raise ValueError("Unsupported Content-Encoding " + encoding)
+
+    def parse_status_line(self, line):
+        """ Return the HTTP version and status code of a status line """
+        parts = line.decode('latin-1').split(None, 2)
+        if len(parts) < 2 or not parts[0].startswith('HTTP/'):
+            raise ValueError("Bad status line %r" % line)
+        return parts[0], int(parts[1])
+
+    async def read_chunked(self, reader):
+        """ Read a chunked body, ignoring any trailers """
+        chunks = []
+        while True:
+            size = int((await reader.readline()).split(b';', 1)[0].strip(), 16)
+            if size == 0:
+                break
+            chunks.append(await reader.readexactly(size))
+            await reader.readexactly(2)             # CRLF after each chunk
+        while (await reader.readline()) not in (b'\r\n', b'\n', b''):
+            pass
+        return b''.join(chunks)
+
+    def clear(self):
+        """ Close every idle connection """
+        for connections in self.__idle.values():
+            for connection in connections:
+                connection.close()
+        self.__idle = {}
+
+    async def close(self):
+        """ Close every idle connection and wait for them to shut """
+        connections = [connection for idle in self.__idle.values() for connection in idle]
+        self.clear()
+        for connection in connections:
+            try:
+                await connection.writer.wait_closed()
+            except OSError:
+                pass
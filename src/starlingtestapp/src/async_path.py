@@ -0,0 +1,243 @@
+from exceptions import ServiceUnavailableException
+from metrics import recorder
+from resilience import CircuitBreaker, build_limiter
+from async_http import AsyncConnectionPool, HTTPError
+from path import (RequestPaths, default_policies, POOL_IDLE_TIMEOUT, API_BASE, CONNECT_TIMEOUT,
+                  READ_TIMEOUT, WINDOW_DAYS, RANGE_WORKERS, ACCOUNTS, BALANCE, TRANSACTIONS, SAVINGS_GOALS,
+                  CREATE_GOAL, TRANSFER, FEED_COMPRESSION)
+import asyncio
+import os
+import time
+import uuid
+
+ASYNC_POOL_MAXSIZE = int(os.environ.get('ASYNC_POOL_MAXSIZE', '100'))    # Requests in flight per host
+
+
+class AsyncRequestBuilder(RequestPaths):
+    """
+    This class sends the same requests as RequestBuilder, as coroutines on an asyncio connection pool.
+
+    URLs, bodies and the AccountException mapping come from RequestPaths, and each endpoint
+    has the same retry policy and circuit breaker, so only the transport differs. One
+    builder can keep many users' round ups in flight on a single thread. It must only be
+    used from the event loop it was first used on, see async_app.get_async_builder.
+
+    Example:
+    my_builder = AsyncRequestBuilder()
+    response = await my_builder.send_account_request(authorization_bearer)
+    response = await my_builder.send_transaction_request(authorization_bearer, \
+                                                         accountUid, categoryUid, start of date range)
+    await my_builder.close()
+    """
+    def __init__(self, maxsize=ASYNC_POOL_MAXSIZE, idle_timeout=POOL_IDLE_TIMEOUT, base_url=API_BASE, policies=None,
+                 limiter=None, compression=FEED_COMPRESSION):
+        super().__init__(base_url, compression)
+        self.http = AsyncConnectionPool(maxsize, CONNECT_TIMEOUT, READ_TIMEOUT, idle_timeout)
+        self.__policies = default_policies(policies)
+        self.__breakers = {endpoint: CircuitBreaker() for endpoint in self.__policies}
+        self.__limiter = limiter if limiter is not None else build_limiter()
+
+    async def send_request(self, endpoint, method, url, headers, body=None):
+        """ Send a request with the retry policy and circuit breaker of its endpoint
+
+        Args:
+            endpoint (string): endpoint name e.g. TRANSFER
+            method (string): HTTP method
+            url (string): full url
+            headers (dict): headers from build_header
+            body (string): request body. Defaults to None.
+
+        Raises:
+            ServiceUnavailableException: if the circuit is open or every attempt failed to connect
+
+        Returns:
+            AsyncResponse: last response received
+        """
+        policy = self.__policies[endpoint]
+        breaker = self.__breakers[endpoint]
+        start = time.perf_counter()
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                self.record_request(endpoint, start, attempt)
+                raise ServiceUnavailableException(endpoint)
+            try:
+                if self.__limiter is not None:      # Paced by the rate limiter, transfers first
+                    waited = await self.__limiter.acquire_async(headers.get('Authorization'), endpoint == TRANSFER)
+                    if waited:
+                        recorder.record('rate_limit_wait', waited)
+                response = await self.http.request(method, url, headers = headers, body = body)
+            except HTTPError as exc:
+                breaker.record_failure()
+                if not policy.should_retry(attempt, error=exc):
+                    self.record_request(endpoint, start, attempt)
+                    raise ServiceUnavailableException(endpoint) from exc
+                await asyncio.sleep(policy.backoff(attempt))
+                attempt += 1
+                continue
+            except BaseException:       # Cancelled, e.g. by gather_or_cancel, before an answer came
+                breaker.release()
+                raise
+            if self.__limiter is not None:
+                self.__limiter.update(headers.get('Authorization'), response)
+            if response.status >= 500:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            if not policy.should_retry(attempt, response=response):
+                self.record_request(endpoint, start, attempt, response)
+                return response
+            await asyncio.sleep(policy.backoff(attempt, response))
+            attempt += 1
+
+    async def send_account_request(self, auth):
+        """ Send a request to account path to get a list of user accounts
+
+        Args:
+            auth (string): authorization_bearer
+
+        Returns:
+            AsyncResponse: response from https request
+        """
+        response = await self.send_request(ACCOUNTS, 'GET', self.build_account_url(), headers = self.build_header(auth))
+        return self.check_response(response)        # Catch Authentication error
+
+    async def send_account_balance_request(self, auth, accountUid):
+        """ Send a request to account path to get balance
+
+        Args:
+            auth (string): authorization_bearer
+            accountUid (string): UUID token for account
+
+        Returns:
+            AsyncResponse: response from https request
+        """
+        return await self.send_request(BALANCE, 'GET', self.build_balance_url(accountUid), headers = self.build_header(auth))
+
+    async def send_transaction_request(self, auth, accountUid, categoryUid, changes_since):
+        """ This function requests a list of transactions in the week from changes_since
+
+        Args:
+            auth (string): authorization_bearer
+            accountUid (string): UUID string identifying an account
+            categoryUid (string): UUID string identfying a category
+            changes_since (string): start of week to be rounded up
+
+        Returns:
+            AsyncResponse: response from https request
+        """
+        return await self.send_transactions_between_request(auth, accountUid, categoryUid,
+                                                            self.time_parser(changes_since, 0),
+                                                            self.time_parser(changes_since, 7))
+
+    async def send_transactions_between_request(self, auth, accountUid, categoryUid, min_timestamp, max_timestamp):
+        """ This function requests a list of transactions between two timestamps
+
+        Args:
+            auth (string): authorization_bearer
+            accountUid (string): UUID string identifying an account
+            categoryUid (string): UUID string identfying a category
+            min_timestamp (string): ISO timestamp of the start of the window
+            max_timestamp (string): ISO timestamp of the end of the window
+
+        Returns:
+            AsyncResponse: response from https request
+        """
+        url = self.build_transactions_url(accountUid, categoryUid, min_timestamp, max_timestamp)
+        response = await self.send_request(TRANSACTIONS, 'GET', url, headers = self.build_feed_header(auth))
+        return self.check_response(response)
+
+    async def send_transaction_range_request(self, auth, accountUid, categoryUid, start_date, end_date,
+                                             window_days=WINDOW_DAYS, max_workers=RANGE_WORKERS):
+        """ Request the transactions of a long date range as several windows fetched concurrently.
+        Windows share their boundaries, so callers should de-duplicate by feedItemUid
+
+        Args:
+            auth (string): authorization_bearer
+            accountUid (string): UUID string identifying an account
+            categoryUid (string): UUID string identfying a category
+            start_date (string): first day, YYYY-MM-DD
+            end_date (string): last day, YYYY-MM-DD
+            window_days (int): days per request
+            max_workers (int): requests in flight at once
+
+        Returns:
+            list: response of each window, in date order
+        """
+        windows = self.split_date_range(start_date, end_date, window_days)
+        slots = asyncio.Semaphore(max_workers)
+
+        async def fetch(window):
+            async with slots:
+                return await self.send_transactions_between_request(auth, accountUid, categoryUid, window[0], window[1])
+
+        return list(await asyncio.gather(*[fetch(window) for window in windows]))
+
+    async def send_transfer_round_up_request(self, auth, accountUid, savingsGoalUid, currency, amount, transfer_uid=None):
+        """This functions sends the round up to a savings goal.
+        The transfer UID is kept for every retry, so Starling applies the transfer at most once
+
+        Args:
+            auth (string): authorization_bearer
+            accountUid (string): UUID string identifying an account
+            savingsGoalUid (string): UUID string identifying a savings goal
+            currency (string): currency identifier e.g. GBP
+            amount (int): amount to be transferred in minor units
+            transfer_uid (string): UUID of the transfer. Defaults to a new random UUID.
+
+        Returns:
+            AsyncResponse: response from https request
+        """
+        if transfer_uid is None:
+            transfer_uid = str(uuid.uuid4())
+        url = self.build_transfer_url(accountUid, savingsGoalUid, transfer_uid)
+        return await self.send_request(TRANSFER, 'PUT', url, headers = self.build_header(auth, 'application/json'),
+                                       body = self.build_transfer_body(currency, amount))
+
+    async def send_get_savings_request(self, auth, accountUid):
+        """ This function returns a list of savings goals
+
+        Args:
+            auth (string): authorization_bearer
+            accountUid (string): UUID string identifying an account
+
+        Returns:
+            AsyncResponse: response from https request
+        """
+        return await self.send_request(SAVINGS_GOALS, 'GET', self.build_savings_url(accountUid),
+                                       headers = self.build_header(auth))
+
+    async def send_put_savings_request(self, auth, accountUid, currency):
+        """ This function builds and sends a default savings goal
+
+        Args:
+            auth (string): authorization_bearer
+            accountUid (string): UUID string identifying an account
+            currency (string): currency identifier
+
+        Returns:
+            AsyncResponse: response from https request
+        """
+        return await self.send_request(CREATE_GOAL, 'PUT', self.build_savings_url(accountUid),
+                                       headers = self.build_header(auth, 'application/json'),
+                                       body = self.build_savings_body(currency))
+
+    async def create_savings_goal(self, auth, accountUid, currency):
+        """ Create the default savings goal, see RequestBuilder.create_savings_goal
+
+        Args:
+            auth (string): auth token
+            accountUid (string): account UUID
+            currency (string): currency identifier
+
+        Raises:
+            AccountException: if Starling refused to create the goal
+
+        Returns:
+            AsyncResponse: response holding the savingsGoalUid
+        """
+        return self.check_response(await self.send_put_savings_request(auth, accountUid, currency))
+
+    async def close(self):
+        """ Close the pooled connections """
+        await self.http.close()
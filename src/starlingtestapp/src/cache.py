@@ -0,0 +1,194 @@
+from collections import OrderedDict
+import hashlib
+import codec
+import singleflight
+import os
+import sqlite3
+import threading
+import time
+
+CACHE_BACKEND = os.environ.get('METADATA_CACHE', 'memory')        # memory, sqlite or off
+CACHE_PATH = os.environ.get('METADATA_CACHE_PATH', '/tmp/starling-metadata.sqlite')
+CACHE_TTL = float(os.environ.get('METADATA_CACHE_TTL', '3600'))   # Seconds an entry stays valid
+CACHE_SIZE = int(os.environ.get('METADATA_CACHE_SIZE', '1024'))    # Entries kept by the memory backend
+
+ACCOUNTS = 'accounts'
+SAVINGS = 'savings'
+
+
+def token_hash(auth):
+    """Hash of a token, so raw tokens are never stored in the cache"""
+    return hashlib.sha256(auth.encode('utf-8')).hexdigest()
+
+
+def cache_key(kind, auth, *parts):
+    """ Build a cache key for a token
+
+    Args:
+        kind (string): what is cached e.g. accounts or savings
+        auth (string): authorization_bearer the data belongs to
+        parts (string): any further identifiers e.g. accountUid
+
+    Returns:
+        string: key starting with the token hash
+    """
+    return ":".join((token_hash(auth), kind) + parts)
+
+
+class TTLCache:
+    """
+    This class is an in-process LRU cache whose entries expire after a time to live.
+
+    It is thread safe and lives at module level, so entries survive warm invocations.
+    """
+    def __init__(self, maxsize=CACHE_SIZE, ttl=CACHE_TTL):
+        self.__maxsize = maxsize
+        self.__ttl = ttl
+        self.__entries = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def get(self, key):
+        """ Return the value for a key, or None if missing or expired """
+        with self.__lock:
+            entry = self.__entries.get(key)
+            if entry is None:
+                return None
+            expires, value = entry
+            if expires < time.monotonic():
+                del self.__entries[key]
+                return None
+            self.__entries.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        """ Store a value, evicting the least recently used entry when full """
+        with self.__lock:
+            self.__entries[key] = (time.monotonic() + self.__ttl, value)
+            self.__entries.move_to_end(key)
+            while len(self.__entries) > self.__maxsize:
+                self.__entries.popitem(last=False)
+
+    def invalidate_token(self, auth):
+        """ Remove every entry belonging to a token """
+        prefix = token_hash(auth) + ":"
+        with self.__lock:
+            for key in [key for key in self.__entries if key.startswith(prefix)]:
+                del self.__entries[key]
+
+    def clear(self):
+        with self.__lock:
+            self.__entries.clear()
+
+
+class SQLiteCache:
+    """
+    This class is an on-disk cache backed by SQLite, with the same interface as TTLCache.
+
+    Values are stored as JSON so they must be JSON serialisable. A local file can stand
+    in for a shared volume when testing.
+    """
+    def __init__(self, path=CACHE_PATH, ttl=CACHE_TTL):
+        self.__ttl = ttl
+        self.__lock = threading.Lock()
+        self.__connection = sqlite3.connect(path, check_same_thread=False)
+        with self.__connection:
+            self.__connection.execute(
+                "CREATE TABLE IF NOT EXISTS cache (key TEXT PRIMARY KEY, value TEXT, expires REAL)")
+
+    def get(self, key):
+        """ Return the value for a key, or None if missing or expired """
+        with self.__lock:
+            row = self.__connection.execute(
+                "SELECT value, expires FROM cache WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                return None
+            if row[1] < time.time():
+                with self.__connection:
+                    self.__connection.execute("DELETE FROM cache WHERE key = ?", (key,))
+                return None
+            return codec.loads(row[0])
+
+    def set(self, key, value):
+        """ Store a value """
+        with self.__lock, self.__connection:
+            self.__connection.execute("INSERT OR REPLACE INTO cache VALUES (?, ?, ?)",
+                                      (key, codec.dumps(value), time.time() + self.__ttl))
+
+    def invalidate_token(self, auth):
+        """ Remove every entry belonging to a token """
+        with self.__lock, self.__connection:
+            self.__connection.execute("DELETE FROM cache WHERE key LIKE ?", (token_hash(auth) + ":%",))
+
+    def clear(self):
+        with self.__lock, self.__connection:
+            self.__connection.execute("DELETE FROM cache")
+
+
+def get_or_fetch(cache, key, fetch):
+    """ Return a cached value, calling fetch and caching its result on a miss.
+    Concurrent misses on the same key share one fetch and its result or exception (SINGLE_FLIGHT)
+
+    Args:
+        cache (TTLCache or SQLiteCache): cache to use, None to always fetch
+        key (string): key from cache_key
+        fetch (callable): returns the value on a miss
+
+    Returns:
+        (value, bool): the value and whether it came from the cache
+    """
+    if cache is not None:
+        value = cache.get(key)
+        if value is not None:
+            return value, True
+
+    def fetch_and_store():
+        value = fetch()
+        if cache is not None:
+            cache.set(key, value)   # Before the key is released, so later callers hit the cache
+        return value
+
+    if not singleflight.SINGLE_FLIGHT:
+        return fetch_and_store(), False
+    value, _ = singleflight.flights.do(key, fetch_and_store)
+    return value, False
+
+
+async def get_or_fetch_async(cache, key, fetch):
+    """ get_or_fetch for coroutines: fetch is awaited on a miss
+
+    Args:
+        cache (TTLCache or SQLiteCache): cache to use, None to always fetch
+        key (string): key from cache_key
+        fetch (callable): returns an awaitable of the value on a miss
+
+    Returns:
+        (value, bool): the value and whether it came from the cache
+    """
+    if cache is not None:
+        value = cache.get(key)
+        if value is not None:
+            return value, True
+
+    async def fetch_and_store():
+        value = await fetch()
+        if cache is not None:
+            cache.set(key, value)
+        return value
+
+    if not singleflight.SINGLE_FLIGHT:
+        return await fetch_and_store(), False
+    value, _ = await singleflight.async_flights.do(key, fetch_and_store)
+    return value, False
+
+
+def build_cache(backend=CACHE_BACKEND):
+    """ Create the cache chosen by METADATA_CACHE
+
+    Returns:
+        TTLCache, SQLiteCache or None if caching is off
+    """
+    if backend == 'memory':
+        return TTLCache()
+    if backend == 'sqlite':
+        return SQLiteCache()
+    return None
@@ -0,0 +1,156 @@
+import datetime
+import json
+import os
+import sqlite3
+import threading
+
+from roundup import RoundUpAccumulator, OUT, SETTLED
+from metrics import recorder
+
+CHECKPOINT_STORE = os.environ.get('CHECKPOINT_STORE', 'memory')     # memory or sqlite
+CHECKPOINT_PATH = os.environ.get('CHECKPOINT_PATH', '/tmp/starling-checkpoints.sqlite')
+PENDING_EXPIRY_DAYS = int(os.environ.get('CHECKPOINT_PENDING_DAYS', '14'))   # Stop waiting for a pending item to settle
+PENDING = 'PENDING'
+TIMESTAMP_FORMAT = "%Y-%m-%dT%H:%M:%S"
+
+
+def shift_timestamp(timestamp, days):
+    """ Move an API timestamp by a number of days, keeping the API format """
+    moved = datetime.datetime.strptime(timestamp[:19], TIMESTAMP_FORMAT) + datetime.timedelta(days=days)
+    return moved.strftime(TIMESTAMP_FORMAT) + ".000Z"
+
+
+class Checkpoint:
+    """
+    This class records how far an account's feed has been rounded up.
+
+    It holds the timestamp of the newest transaction seen, the feedItemUids already rounded
+    up (so a transaction is never counted twice) and outgoing transactions still pending,
+    which must be fetched again until they settle. Timestamps are ISO strings from the API,
+    which sort in time order.
+
+    Example:
+    checkpoint = Checkpoint("2022-10-20T00:00:00.000Z")
+    response = builder.send_transactions_between_request(auth, accountUid, categoryUid,
+                                                         checkpoint.get_window_start(), now)
+    new_round_up = checkpoint.round_up(feed_items)
+    """
+    def __init__(self, timestamp, rounded=None, pending=None):
+        """Constructor
+
+        Args:
+            timestamp (string): newest transaction time processed
+            rounded (dict): feedItemUid to transactionTime of rounded transactions
+            pending (dict): feedItemUid to transactionTime of pending outgoing transactions
+        """
+        self.__timestamp = timestamp
+        self.__rounded = dict(rounded or {})
+        self.__pending = dict(pending or {})
+
+    def get_timestamp(self):
+        return self.__timestamp
+
+    def get_window_start(self):
+        """ Start of the next fetch: the checkpoint, or the oldest pending transaction if earlier """
+        return min([self.__timestamp] + list(self.__pending.values()))
+
+    @recorder.timed('round_up_incremental')
+    def round_up(self, feed_items):
+        """ Round up only transactions not already rounded and move the checkpoint forward
+
+        Args:
+            feed_items (iterable): feed items fetched from get_window_start()
+
+        Returns:
+            int: round up of the new transactions in minor units
+        """
+        accumulator = RoundUpAccumulator()
+        start = self.get_window_start()
+        newest = self.__timestamp
+        for item in feed_items:
+            uid = item['feedItemUid']
+            transaction_time = item['transactionTime']
+            newest = max(newest, transaction_time)
+            if item['direction'] != OUT or uid in self.__rounded:
+                continue
+            if transaction_time < start and uid not in self.__pending:    # Already behind the checkpoint
+                continue
+            if item['status'] == SETTLED:
+                accumulator.add(OUT, SETTLED, item['amount']['minorUnits'])
+                self.__rounded[uid] = transaction_time
+                self.__pending.pop(uid, None)
+            elif item['status'] == PENDING:
+                self.__pending[uid] = transaction_time
+            else:                                       # Declined, reversed etc. will never settle
+                self.__pending.pop(uid, None)
+        self.__timestamp = newest
+        self.prune()
+        return accumulator.get_total()
+
+    def prune(self):
+        """ Forget pending transactions that never settled and rounded ones older than the next window """
+        expiry = shift_timestamp(self.__timestamp, -PENDING_EXPIRY_DAYS)
+        self.__pending = {uid: time for uid, time in self.__pending.items() if time >= expiry}
+        start = self.get_window_start()
+        self.__rounded = {uid: time for uid, time in self.__rounded.items() if time >= start}
+
+    def to_dict(self):
+        return {"timestamp": self.__timestamp, "rounded": self.__rounded, "pending": self.__pending}
+
+    @classmethod
+    def from_dict(cls, data):
+        return cls(data["timestamp"], data["rounded"], data["pending"])
+
+
+def checkpoint_key(accountUid, categoryUid):
+    return accountUid + ":" + categoryUid
+
+
+class MemoryCheckpointStore:
+    """
+    This class keeps checkpoints in process memory, for tests and warm containers.
+    """
+    def __init__(self):
+        self.__checkpoints = {}
+        self.__lock = threading.Lock()
+
+    def load(self, key):
+        """ Return the checkpoint for a key, or None if the account has never been processed """
+        with self.__lock:
+            data = self.__checkpoints.get(key)
+        return None if data is None else Checkpoint.from_dict(data)
+
+    def save(self, key, checkpoint):
+        with self.__lock:
+            self.__checkpoints[key] = checkpoint.to_dict()
+
+
+class SQLiteCheckpointStore:
+    """
+    This class keeps checkpoints in an SQLite file, with the same interface as MemoryCheckpointStore.
+    """
+    def __init__(self, path=CHECKPOINT_PATH):
+        self.__lock = threading.Lock()
+        self.__connection = sqlite3.connect(path, check_same_thread=False)
+        with self.__connection:
+            self.__connection.execute(
+                "CREATE TABLE IF NOT EXISTS checkpoints (key TEXT PRIMARY KEY, checkpoint TEXT)")
+
+    def load(self, key):
+        """ Return the checkpoint for a key, or None if the account has never been processed """
+        with self.__lock:
+            row = self.__connection.execute(
+                "SELECT checkpoint FROM checkpoints WHERE key = ?", (key,)).fetchone()
+        return None if row is None else Checkpoint.from_dict(json.loads(row[0]))
+
+    def save(self, key, checkpoint):
+        with self.__lock, self.__connection:
+            self.__connection.execute("INSERT OR REPLACE INTO checkpoints VALUES (?, ?)",
+                                      (key, json.dumps(checkpoint.to_dict())))
+
+
+def build_checkpoint_store(backend=CHECKPOINT_STORE):
+    """ Create the store chosen by CHECKPOINT_STORE """
+    if backend == 'sqlite':
+        return SQLiteCheckpointStore()
+    return MemoryCheckpointStore()
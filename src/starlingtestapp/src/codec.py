@@ -0,0 +1,135 @@
+import json
+import os
+
+JSON_BACKEND = os.environ.get('JSON_BACKEND', 'auto')      # auto (orjson if installed), orjson or json
+DECODED = '_decoded_body'                                   # Attribute caching the decoded body on a response
+NUMBER_TABLE = bytes.maketrans(b'0123456789,[', b'0000000000::')   # Digits to 0, what a number follows to :
+NUMBER_SKIP = b' \t\n\r-'                                   # Whitespace and sign, between a : and the digits
+LONG_NUMBER = b'0' * 19                                     # Shortest integer orjson may not decode exactly
+
+orjson = None               # Imported by build_codec, it pulls in uuid and zoneinfo
+
+
+def has_long_number(data):
+    """ Whether a JSON document may hold a number of 19 digits or more. Strings such as hex
+    UIDs can hold long digit runs too, but a number always follows a colon, comma or bracket
+
+    Args:
+        data (bytes): JSON document
+
+    Returns:
+        bool: True if a number may have 19 digits or more, rarely also for a string
+    """
+    marked = data.translate(NUMBER_TABLE, NUMBER_SKIP)
+    return marked.startswith(LONG_NUMBER) or marked.find(b':' + LONG_NUMBER) >= 0
+
+
+class StdlibCodec:
+    """
+    This class encodes and decodes JSON with the stdlib json module.
+    """
+    name = 'json'
+
+    def loads(self, data):
+        """ Decode a JSON document from bytes or str """
+        return json.loads(data)
+
+    def dumps(self, value):
+        """ Encode a value as a JSON str """
+        return json.dumps(value)
+
+
+class OrjsonCodec:
+    """
+    This class encodes and decodes JSON with orjson, several times faster than json on large feeds.
+
+    orjson only handles 64-bit integers and reads longer ones as floats. A document with a
+    number of 19 digits or more, which an integer beyond 64 bits needs, is decoded by the
+    stdlib json module instead, so integers stay exact whatever their size. Anything orjson refuses
+    is handed to the stdlib too, so invalid documents raise the usual ValueError and big
+    integers can still be encoded.
+    """
+    name = 'orjson'
+
+    def loads(self, data):
+        """ Decode a JSON document from bytes or str """
+        if isinstance(data, str):
+            data = data.encode('utf-8')
+        if has_long_number(data):
+            return json.loads(data)
+        try:
+            return orjson.loads(data)
+        except orjson.JSONDecodeError:
+            return json.loads(data)
+
+    def dumps(self, value):
+        """ Encode a value as a JSON str """
+        try:
+            return orjson.dumps(value).decode('utf-8')
+        except orjson.JSONEncodeError:
+            return json.dumps(value)
+
+
+STDLIB = StdlibCodec()
+
+
+def build_codec(backend=JSON_BACKEND):
+    """ Create the codec chosen by JSON_BACKEND
+
+    Raises:
+        ImportError: if orjson was asked for but is not installed
+
+    Returns:
+        OrjsonCodec or StdlibCodec
+    """
+    global orjson
+    if backend in ('auto', 'orjson'):
+        try:
+            import orjson
+        except ImportError:     # Optional, the stdlib json module is used without it
+            if backend == 'orjson':
+                raise
+        else:
+            return OrjsonCodec()
+    return STDLIB
+
+
+codec = None
+
+def get_codec():
+    """ Return the configured codec, creating it on first use """
+    global codec
+    if codec is None:
+        codec = build_codec()
+    return codec
+
+
+def loads(data):
+    """Decode a JSON document with the configured codec"""
+    return get_codec().loads(data)
+
+
+def dumps(value):
+    """ Encode a value as a JSON str with the stdlib, whatever the configured codec.
+    Response bodies and cached metadata are small, and one encoder keeps a body byte for
+    byte the same on a cold or a warm process """
+    return STDLIB.dumps(value)
+
+
+def decode_response(response):
+    """ Decoded JSON body of a response, decoded at most once.
+    The result is kept on the response, so every later caller gets the same object
+
+    Args:
+        response (HTTPResponse or AsyncResponse): response with its body in .data
+
+    Returns:
+        dict: decoded body
+    """
+    try:
+        return getattr(response, DECODED)
+    except AttributeError:
+        pass
+    decoded = get_codec().loads(response.data)
+    setattr(response, DECODED, decoded)
+    return decoded
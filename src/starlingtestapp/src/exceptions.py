@@ -48,4 +48,47 @@ class InputException(Exception):
 
     def __init__(self, inp):
         self.message = inp
-        super().__init__(self.message)
\ No newline at end of file
+        super().__init__(self.message)
+
+class ServiceUnavailableException(Exception):
+    """Exception raised when the Starling API cannot be reached or the circuit is open.
+
+    Attributes:
+        endpoint -- endpoint which failed
+        message -- explanation of the error
+    """
+
+    def __init__(self, endpoint, message="Starling API is unavailable."):
+        self.endpoint = endpoint
+        self.message = message
+        super().__init__(self.message)
+
+
+class DuplicateTransferException(Exception):
+    """Exception raised to stop a round up whose transfer is already in the ledger.
+
+    Attributes:
+        entry -- ledger entry with the transferUid, status and body of the earlier transfer
+        message -- explanation of the error
+    """
+
+    def __init__(self, entry, message="Round up has already been transferred."):
+        self.entry = entry
+        self.message = message
+        super().__init__(self.message)
+
+
+class InsufficientFundsException(Exception):
+    """Exception raised when the cleared balance cannot cover the round up, before any transfer is sent.
+
+    Attributes:
+        amount -- round up in minor units
+        balance -- cleared balance in minor units
+        message -- explanation of the error
+    """
+
+    def __init__(self, amount, balance, message="Insufficient funds for the round up."):
+        self.amount = amount
+        self.balance = balance
+        self.message = message
+        super().__init__(self.message)
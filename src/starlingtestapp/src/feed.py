@@ -0,0 +1,125 @@
+from metrics import recorder
+import codecs
+import json
+import time
+
+FEED_ITEMS = 'feedItems'
+CHUNK_SIZE = 64 * 1024
+WHITESPACE = ' \t\n\r'
+
+
+class FeedParser:
+    """
+    This class parses the feedItems array of a transactions response incrementally.
+
+    Bytes are fed in chunks and each feed item is yielded as soon as it is complete, so
+    only the current chunk and the current item are held in memory, however big the feed.
+
+    Example:
+    parser = FeedParser()
+    for chunk in response.stream(CHUNK_SIZE):
+        for item in parser.feed(chunk):
+            ...
+    parser.close()
+    """
+    def __init__(self, key=FEED_ITEMS):
+        self.__key = '"' + key + '"'
+        self.__decoder = json.JSONDecoder()
+        self.__text = codecs.getincrementaldecoder('utf-8')()
+        self.__buffer = ''
+        self.__position = 0
+        self.__in_array = False
+        self.__finished = False
+
+    def feed(self, chunk):
+        """ Add a chunk of the body and return the items it completed
+
+        Args:
+            chunk (bytes): next part of the response body
+
+        Returns:
+            list: feed items completed by this chunk
+        """
+        self.__buffer = self.__buffer[self.__position:] + self.__text.decode(chunk)
+        self.__position = 0
+        items = []
+        if self.__finished:
+            return items
+        if not self.__in_array and not self.find_array():
+            return items
+        while True:
+            position = self.skip(self.__position, WHITESPACE + ',')
+            if position == len(self.__buffer):
+                break
+            if self.__buffer[position] == ']':
+                self.__finished = True
+                break
+            try:
+                item, end = self.__decoder.raw_decode(self.__buffer, position)
+            except ValueError:      # Item continues in the next chunk
+                break
+            items.append(item)
+            self.__position = end
+        return items
+
+    def find_array(self):
+        """ Move past the start of the feedItems array if it has been received
+
+        Returns:
+            bool: True if inside the array
+        """
+        start = self.__buffer.find(self.__key)
+        if start == -1:
+            self.__position = max(0, len(self.__buffer) - len(self.__key))    # Key may be split across chunks
+            return False
+        position = self.skip(start + len(self.__key), WHITESPACE + ':')
+        if position == len(self.__buffer):
+            self.__position = start
+            return False
+        if self.__buffer[position] != '[':
+            raise ValueError(FEED_ITEMS + " is not a list")
+        self.__position = position + 1
+        self.__in_array = True
+        return True
+
+    def skip(self, position, characters):
+        """Return the first position at or after position not in characters"""
+        while position < len(self.__buffer) and self.__buffer[position] in characters:
+            position += 1
+        return position
+
+    def close(self):
+        """ Check the whole array was received
+
+        Raises:
+            ValueError: if the body ended before the end of the feedItems array
+        """
+        if not self.__finished:
+            raise ValueError("Incomplete " + FEED_ITEMS + " in response")
+
+
+def iter_feed_items(response, chunk_size=CHUNK_SIZE):
+    """ Yield feed items from a response sent with preload_content=False.
+    A gzip or br body is decompressed chunk by chunk as it is parsed, and the bytes read
+    before and after decompression are recorded as the feed_stream stage.
+    The connection is released back to the pool once the body has been read
+
+    Args:
+        response (HTTPResponse): streaming transactions response
+        chunk_size (int): bytes read from the socket at a time
+
+    Yields:
+        dict: each feed item
+    """
+    parser = FeedParser()
+    start = time.perf_counter()
+    size = 0
+    try:
+        for chunk in response.stream(chunk_size):     # urllib3 decodes Content-Encoding incrementally
+            size += len(chunk)
+            yield from parser.feed(chunk)
+        parser.close()
+        if recorder.enabled:
+            recorder.record('feed_stream', time.perf_counter() - start, size, wire_size=response.tell())
+    finally:
+        response.release_conn()
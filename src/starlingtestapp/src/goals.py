@@ -0,0 +1,81 @@
+SAVINGS_GOALS_LIST = "savingsGoalList"
+SAVINGS_GOAL_UID = "savingsGoalUid"
+NAME = "name"
+CURRENCY = "currency"
+AMOUNT_FIELDS = ("totalSaved", "target")     # Either holds the goal's currency, target is optional
+
+
+def goal_currency(goal):
+    """Currency of a savings goal, or None if the goal has no amounts"""
+    for field in AMOUNT_FIELDS:
+        amount = goal.get(field)
+        if amount:
+            return amount.get(CURRENCY)
+    return None
+
+
+class GoalRegistry:
+    """
+    This class indexes a decoded savings goal list by UID and by name and currency.
+
+    It is built once per invocation from the savings goals response (or its cached copy),
+    so a goal is validated or found with a dictionary lookup instead of a scan.
+
+    Example:
+    registry = GoalRegistry.from_response(json_encoder(response))
+    registry.get(savingsGoalUid)
+    registry.find("Round ups", "GBP")
+    registry.default_goal("GBP")
+    """
+    __slots__ = ('__goals', '__by_uid', '__by_name', '__by_currency')
+
+    def __init__(self, goal_list=()):
+        self.__goals = []
+        self.__by_uid = {}
+        self.__by_name = {}
+        self.__by_currency = {}
+        for goal in goal_list:
+            self.add(goal)
+
+    @classmethod
+    def from_response(cls, savings_goals):
+        """ Build a registry from a decoded savings goals response
+
+        Args:
+            savings_goals (dict): response with a savingsGoalList
+
+        Returns:
+            GoalRegistry: index of the goals
+        """
+        return cls(savings_goals[SAVINGS_GOALS_LIST])
+
+    def add(self, goal):
+        """ Index a goal. Where names or currencies repeat, the first goal in the list is kept """
+        self.__goals.append(goal)
+        self.__by_uid[goal[SAVINGS_GOAL_UID]] = goal
+        currency = goal_currency(goal)
+        self.__by_name.setdefault((goal.get(NAME), currency), goal)
+        self.__by_currency.setdefault(currency, goal)
+
+    def get(self, savingsGoalUid):
+        """Goal with this UID, or None"""
+        return self.__by_uid.get(savingsGoalUid)
+
+    def find(self, name, currency):
+        """First goal with this name and currency, or None"""
+        return self.__by_name.get((name, currency))
+
+    def default_goal(self, currency):
+        """ Goal to round up into when none was given: the first goal in the account's currency,
+        otherwise the first goal whose currency is not known. None if every goal is in another
+        currency, as a transfer into it would be rejected, so a goal must be created """
+        goal = self.__by_currency.get(currency)
+        if goal is None:
+            goal = self.__by_currency.get(None)
+        return goal
+
+    def __contains__(self, savingsGoalUid):
+        return savingsGoalUid in self.__by_uid
+
+    def __len__(self):
+        return len(self.__goals)
@@ -0,0 +1,92 @@
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from metrics import recorder
+
+
+class RequestGraph:
+    """
+    This class runs a dependency graph of calls, issuing independent ones in parallel.
+
+    Each node is a named function which receives a dictionary of the results of the
+    nodes it depends on. A node is started as soon as all of its dependencies have
+    finished, so calls which only share a parent (e.g. the transaction feed and the
+    savings goal list, which both only need the accountUid) run at the same time.
+
+    Example:
+    graph = RequestGraph(max_workers=4)
+    graph.add('accounts', lambda results: builder.send_account_request(auth))
+    graph.add('feed', lambda results: ..., depends_on=['accounts'])
+    graph.add('goals', lambda results: ..., depends_on=['accounts'])
+    results = graph.run()
+    """
+    def __init__(self, max_workers=4):
+        """Constructor, set the number of worker threads
+
+        Args:
+            max_workers (int): maximum calls in flight, 1 runs the graph sequentially
+        """
+        self.__max_workers = max_workers
+        self.__nodes = {}
+
+    def add(self, name, function, depends_on=None):
+        """ Add a node to the graph
+
+        Args:
+            name (string): unique name of the node, used as its key in the results
+            function (callable): called with a dict of the results of its dependencies
+            depends_on (list): names of nodes which must finish first. Defaults to None.
+        """
+        if name in self.__nodes:
+            raise ValueError("Node already in graph: " + name)
+        depends_on = list(depends_on or [])
+        for dependency in depends_on:
+            if dependency not in self.__nodes:
+                raise ValueError("Unknown dependency: " + dependency)
+        self.__nodes[name] = (function, depends_on)
+
+    def get_max_workers(self):
+        return self.__max_workers
+
+    def call_node(self, name, results):
+        """ Call a node with the results of its dependencies
+
+        Args:
+            name (string): name of node
+            results (dict): results of all finished nodes
+
+        Returns:
+            result of the node function
+        """
+        function, depends_on = self.__nodes[name]
+        return function({dependency: results[dependency] for dependency in depends_on})
+
+    def run(self):
+        """ Run every node, respecting dependencies.
+        The first exception raised by a node is re-raised here and no further nodes are started.
+
+        Returns:
+            dict: result of each node keyed by name
+        """
+        results = {}
+        if self.__max_workers <= 1:
+            for name in self.__nodes:         # Nodes can only depend on earlier nodes
+                results[name] = self.call_node(name, results)
+            return results
+
+        pending = dict(self.__nodes)
+        running = {}
+        with ThreadPoolExecutor(max_workers=self.__max_workers) as executor:
+            while pending or running:
+                for name in list(pending):
+                    if all(dependency in results for dependency in pending[name][1]):
+                        del pending[name]
+                        running[executor.submit(recorder.bind(self.call_node), name, dict(results))] = name
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    name = running.pop(future)
+                    try:
+                        results[name] = future.result()
+                    except Exception:
+                        for other in running:
+                            other.cancel()
+                        raise
+        return results
@@ -0,0 +1,102 @@
+import json
+import os
+import sqlite3
+import threading
+import uuid
+
+LEDGER_STORE = os.environ.get('LEDGER_STORE', 'memory')        # memory, sqlite or off
+LEDGER_PATH = os.environ.get('LEDGER_PATH', '/tmp/starling-ledger.sqlite')
+TRANSFER_NAMESPACE = uuid.UUID('6f1c3f0e-3c55-4f0b-9a6e-5d1f0c9b7a42')
+SUCCESS_STATUS = 200
+
+
+def ledger_key(accountUid, savingsGoalUid, period):
+    """ Key of a round up: the account, the goal it is paid into and the period it covers
+
+    Args:
+        accountUid (string): UUID string identifying an account
+        savingsGoalUid (string): UUID string identifying a savings goal
+        period (string): start of the week, or another identifier of the rounded up period
+
+    Returns:
+        string: ledger key
+    """
+    return accountUid + ":" + savingsGoalUid + ":" + period
+
+
+def transfer_uid(key):
+    """ Deterministic transfer UID for a ledger key.
+    Starling applies a transfer UID at most once, so re-runs of the same round up cannot transfer twice
+    """
+    return str(uuid.uuid5(TRANSFER_NAMESPACE, key))
+
+
+class MemoryLedger:
+    """
+    This class records transfer outcomes in process memory, for tests and warm containers.
+
+    Example:
+    entry = ledger.get(key)
+    if entry is None or entry['status'] != 200:
+        response = builder.send_transfer_round_up_request(..., transfer_uid=transfer_uid(key))
+        ledger.record(key, transfer_uid(key), response.status, body)
+    """
+    def __init__(self):
+        self.__entries = {}
+        self.__lock = threading.Lock()
+
+    def get(self, key):
+        """ Return the recorded transfer for a key as a dict of transferUid, status and body, or None """
+        with self.__lock:
+            entry = self.__entries.get(key)
+        return None if entry is None else dict(entry)
+
+    def record(self, key, transfer_uid, status, body):
+        """ Record the outcome of a transfer, replacing any earlier outcome """
+        with self.__lock:
+            self.__entries[key] = {"transferUid": transfer_uid, "status": status, "body": body}
+
+
+class SQLiteLedger:
+    """
+    This class records transfer outcomes in an SQLite file, with the same interface as MemoryLedger.
+    """
+    def __init__(self, path=LEDGER_PATH):
+        self.__lock = threading.Lock()
+        self.__connection = sqlite3.connect(path, check_same_thread=False)
+        with self.__connection:
+            self.__connection.execute(
+                "CREATE TABLE IF NOT EXISTS transfers (key TEXT PRIMARY KEY, transfer_uid TEXT, status INTEGER, body TEXT)")
+
+    def get(self, key):
+        """ Return the recorded transfer for a key as a dict of transferUid, status and body, or None """
+        with self.__lock:
+            row = self.__connection.execute(
+                "SELECT transfer_uid, status, body FROM transfers WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        return {"transferUid": row[0], "status": row[1], "body": json.loads(row[2])}
+
+    def record(self, key, transfer_uid, status, body):
+        """ Record the outcome of a transfer, replacing any earlier outcome """
+        with self.__lock, self.__connection:
+            self.__connection.execute("INSERT OR REPLACE INTO transfers VALUES (?, ?, ?, ?)",
+                                      (key, transfer_uid, status, json.dumps(body)))
+
+
+def is_done(entry):
+    """Return True if a ledger entry records a successful transfer"""
+    return entry is not None and entry['status'] == SUCCESS_STATUS
+
+
+def build_ledger(backend=LEDGER_STORE):
+    """ Create the ledger chosen by LEDGER_STORE
+
+    Returns:
+        MemoryLedger, SQLiteLedger or None if the ledger is off
+    """
+    if backend == 'memory':
+        return MemoryLedger()
+    if backend == 'sqlite':
+        return SQLiteLedger()
+    return None
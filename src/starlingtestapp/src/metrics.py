@@ -0,0 +1,239 @@
+from contextlib import contextmanager
+from functools import wraps
+import contextvars
+import json
+import os
+import sys
+import threading
+import time
+
+METRICS = os.environ.get('METRICS', 'off')                        # off or emf
+NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'StarlingRoundUp')
+MAX_VALUES = 100                                                  # EMF limit of values per metric
+
+LATENCY = 'Latency'
+PAYLOAD_BYTES = 'PayloadBytes'
+WIRE_BYTES = 'WireBytes'                                          # Bytes received, before decompression
+RETRIES = 'Retries'
+UNITS = {LATENCY: 'Milliseconds', PAYLOAD_BYTES: 'Bytes', WIRE_BYTES: 'Bytes', RETRIES: 'Count'}
+
+
+class EMFSink:
+    """
+    This class writes metrics as CloudWatch Embedded Metric Format JSON lines.
+
+    Lambda sends stdout to CloudWatch Logs, which turns each line into metrics.
+    """
+    def __init__(self, stream=None, namespace=NAMESPACE):
+        self.__stream = stream
+        self.__namespace = namespace
+
+    def emit(self, stage, values):
+        """ Write one EMF document for a stage
+
+        Args:
+            stage (string): name of the stage, used as the Stage dimension
+            values (dict): metric name to list of values
+        """
+        document = {
+            "_aws": {
+                "Timestamp": int(time.time() * 1000),
+                "CloudWatchMetrics": [{
+                    "Namespace": self.__namespace,
+                    "Dimensions": [["Stage"]],
+                    "Metrics": [{"Name": name, "Unit": UNITS[name]} for name in values],
+                }],
+            },
+            "Stage": stage,
+        }
+        document.update(values)
+        stream = self.__stream or sys.stdout
+        stream.write(json.dumps(document) + "\n")
+
+
+class ListSink:
+    """
+    This class keeps emitted metrics in a list, for tests and the benchmark suite.
+    """
+    def __init__(self):
+        self.emitted = []
+
+    def emit(self, stage, values):
+        self.emitted.append((stage, values))
+
+
+class NullTimer:
+    """Context manager which does nothing, returned while the recorder is disabled.
+    It is shared by every caller, so it keeps no state and a size set on it is dropped"""
+    __slots__ = ()
+
+    @property
+    def size(self):
+        return None
+
+    @size.setter
+    def size(self, value):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_TIMER = NullTimer()
+
+
+class Timer:
+    """Context manager which records the time spent inside it as a stage"""
+    def __init__(self, recorder, stage):
+        self.__recorder = recorder
+        self.__stage = stage
+        self.size = None
+
+    def __enter__(self):
+        self.__start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.__recorder.record(self.__stage, time.perf_counter() - self.__start, self.size)
+        return False
+
+
+class Recorder:
+    """
+    This class collects per-stage latency, payload size and retry counts.
+
+    Records are kept until flush, which sends one set of values per stage to the sink.
+    Inside invocation() they belong to that invocation alone, so invocations running at
+    the same time (server workers, batch jobs) are flushed separately. Worker threads
+    started for an invocation join it through bind. While disabled every method returns
+    straight away, so instrumentation can stay in the hot path.
+
+    Example:
+    with recorder.invocation():
+        with recorder.timer('parse_account'):
+            ...
+        executor.map(recorder.bind(round_up_account), accounts)
+    @recorder.timed('round_up')
+    def round_up_transactions(...):
+    recorder.record('accounts', seconds, size=1024, retries=1)
+    recorder.flush()
+    """
+    def __init__(self, sink=None):
+        self.sink = sink
+        self.enabled = sink is not None
+        self.__process_records = {}         # Records made outside an invocation
+        self.__records = contextvars.ContextVar('metrics_records', default=None)
+        self.__lock = threading.Lock()
+
+    def enable(self, sink):
+        self.sink = sink
+        self.enabled = True
+
+    def disable(self):
+        self.enabled = False
+        with self.__lock:
+            self.__process_records = {}
+
+    def current_records(self):
+        """Records of the current invocation, or of the process outside one"""
+        records = self.__records.get()
+        return self.__process_records if records is None else records
+
+    @contextmanager
+    def invocation(self):
+        """ Context manager collecting the records of one invocation, flushed when it exits """
+        token = self.__records.set({})
+        try:
+            yield
+        finally:
+            self.flush()
+            self.__records.reset(token)
+
+    def bind(self, function):
+        """ Wrap a function run on a worker thread so its records go to the caller's invocation
+
+        Args:
+            function (function): function to run, e.g. with executor.map
+
+        Returns:
+            function: function recording into the invocation current when bind was called
+        """
+        records = self.__records.get()
+        if records is None:
+            return function
+
+        @wraps(function)
+        def bound(*args, **kwargs):
+            token = self.__records.set(records)
+            try:
+                return function(*args, **kwargs)
+            finally:
+                self.__records.reset(token)
+        return bound
+
+    def record(self, stage, seconds, size=None, retries=None, wire_size=None):
+        """ Record one execution of a stage
+
+        Args:
+            stage (string): name of the stage e.g. accounts
+            seconds (float): time taken
+            size (int): payload size in bytes. Defaults to None.
+            retries (int): retries needed. Defaults to None.
+            wire_size (int): bytes received for the payload, if compressed. Defaults to None.
+        """
+        if not self.enabled:
+            return
+        with self.__lock:
+            values = self.current_records().setdefault(stage, {LATENCY: []})
+            values[LATENCY].append(round(seconds * 1000, 3))
+            if size is not None:
+                values.setdefault(PAYLOAD_BYTES, []).append(size)
+            if retries is not None:
+                values.setdefault(RETRIES, []).append(retries)
+            if wire_size is not None:
+                values.setdefault(WIRE_BYTES, []).append(wire_size)
+
+    def timer(self, stage):
+        """ Context manager timing the code inside it as a stage. Set .size to record a payload size """
+        if not self.enabled:
+            return NULL_TIMER
+        return Timer(self, stage)
+
+    def timed(self, stage):
+        """ Decorator timing every call of a function as a stage """
+        def decorator(function):
+            @wraps(function)
+            def wrapper(*args, **kwargs):
+                if not self.enabled:
+                    return function(*args, **kwargs)
+                start = time.perf_counter()
+                try:
+                    return function(*args, **kwargs)
+                finally:
+                    self.record(stage, time.perf_counter() - start)
+            return wrapper
+        return decorator
+
+    def flush(self):
+        """ Send everything recorded since the last flush, in this invocation if inside one, to the sink """
+        if not self.enabled:
+            return
+        with self.__lock:
+            current = self.current_records()
+            records = dict(current)
+            current.clear()             # Cleared in place, worker threads of the invocation share it
+        for stage, values in records.items():
+            self.sink.emit(stage, {name: series[-MAX_VALUES:] for name, series in values.items()})
+
+
+def build_recorder(backend=METRICS):
+    """ Create the recorder chosen by METRICS """
+    if backend == 'emf':
+        return Recorder(EMFSink())
+    return Recorder()
+
+
+recorder = build_recorder()
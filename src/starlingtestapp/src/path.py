@@ -1,15 +1,305 @@
-from exceptions import DateFormatException, AccountException
+from exceptions import DateFormatException, AccountException, InputException, ServiceUnavailableException
+from resilience import RetryPolicy, CircuitBreaker, build_limiter
+from metrics import recorder
+from concurrent.futures import ThreadPoolExecutor
 import urllib3
 import datetime
 import json
 import uuid
+import os
+import threading
+import time
+
+# A batch runs BATCH_MAX_WORKERS round ups at once, each with up to ROUND_UP_MAX_WORKERS requests in flight,
+# all to the one Starling host. The pool keeps a connection for each, so none is opened and then discarded
+BATCH_CONCURRENCY = int(os.environ.get('BATCH_MAX_WORKERS', '8')) * int(os.environ.get('ROUND_UP_MAX_WORKERS', '4'))
+POOL_MAXSIZE = int(os.environ.get('POOL_MAXSIZE', str(BATCH_CONCURRENCY)))   # Keep-alive connections per host
+POOL_IDLE_TIMEOUT = float(os.environ.get('POOL_IDLE_TIMEOUT', '60'))      # Seconds before idle connections are dropped
+HEALTH_CHECK_TIMEOUT = 2.0
+API_BASE = os.environ.get('STARLING_API_BASE', 'https://api-sandbox.starlingbank.com')
+CONNECT_TIMEOUT = float(os.environ.get('CONNECT_TIMEOUT', '3'))
+READ_TIMEOUT = float(os.environ.get('READ_TIMEOUT', '10'))
+FEED_COMPRESSION = os.environ.get('FEED_COMPRESSION', 'false').lower() == 'true'   # Ask for compressed transaction feeds
+
+# Endpoint names, used to pick the resilience policy of a request
+ACCOUNTS = 'accounts'
+BALANCE = 'balance'
+TRANSACTIONS = 'transactions'
+SAVINGS_GOALS = 'savings_goals'
+CREATE_GOAL = 'create_goal'
+TRANSFER = 'transfer'
+WINDOW_DAYS = int(os.environ.get('FEED_WINDOW_DAYS', '7'))               # Days per transactions request in a range
+RANGE_WORKERS = int(os.environ.get('FEED_RANGE_WORKERS', '4'))           # Windows fetched at once
+MAX_RANGE_DAYS = 366
+DEFAULT_GOAL_NAME = "New Savings Goal"
+
+def default_policies(policies=None):
+    """ Retry policy of each endpoint, with any given policies replacing the defaults.
+    GETs are idempotent and the transfer reuses its transfer UID, so both can be retried.
+    Creating a savings goal is not idempotent, so it is only sent once
+
+    Args:
+        policies (dict): endpoint name to RetryPolicy. Defaults to None.
+
+    Returns:
+        dict: endpoint name to RetryPolicy
+    """
+    defaults = {
+        ACCOUNTS: RetryPolicy(),
+        BALANCE: RetryPolicy(),
+        TRANSACTIONS: RetryPolicy(),
+        SAVINGS_GOALS: RetryPolicy(),
+        CREATE_GOAL: RetryPolicy(max_attempts=1),
+        TRANSFER: RetryPolicy(),
+    }
+    defaults.update(policies or {})
+    return defaults
+
+
+def accept_encoding():
+    """ Accept-Encoding of a compressed feed request: gzip, and br when brotli is installed to decode it """
+    from importlib.util import find_spec
+    if find_spec('brotli') is not None or find_spec('brotlicffi') is not None:
+        return 'gzip, br'
+    return 'gzip'
+
+
+class RequestPaths:
+    """
+    This class stores all neccessary url paths and sub-paths.
+    It appends input to create URLs, headers and body data, without sending anything.
+
+    It is shared by the blocking RequestBuilder and the asyncio AsyncRequestBuilder,
+    so both send exactly the same requests and map errors the same way.
+    """
+    def __init__(self, base_url=API_BASE, compression=FEED_COMPRESSION):
+        # All variables are private
+        self.__account_base_path = base_url + "/api/v2/accounts"
+        self.__transaction_base_path = base_url + "/api/v2/feed/account/"
+        self.__savings_base_path = base_url + "/api/v2/account/"
+        self.__savings_path = "/savings-goals"
+        self.__transfer_path = "/add-money/"
+        self.__category_path = "/category/"
+        self.__transactions_path = "/transactions-between"
+        self.__headers = {'Accept': 'application/json'}
+        self.__feed_encoding = accept_encoding() if compression else None
+
+    def build_header(self, auth, content_type=None):
+        """ Build header argument for a single request.
+        A new dictionary is returned so concurrent requests never share headers
+
+        Args:
+            auth (string): Bearer Token for request authorisation
+            content_type (string): Content-Type of the body. Defaults to None.
+
+        Returns:
+            dict: headers for the request
+        """
+        headers = dict(self.__headers)
+        if auth is not None:
+            headers['Authorization'] = 'Bearer ' + auth
+        if content_type is not None:
+            headers['Content-Type'] = content_type
+        return headers
+
+    def build_feed_header(self, auth):
+        """ Build headers for a transactions request, asking for a compressed body when enabled.
+        Feeds are by far the largest responses, and decompress incrementally while streamed
+
+        Args:
+            auth (string): Bearer Token for request authorisation
+
+        Returns:
+            dict: headers for the request
+        """
+        headers = self.build_header(auth)
+        if self.__feed_encoding is not None:
+            headers['Accept-Encoding'] = self.__feed_encoding
+        return headers
+
+    def build_account_url(self):
+        """URL listing the accounts of a token"""
+        return self.__account_base_path
+
+    def build_balance_url(self, accountUid):
+        """URL of the balance of an account"""
+        return self.__account_base_path + "/" + accountUid + "/balance"
+
+    def build_transactions_url(self, accountUid, categoryUid, min_timestamp, max_timestamp):
+        """ This builds the url of the transactions between two timestamps
+
+        Args:
+            accountUid (string): UUID string identifying an account
+            categoryUid (string): UUID string identfying a category
+            min_timestamp (string): ISO timestamp of the start of the window
+            max_timestamp (string): ISO timestamp of the end of the window
+
+        Returns:
+            url: url for transactions
+        """
+        url = self.__transaction_base_path + accountUid + self.__category_path + categoryUid + self.__transactions_path
+        return url + "?minTransactionTimestamp=" + min_timestamp.replace(":", "%3A") + \
+            "&maxTransactionTimestamp=" + max_timestamp.replace(":", "%3A")
+
+    def build_savings_url(self, accountUid):
+        """ This builds savings url
+    
+        Args:
+            accountUid (string): UUID string identifying an account
+
+        Returns:
+            url: url for savings 
+        """
+        return self.__savings_base_path + accountUid + self.__savings_path
+
+    def build_transfer_url(self, accountUid, savingsGoalUid, transfer_uid):
+        """URL adding money to a savings goal under a transfer UID"""
+        return self.build_savings_url(accountUid) + "/" + savingsGoalUid + self.__transfer_path + transfer_uid
+
+    def build_transfer_body(self, currency, amount):
+        """JSON body of a transfer of amount minor units"""
+        data = {
+            "amount": {
+                "currency": currency,
+                "minorUnits": amount
+            }
+        }
+        return json.dumps(data)
+
+    def build_savings_body(self, currency):
+        """JSON body of the default savings goal"""
+        data = {
+            "name": DEFAULT_GOAL_NAME,
+            "currency": currency,
+            
+            "target": {
+                "currency": currency,
+                "minorUnits": 100000
+            },
+            "base64EncodedPhoto": "string"
+            }
+        return json.dumps(data)
+
+    def check_response(self, response):
+        """ Raise AccountException unless the response is a 200
+
+        Args:
+            response (Response): response from either backend, with status and data
+
+        Raises:
+            AccountException: if the request was refused
+
+        Returns:
+            Response: the same response
+        """
+        if response.status != 200:
+            raise AccountException(response)
+        return response
+
+    def record_request(self, endpoint, start, retries, response=None, preload_content=True):
+        """ Record latency, payload size and retries of a request when metrics are enabled
+
+        Args:
+            endpoint (string): endpoint name, used as the stage
+            start (float): perf_counter when the first attempt started
+            retries (int): attempts after the first
+            response (HTTPResponse or AsyncResponse): final response, if any. Defaults to None.
+            preload_content (bool): whether the body has been read. Defaults to True.
+        """
+        if not recorder.enabled:
+            return
+        size = wire_size = None
+        if response is not None:
+            length = response.headers.get('Content-Length')
+            encoded = bool(response.headers.get('Content-Encoding'))
+            if preload_content:
+                size = len(response.data)
+            elif length and not encoded:
+                size = int(length)
+            if length and encoded:
+                wire_size = int(length)
+        recorder.record(endpoint, time.perf_counter() - start, size, retries, wire_size)
+
+    def split_date_range(self, start_date, end_date, window_days=WINDOW_DAYS):
+        """ Split the days from start_date to end_date (inclusive) into windows of at most window_days
+
+        Args:
+            start_date (string): first day, YYYY-MM-DD
+            end_date (string): last day, YYYY-MM-DD
+            window_days (int): days per window
+
+        Raises:
+            DateFormatException: if either date is badly formatted
+            InputException: if the range is empty or longer than MAX_RANGE_DAYS
+
+        Returns:
+            list: (min_timestamp, max_timestamp) of each window
+        """
+        self.time_parser(start_date, 0)
+        self.time_parser(end_date, 0)
+        days = (datetime.datetime.strptime(end_date, "%Y-%m-%d") - datetime.datetime.strptime(start_date, "%Y-%m-%d")).days + 1
+        if days < 1 or days > MAX_RANGE_DAYS:
+            raise InputException("endDate must be on or after date and within " + str(MAX_RANGE_DAYS) + " days")
+        return [(self.time_parser(start_date, offset), self.time_parser(start_date, min(offset + window_days, days)))
+                for offset in range(0, days, window_days)]
+
+    def add_days(self, date, days):
+        """Add days to date and return as date"""
+        return date + datetime.timedelta(days=days)
+
+    def time_parser(self, date, addDays):
+        """ Given a date and a modifier in days return a timer suitable for API request (ISO)
+
+        Args:
+            date (_type_): _description_
+            addDays (_type_, optional): _description_. Defaults to None.
+
+        Raises:
+            Value Error: Raise value error if user returns a badly formatted Date
+
+        Returns:
+            date: a date in ISO format
+        """
+        date_split = date.split('-')
+        try:
+            if len(date_split) != 3:
+                raise ValueError            
+            new_date = self.add_days(datetime.datetime.strptime(date, "%Y-%m-%d"), addDays)
+            days = new_date.day
+            month = new_date.month
+            year  = new_date.year
+        except:
+            raise DateFormatException(date)
+        return datetime.datetime(year, month, days, 0, 0, 0, 000).isoformat() + ".000Z"
+
+    def iso_date(self, date):
+        """ Return a date as YYYY-MM-DD, so "2022-10-5" and "2022-10-05" give the same string
+
+        Args:
+            date (string): date accepted by time_parser
+
+        Raises:
+            DateFormatException: if the date is badly formatted
 
-class RequestBuilder:
+        Returns:
+            string: the date in ISO format
+        """
+        return self.time_parser(date, 0)[:10]
+
+    def timestamp_now(self):
+        """Current time as an ISO timestamp in the format used by the API"""
+        now = datetime.datetime.utcnow()
+        return now.strftime("%Y-%m-%dT%H:%M:%S.") + "%03dZ" % (now.microsecond // 1000)
+
+
+class RequestBuilder(RequestPaths):
     """
     This class builds requests using user data.
 
-    The class stores all neccessary url paths and sub-paths.
-    It appends input to create URLs, body data and send requests.
+    The class uses the paths of RequestPaths to create URLs, body data and send requests.
+
+    A RequestBuilder holds no per-user state so one instance can be shared between threads
+    and warm Lambda invocations, see get_builder.
 
     Example:
     my_builer = RequestBuilder()
@@ -17,26 +307,107 @@ class RequestBuilder:
     response = my_builder.send_transaction_request(authorization_bearer, \
                                                     accountUid, categoryUid, start of date range)
     """
-    def __init__(self):
+    def __init__(self, maxsize=POOL_MAXSIZE, idle_timeout=POOL_IDLE_TIMEOUT, base_url=API_BASE, policies=None,
+                 limiter=None, compression=FEED_COMPRESSION):
         # Simple constructor for class to initiate paths and start a PoolManager to build requests.
         # All variables are private
-        self.__account_base_path = "https://api-sandbox.starlingbank.com/api/v2/accounts"
-        self.__transaction_base_path = "https://api-sandbox.starlingbank.com/api/v2/feed/account/"
-        self.__savings_base_path = "https://api-sandbox.starlingbank.com/api/v2/account/"
-        self.__savings_path = "/savings-goals"
-        self.__transfer_path = "/add-money/"
-        self.__category_path = "/category/"
-        self.__transactions_path = "/transactions-between"
-        self.__headers = {'Accept': 'application/json'}
-        self.http = urllib3.PoolManager()
+        super().__init__(base_url, compression)
+        self.__idle_timeout = idle_timeout
+        self.__last_used = time.monotonic()
+        self.http = urllib3.PoolManager(maxsize=maxsize, timeout=urllib3.Timeout(connect=CONNECT_TIMEOUT, read=READ_TIMEOUT))
+        self.__policies = default_policies(policies)
+        self.__breakers = {endpoint: CircuitBreaker() for endpoint in self.__policies}
+        self.__limiter = limiter if limiter is not None else build_limiter()
+
+    def build_header(self, auth, content_type=None):
+        """ Build headers with RequestPaths.build_header and mark the pool as in use """
+        self.__last_used = time.monotonic()
+        return super().build_header(auth, content_type)
+
+    def evict_idle(self):
+        """ Drop pooled connections if the pool has been idle for longer than the idle timeout.
+        A frozen Lambda container can leave sockets the server has already closed
+
+        Returns:
+            bool: True if connections were dropped
+        """
+        if time.monotonic() - self.__last_used > self.__idle_timeout:
+            self.http.clear()
+            self.__last_used = time.monotonic()
+            return True
+        return False
 
-    def build_header(self, auth):
-        """ Build header argument and assign to class variable
+    def health_check(self):
+        """ Check the Starling API can be reached over the pool.
+        Any HTTP response (including an auth error) means the connection is healthy
+
+        Returns:
+            bool: True if a response was received
+        """
+        try:
+            self.http.request('HEAD',
+                        self.build_account_url(),
+                        headers = super().build_header(None),
+                        timeout = HEALTH_CHECK_TIMEOUT,
+                        retries = False)
+        except urllib3.exceptions.HTTPError:
+            self.http.clear()
+            return False
+        return True
+
+    def send_request(self, endpoint, method, url, headers, body=None, preload_content=True):
+        """ Send a request with the retry policy and circuit breaker of its endpoint
 
         Args:
-            auth (string): Bearer Token for request authorisation
+            endpoint (string): endpoint name e.g. TRANSFER
+            method (string): HTTP method
+            url (string): full url
+            headers (dict): headers from build_header
+            body (string): request body. Defaults to None.
+            preload_content (bool): read the body before returning. Defaults to True.
+
+        Raises:
+            ServiceUnavailableException: if the circuit is open or every attempt failed to connect
+
+        Returns:
+            Response: last response received
         """
-        self.__headers['Authorization'] = 'Bearer ' + auth
+        policy = self.__policies[endpoint]
+        breaker = self.__breakers[endpoint]
+        start = time.perf_counter()
+        attempt = 0
+        while True:
+            if not breaker.allow():
+                self.record_request(endpoint, start, attempt)
+                raise ServiceUnavailableException(endpoint)
+            if self.__limiter is not None:      # Paced by the rate limiter, transfers first
+                waited = self.__limiter.acquire(headers.get('Authorization'), endpoint == TRANSFER)
+                if waited:
+                    recorder.record('rate_limit_wait', waited)
+            try:
+                response = self.http.request(method, url, headers = headers, body = body,
+                                             retries = False, preload_content = preload_content)
+            except urllib3.exceptions.HTTPError as exc:
+                breaker.record_failure()
+                if not policy.should_retry(attempt, error=exc):
+                    self.record_request(endpoint, start, attempt)
+                    raise ServiceUnavailableException(endpoint) from exc
+                time.sleep(policy.backoff(attempt))
+                attempt += 1
+                continue
+            if self.__limiter is not None:
+                self.__limiter.update(headers.get('Authorization'), response)
+            if response.status >= 500:
+                breaker.record_failure()
+            else:
+                breaker.record_success()
+            if not policy.should_retry(attempt, response=response):
+                self.record_request(endpoint, start, attempt, response, preload_content)
+                return response
+            response.drain_conn()
+            response.release_conn()
+            time.sleep(policy.backoff(attempt, response))
+            attempt += 1
 
     def send_account_request(self, auth):
         """ Send a request to account path to get a list of user accounts
@@ -47,14 +418,10 @@ class RequestBuilder:
         Returns:
             Response: response from https request
         """
-        self.build_header(auth)
-        response =  self.http.request('GET',
-                        self.__account_base_path,
-                        headers = self.__headers,
-                        retries = False)
-        if response.status != 200:                  # Catch Authentication error
-            raise AccountException(response)
-        return response
+        response =  self.send_request(ACCOUNTS, 'GET',
+                        self.build_account_url(),
+                        headers = self.build_header(auth))
+        return self.check_response(response)        # Catch Authentication error
         
     def send_account_balance_request(self, auth, accountUid):
         """ Send a request to account path to get balance
@@ -65,14 +432,11 @@ class RequestBuilder:
         Returns:
             Response: response from https request
         """
-        self.build_header(auth)
-        url = self.__account_base_path+ "/" + accountUid + "/balance"
-        return self.http.request('GET',
-                        url,
-                        headers = self.__headers,
-                        retries = False)
+        return self.send_request(BALANCE, 'GET',
+                        self.build_balance_url(accountUid),
+                        headers = self.build_header(auth))
 
-    def send_transaction_request(self, auth, accountUid, categoryUid, changes_since):
+    def send_transaction_request(self, auth, accountUid, categoryUid, changes_since, stream=False):
         """ This function requests a list of transactions between two dates
 
         Args:
@@ -80,34 +444,67 @@ class RequestBuilder:
             accountUid (string): UUID string identifying an account
             categoryUid (string): UUID string identfying a category
             changes_since (string): start of week to be rounded up
+            stream (bool): leave the body unread so it can be parsed incrementally
+                           with feed.iter_feed_items. Defaults to False.
 
         Returns:
             Response: response from https request
         """
-        self.build_header(auth)
-        url = self.__transaction_base_path + accountUid + self.__category_path + categoryUid + self.__transactions_path
-        url = url + "?minTransactionTimestamp=" + \
-        self.time_parser(changes_since, 0).replace(":", "%3A") + \
-            "&maxTransactionTimestamp=" + self.time_parser(changes_since, 7).replace(":", "%3A")
+        return self.send_transactions_between_request(auth, accountUid, categoryUid,
+                                                      self.time_parser(changes_since, 0),
+                                                      self.time_parser(changes_since, 7),
+                                                      stream)
+
+    def send_transactions_between_request(self, auth, accountUid, categoryUid, min_timestamp, max_timestamp, stream=False):
+        """ This function requests a list of transactions between two timestamps
+
+        Args:
+            auth (string): authorization_bearer
+            accountUid (string): UUID string identifying an account
+            categoryUid (string): UUID string identfying a category
+            min_timestamp (string): ISO timestamp of the start of the window
+            max_timestamp (string): ISO timestamp of the end of the window
+            stream (bool): leave the body unread so it can be parsed incrementally. Defaults to False.
 
-        return self.http.request('GET',
+        Returns:
+            Response: response from https request
+        """
+        url = self.build_transactions_url(accountUid, categoryUid, min_timestamp, max_timestamp)
+        response = self.send_request(TRANSACTIONS, 'GET',
                         url,
-                        headers = self.__headers,
-                        retries = False)
+                        headers = self.build_feed_header(auth),
+                        preload_content = not stream)
+        if response.status != 200:                  # Read the error body so it can be returned
+            response.data
+            response.release_conn()
+        return self.check_response(response)
+
+    def send_transaction_range_request(self, auth, accountUid, categoryUid, start_date, end_date,
+                                       window_days=WINDOW_DAYS, max_workers=RANGE_WORKERS):
+        """ Request the transactions of a long date range as several windows fetched concurrently.
+        Windows share their boundaries, so callers should de-duplicate by feedItemUid
 
-    def build_savings_url(self, accountUid):
-        """ This builds savings url
-    
         Args:
+            auth (string): authorization_bearer
             accountUid (string): UUID string identifying an account
+            categoryUid (string): UUID string identfying a category
+            start_date (string): first day, YYYY-MM-DD
+            end_date (string): last day, YYYY-MM-DD
+            window_days (int): days per request
+            max_workers (int): requests in flight at once
 
         Returns:
-            url: url for savings 
+            list: response of each window, in date order
         """
-        return self.__savings_base_path + accountUid + self.__savings_path
+        windows = self.split_date_range(start_date, end_date, window_days)
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(windows))) as executor:
+            return list(executor.map(recorder.bind(
+                lambda window: self.send_transactions_between_request(auth, accountUid, categoryUid, window[0], window[1])),
+                windows))
 
-    def send_transfer_round_up_request(self, auth, accountUid, savingsGoalUid, currency, amount):
-        """This functions
+    def send_transfer_round_up_request(self, auth, accountUid, savingsGoalUid, currency, amount, transfer_uid=None):
+        """This functions sends the round up to a savings goal.
+        The transfer UID is kept for every retry, so Starling applies the transfer at most once
 
         Args:
             auth (string): authorization_bearer
@@ -115,21 +512,16 @@ class RequestBuilder:
             savingsGoalUid (string): UUID string identifying a savings goal
             currency (string): currency identifier e.g. GBP
             amount (int): amount to be transferred in minor units
+            transfer_uid (string): UUID of the transfer. Defaults to a new random UUID.
 
         Returns:
             Response: response from https request
         """
-        self.build_header(auth)
-        url = self.build_savings_url(accountUid)
-        url = url + "/" + savingsGoalUid + self.__transfer_path + str(uuid.uuid4())
-        self.__headers['Content-Type'] = 'application/json'
-        data = {
-            "amount": {
-                "currency": currency,
-                "minorUnits": amount
-            }
-        }
-        return self.http.request('PUT', url, headers = self.__headers,body=json.dumps(data),retries = False)
+        if transfer_uid is None:
+            transfer_uid = str(uuid.uuid4())
+        url = self.build_transfer_url(accountUid, savingsGoalUid, transfer_uid)
+        return self.send_request(TRANSFER, 'PUT', url, headers = self.build_header(auth, 'application/json'),
+                                 body=self.build_transfer_body(currency, amount))
 
     def send_get_savings_request(self, auth, accountUid):
         """ This function returns a list of savings goals
@@ -141,12 +533,10 @@ class RequestBuilder:
         Returns:
             Response: response from https request
         """
-        self.build_header(auth)
         url = self.build_savings_url(accountUid)
-        return self.http.request('GET',
+        return self.send_request(SAVINGS_GOALS, 'GET',
                         url,
-                        headers = self.__headers,
-                        retries = False)
+                        headers = self.build_header(auth))
 
     def send_put_savings_request(self, auth, accountUid, currency):
         """ This function builds and sends a default savings goal
@@ -159,88 +549,46 @@ class RequestBuilder:
         Returns:
             Response: response from https request
         """
-        self.build_header(auth)
-        url = self.build_savings_url(accountUid)
-        data = {
-            "name": "New Savings Goal",
-            "currency": currency,
-            
-            "target": {
-                "currency": currency,
-                "minorUnits": 100000
-            },
-            "base64EncodedPhoto": "string"
-            }
-        self.__headers['Content-Type'] = 'application/json'
-        return self.http.request('PUT',
-                        url,
-                        headers = self.__headers,
-                        body=json.dumps(data),
-                        retries = False)
-
-    def add_days(self, date, days):
-        """Add days to date and return as date"""
-        return date + datetime.timedelta(days=days)
+        return self.send_request(CREATE_GOAL, 'PUT',
+                        self.build_savings_url(accountUid),
+                        headers = self.build_header(auth, 'application/json'),
+                        body=self.build_savings_body(currency))
 
-    def time_parser(self, date, addDays):
-        """ Given a date and a modifier in days return a timer suitable for API request (ISO)
+    def create_savings_goal(self, auth, accountUid, currency):
+        """ Create the default savings goal. The new goal's savingsGoalUid is in the response,
+        so the goal list does not need to be fetched again
 
         Args:
-            date (_type_): _description_
-            addDays (_type_, optional): _description_. Defaults to None.
+            auth (string): auth token
+            accountUid (string): account UUID
+            currency (string): currency identifier
 
         Raises:
-            Value Error: Raise value error if user returns a badly formatted Date
+            AccountException: if Starling refused to create the goal
 
         Returns:
-            date: a date in ISO format
+            Response: response holding the savingsGoalUid
         """
-        date_split = date.split('-')
-        try:
-            if len(date_split) != 3:
-                raise ValueError            
-            new_date = self.add_days(datetime.datetime.strptime(date, "%Y-%m-%d"), addDays)
-            days = new_date.day
-            month = new_date.month
-            year  = new_date.year
-        except:
-            raise DateFormatException(date)
-        return datetime.datetime(year, month, days, 0, 0, 0, 000).isoformat() + ".000Z"
-
-    def response_builder(self, status_code, body=None):
-        """ Builds response message
-
-        Args:
-            status_code (int): Status code from REST API doc
-            body (str): Message payload. Defaults to None.
+        return self.check_response(self.send_put_savings_request(auth, accountUid, currency))
 
-        Returns:
-            response: built response
-        """
-        response = {
-                    'statusCode': status_code,
-                    'headers': {
-                    'Content-Type': 'application/json',
-                    'Access-Control-Allow-Origin': '*'
-                    }
-                }
-        if body is not None:
-            response['body'] = json.dumps(body)
-        return response
 
-    def get_savingsGoalUid(self, num_goals, auth, accountUid, currency):
-        """If no savings ID supplied get one.
-        If one exists, take first, otherwise create a new request
+_shared_builder = None
+_shared_lock = threading.Lock()
 
-        Args:
-            num_goals (int): number of goals user has
-            auth (string): auth token
-            accountUid (string): account UUID
-            currency (string): currency identifier
+def get_builder():
+    """ Return the process-wide RequestBuilder, creating it on first use.
+    The builder lives at module level so warm Lambda invocations reuse its keep-alive
+    connections instead of repeating the TCP and TLS handshake. After an idle period the
+    stale connections are dropped, so the next request opens a fresh one instead of
+    failing on a socket the server has closed
 
-        Returns:
-            _type_: _description_
-        """
-        if num_goals == 0:
-            self.send_put_savings_request(auth, accountUid, currency)
-        return self.send_get_savings_request(auth, accountUid)
+    Returns:
+        RequestBuilder: shared builder
+    """
+    global _shared_builder
+    with _shared_lock:
+        if _shared_builder is None:
+            _shared_builder = RequestBuilder()
+        else:
+            _shared_builder.evict_idle()
+        return _shared_builder
@@ -0,0 +1,164 @@
+# Profiling of single invocations. cProfile, pstats and tracemalloc are only imported when an
+# invocation is profiled, so the hook costs one check when it is off.
+import os
+import threading
+import time
+
+PROFILE = os.environ.get('PROFILE', 'off').lower()              # off, param (invocations with profile=true) or all
+PROFILE_OUTPUT = os.environ.get('PROFILE_OUTPUT', 'log')        # log (stdout, so CloudWatch Logs) or a file to append to
+PROFILE_TOP = int(os.environ.get('PROFILE_TOP', '20'))          # Functions and allocation sites reported
+PROFILE_MEMORY = os.environ.get('PROFILE_MEMORY', 'true').lower() == 'true'   # Also trace allocations, slower
+PROFILE_PARAM = 'profile'
+STAGE_MODULES = {'path.py': 'path', 'async_path.py': 'async_path', 'user.py': 'user'}   # RequestBuilder and User
+active = threading.Lock()       # threading.setprofile and tracemalloc are process-wide, so one profile at a time
+
+
+class NullProfiler:
+    """Context manager which does nothing, returned when an invocation is not profiled"""
+    report = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+NULL_PROFILER = NullProfiler()
+
+
+class Profiler:
+    """
+    This class profiles the code inside it with cProfile, and tracemalloc when memory is True.
+
+    cProfile only sees the thread that enabled it, so every thread started inside (the
+    request graph and range workers) gets its own profile and they are merged at the end.
+    On exit the report is written as one JSON line: the top functions by own time, the
+    top allocation sites, and the time spent in each RequestBuilder and User function.
+
+    Example:
+    with Profiler(label=context.aws_request_id):
+        status, body = round_up(...)
+    """
+    def __init__(self, label=None, top=PROFILE_TOP, memory=PROFILE_MEMORY, output=PROFILE_OUTPUT, release=None):
+        self.__label = label
+        self.__top = top
+        self.__memory = memory
+        self.__output = output
+        self.__release = release        # Called on exit, e.g. to release the lock taken by profile
+        self.report = None
+
+    def __enter__(self):
+        import cProfile
+        self.__cprofile = cProfile
+        self.__lock = threading.Lock()
+        self.__profiles = [cProfile.Profile()]
+        self.__traced = False
+        if self.__memory:
+            import tracemalloc
+            self.__traced = not tracemalloc.is_tracing()
+            if self.__traced:
+                tracemalloc.start()
+        threading.setprofile(self.start_thread)
+        self.__start = time.perf_counter()
+        self.__profiles[0].enable()
+        return self
+
+    def start_thread(self, frame, event, arg):
+        """ Profile function of new threads: replaces itself with a profile of the thread """
+        profile = self.__cprofile.Profile()
+        with self.__lock:
+            self.__profiles.append(profile)
+        profile.enable()
+
+    def __exit__(self, *exc):
+        try:
+            self.__profiles[0].disable()
+            seconds = time.perf_counter() - self.__start
+            threading.setprofile(None)
+            snapshot = peak = None
+            if self.__traced:
+                import tracemalloc
+                snapshot = tracemalloc.take_snapshot()
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+            self.report = self.build_report(seconds, snapshot, peak)
+            self.write(self.report)
+        finally:
+            if self.__release is not None:
+                self.__release()
+        return False
+
+    def build_report(self, seconds, snapshot=None, peak=None):
+        """ Summarise the profiles
+
+        Args:
+            seconds (float): wall time inside the profiler
+            snapshot (tracemalloc.Snapshot): allocations at the end, if traced. Defaults to None.
+            peak (int): peak traced bytes, if traced. Defaults to None.
+
+        Returns:
+            dict: label, seconds, threads, functions, stages and, if traced, allocations and peak_kib
+        """
+        import pstats
+        with self.__lock:
+            profiles = list(self.__profiles)
+        stats = pstats.Stats(*profiles)      # Threads have finished, their profiles are complete
+        entries = []
+        stages = {}
+        for (filename, line, name), (_, calls, own, cumulative, _) in stats.stats.items():
+            location = short_path(filename) + ":" + str(line) + "(" + name + ")"
+            entries.append((own, {"function": location, "calls": calls,
+                                  "own_ms": round(own * 1000, 3), "cumulative_ms": round(cumulative * 1000, 3)}))
+            module = STAGE_MODULES.get(os.path.basename(filename))
+            if module is not None:
+                stages[module + "." + name] = {"calls": calls, "cumulative_ms": round(cumulative * 1000, 3)}
+        entries.sort(key=lambda entry: entry[0], reverse=True)
+        report = {
+            "profile": self.__label,
+            "seconds": round(seconds, 6),
+            "threads": len(profiles),
+            "functions": [entry for _, entry in entries[:self.__top]],
+            "stages": dict(sorted(stages.items(), key=lambda item: item[1]["cumulative_ms"], reverse=True)),
+        }
+        if snapshot is not None:
+            import tracemalloc
+            snapshot = snapshot.filter_traces([tracemalloc.Filter(False, tracemalloc.__file__)])
+            report["allocations"] = [{"site": short_path(stat.traceback[0].filename) + ":" + str(stat.traceback[0].lineno),
+                                      "kib": round(stat.size / 1024, 1), "count": stat.count}
+                                     for stat in snapshot.statistics('lineno')[:self.__top]]
+            report["peak_kib"] = round(peak / 1024, 1)
+        return report
+
+    def write(self, report):
+        """ Write the report as one JSON line to stdout or the output file """
+        import json
+        line = json.dumps(report) + "\n"
+        if self.__output == 'log':
+            import sys
+            sys.stdout.write(line)
+        else:
+            with open(self.__output, 'a') as output:
+                output.write(line)
+
+
+def short_path(filename):
+    """Last two parts of a path, enough to tell app modules from libraries"""
+    return "/".join(filename.replace("\\", "/").split("/")[-2:])
+
+
+def profile(requested=False, label=None):
+    """ Profiler for an invocation, or NULL_PROFILER if it is not profiled.
+    Concurrent invocations (e.g. threads of server.py) would share the process-wide hooks,
+    so while one invocation is profiled the others are not
+
+    Args:
+        requested (bool): the invocation asked to be profiled with profile=true
+        label (string): identifies the invocation in the report e.g. the request id. Defaults to None.
+
+    Returns:
+        Profiler or NullProfiler: context manager around the invocation
+    """
+    if (PROFILE == 'all' or (PROFILE == 'param' and requested)) and active.acquire(blocking=False):
+        return Profiler(label, PROFILE_TOP, PROFILE_MEMORY, PROFILE_OUTPUT, active.release)
+    return NULL_PROFILER
@@ -0,0 +1,360 @@
+from collections import OrderedDict
+import datetime
+import os
+import random
+import threading
+import time
+
+RETRY_ATTEMPTS = int(os.environ.get('RETRY_ATTEMPTS', '3'))             # Attempts per request, including the first
+RETRY_BASE_DELAY = float(os.environ.get('RETRY_BASE_DELAY', '0.1'))     # Seconds, doubled every attempt
+RETRY_MAX_DELAY = float(os.environ.get('RETRY_MAX_DELAY', '2'))         # Longest single wait, including Retry-After
+BREAKER_THRESHOLD = int(os.environ.get('BREAKER_THRESHOLD', '5'))       # Failures in a row before the circuit opens
+BREAKER_RESET = float(os.environ.get('BREAKER_RESET', '30'))            # Seconds before a trial request is let through
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+RATE_LIMIT = float(os.environ.get('RATE_LIMIT', '0'))                   # Requests per second from this process, 0 = no limit
+RATE_BURST = int(os.environ.get('RATE_BURST', '10'))                    # Requests sent at once before pacing starts
+TOKEN_RATE_LIMIT = float(os.environ.get('TOKEN_RATE_LIMIT', '0'))       # Requests per second per token, 0 = only what Starling reports
+TOKEN_RATE_BURST = int(os.environ.get('TOKEN_RATE_BURST', '5'))
+RATE_RESERVE = float(os.environ.get('RATE_RESERVE', '1'))               # Tokens of each bucket only transfers may take
+MIN_RATE = 0.1                  # Slowest pace adapted to, in requests per second
+MAX_TOKEN_BUCKETS = 4096
+TOO_MANY_REQUESTS = 429
+
+
+class RetryPolicy:
+    """
+    This class decides whether a request is retried and how long to wait first.
+
+    Waits use exponential backoff with full jitter, unless the server sent Retry-After
+    (e.g. with a 429), which is respected up to max_delay.
+
+    Example:
+    policy = RetryPolicy(max_attempts=3)
+    if policy.should_retry(attempt, response=response):
+        time.sleep(policy.backoff(attempt, response))
+    """
+    def __init__(self, max_attempts=RETRY_ATTEMPTS, base_delay=RETRY_BASE_DELAY, max_delay=RETRY_MAX_DELAY,
+                 retry_statuses=RETRY_STATUSES):
+        self.__max_attempts = max_attempts
+        self.__base_delay = base_delay
+        self.__max_delay = max_delay
+        self.__retry_statuses = retry_statuses
+
+    def get_max_attempts(self):
+        return self.__max_attempts
+
+    def should_retry(self, attempt, response=None, error=None):
+        """ Decide if another attempt should be made
+
+        Args:
+            attempt (int): number of the attempt that just finished, starting at 0
+            response (HTTPResponse): response of that attempt, if any
+            error (Exception): connection error of that attempt, if any
+
+        Returns:
+            bool: True if the request should be sent again
+        """
+        if attempt + 1 >= self.__max_attempts:
+            return False
+        if error is not None:
+            return True
+        return response is not None and response.status in self.__retry_statuses
+
+    def backoff(self, attempt, response=None):
+        """ Seconds to wait before the next attempt
+
+        Args:
+            attempt (int): number of the attempt that just finished, starting at 0
+            response (HTTPResponse): response of that attempt, if any
+
+        Returns:
+            float: delay in seconds
+        """
+        retry_after = parse_retry_after(response)
+        if retry_after is not None:
+            return min(retry_after, self.__max_delay)
+        return random.uniform(0, min(self.__max_delay, self.__base_delay * 2 ** attempt))
+
+
+def parse_retry_after(response):
+    """ Read a Retry-After header in seconds or as an HTTP date
+
+    Args:
+        response (HTTPResponse): response, may be None
+
+    Returns:
+        float: seconds to wait, or None if there is no valid header
+    """
+    if response is None or response.headers is None:
+        return None
+    value = response.headers.get('Retry-After')
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    from email.utils import parsedate_to_datetime      # Slow to import and rarely needed
+    try:
+        when = parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, (when - datetime.datetime.now(datetime.timezone.utc)).total_seconds())
+
+
+class CircuitBreaker:
+    """
+    This class stops requests to an endpoint which keeps failing.
+
+    After threshold failures in a row the circuit opens and requests fail fast. Once
+    reset_timeout has passed a single trial request is allowed (half open); success closes
+    the circuit again and failure re-opens it.
+    """
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half_open'
+
+    def __init__(self, threshold=BREAKER_THRESHOLD, reset_timeout=BREAKER_RESET):
+        self.__threshold = threshold
+        self.__reset_timeout = reset_timeout
+        self.__failures = 0
+        self.__opened_at = None
+        self.__trial_running = False
+        self.__lock = threading.Lock()
+
+    def get_state(self):
+        with self.__lock:
+            return self.state()
+
+    def state(self):
+        """Current state, the lock must be held"""
+        if self.__opened_at is None:
+            return self.CLOSED
+        if time.monotonic() - self.__opened_at >= self.__reset_timeout:
+            return self.HALF_OPEN
+        return self.OPEN
+
+    def allow(self):
+        """ Return True if a request may be sent now """
+        with self.__lock:
+            state = self.state()
+            if state == self.CLOSED:
+                return True
+            if state == self.HALF_OPEN and not self.__trial_running:
+                self.__trial_running = True
+                return True
+            return False
+
+    def record_success(self):
+        with self.__lock:
+            self.__failures = 0
+            self.__opened_at = None
+            self.__trial_running = False
+
+    def record_failure(self):
+        with self.__lock:
+            self.__failures += 1
+            if self.__trial_running or self.__failures >= self.__threshold:
+                self.__opened_at = time.monotonic()
+            self.__trial_running = False
+
+    def release(self):
+        """ End a request which got no answer, e.g. one cancelled, so a half open circuit allows another trial """
+        with self.__lock:
+            self.__trial_running = False
+
+
+class TokenBucket:
+    """
+    This class paces requests: a request takes a token, and tokens refill at rate per second
+    up to burst.
+
+    A rate of None means no limit until adapt sets one from the server's quota. pause
+    holds every request back for a time, e.g. for the Retry-After of a 429.
+    """
+    def __init__(self, rate, burst):
+        self.__max_rate = rate
+        self.__rate = rate
+        self.__burst = burst
+        self.__tokens = float(burst)
+        self.__updated = time.monotonic()
+        self.__paused_until = 0.0
+
+    def get_rate(self):
+        return self.__rate
+
+    def refill(self, now):
+        if now <= self.__updated:       # Bucket created after now was read
+            return
+        if self.__rate is not None:
+            self.__tokens = min(self.__burst, self.__tokens + (now - self.__updated) * self.__rate)
+        self.__updated = now
+
+    def wait_time(self, now, reserve=0.0):
+        """ Seconds until a token is free, leaving reserve tokens in the bucket
+
+        Args:
+            now (float): time.monotonic()
+            reserve (float): tokens the request may not take. Defaults to 0.
+
+        Returns:
+            float: 0 if a token can be taken now
+        """
+        self.refill(now)
+        wait = max(0.0, self.__paused_until - now)
+        if self.__rate is None:
+            return wait
+        missing = 1 + min(reserve, self.__burst - 1) - self.__tokens
+        return max(wait, missing / self.__rate)
+
+    def take(self):
+        if self.__rate is not None:
+            self.__tokens -= 1
+
+    def pause(self, seconds):
+        """ Hold requests back for seconds from now """
+        self.__paused_until = max(self.__paused_until, time.monotonic() + seconds)
+
+    def adapt(self, rate):
+        """ Pace at rate, kept between MIN_RATE and the configured rate """
+        if self.__max_rate is not None:
+            rate = min(rate, self.__max_rate)
+        self.refill(time.monotonic())
+        self.__rate = max(MIN_RATE, rate)
+
+
+def parse_rate_limit(response):
+    """ Rate that spends the remaining quota evenly until it resets, from X-RateLimit headers
+
+    Args:
+        response (HTTPResponse): response, may be None
+
+    Returns:
+        (float, float): requests per second and seconds until the quota resets, or None if not sent
+    """
+    if response is None or response.headers is None:
+        return None
+    try:
+        remaining = float(response.headers['X-RateLimit-Remaining'])
+        reset = float(response.headers['X-RateLimit-Reset'])
+    except (KeyError, TypeError, ValueError):
+        return None
+    if reset > 10 ** 9:                 # Epoch seconds rather than seconds from now
+        reset -= time.time()
+    reset = max(reset, 1.0)
+    return remaining / reset, reset
+
+
+class RateLimiter:
+    """
+    This class schedules requests to Starling under a global token bucket and a bucket per token.
+
+    A request waits until both buckets have a token. Reads leave RATE_RESERVE tokens in
+    each bucket, so when the quota is nearly spent the add-money transfers, which finish a
+    round up, go first. Each token's rate follows the X-RateLimit-Remaining and
+    X-RateLimit-Reset headers of its responses, and a 429 pauses the token for its
+    Retry-After, so a batch runs at the quota rather than into it.
+
+    Example:
+    limiter = RateLimiter(rate=50, token_rate=5)
+    limiter.acquire(headers['Authorization'], priority=endpoint == TRANSFER)
+    response = send()
+    limiter.update(headers['Authorization'], response)
+    """
+    def __init__(self, rate=RATE_LIMIT, burst=RATE_BURST, token_rate=TOKEN_RATE_LIMIT, token_burst=TOKEN_RATE_BURST,
+                 reserve=RATE_RESERVE):
+        self.__global = TokenBucket(rate, burst) if rate > 0 else None
+        self.__token_rate = token_rate if token_rate > 0 else None
+        self.__token_burst = token_burst
+        self.__reserve = reserve
+        self.__buckets = OrderedDict()
+        self.__lock = threading.Lock()
+
+    def bucket(self, key):
+        """Bucket of a token, the lock must be held"""
+        bucket = self.__buckets.get(key)
+        if bucket is None:
+            bucket = self.__buckets[key] = TokenBucket(self.__token_rate, self.__token_burst)
+            if len(self.__buckets) > MAX_TOKEN_BUCKETS:
+                self.__buckets.popitem(last=False)
+        else:
+            self.__buckets.move_to_end(key)
+        return bucket
+
+    def delay(self, key, priority=False):
+        """ Take a token from both buckets if they have one, otherwise say how long to wait
+
+        Args:
+            key (string): the request's Authorization header
+            priority (bool): True for transfers, which may use the reserve. Defaults to False.
+
+        Returns:
+            float: 0 if the request may be sent now, otherwise seconds before asking again
+        """
+        reserve = 0.0 if priority else self.__reserve
+        with self.__lock:
+            now = time.monotonic()
+            buckets = [self.bucket(key)] if self.__global is None else [self.__global, self.bucket(key)]
+            wait = max(bucket.wait_time(now, reserve) for bucket in buckets)
+            if wait == 0:
+                for bucket in buckets:
+                    bucket.take()
+            return wait
+
+    def acquire(self, key, priority=False):
+        """ Block until the request may be sent
+
+        Returns:
+            float: seconds waited
+        """
+        waited = 0.0
+        wait = self.delay(key, priority)
+        while wait > 0:
+            time.sleep(wait)
+            waited += wait
+            wait = self.delay(key, priority)
+        return waited
+
+    async def acquire_async(self, key, priority=False):
+        """ acquire for coroutines, sleeping on the event loop """
+        import asyncio      # Only the async backend pays for the import
+        waited = 0.0
+        wait = self.delay(key, priority)
+        while wait > 0:
+            await asyncio.sleep(wait)
+            waited += wait
+            wait = self.delay(key, priority)
+        return waited
+
+    def update(self, key, response):
+        """ Adapt the token's pace to a response
+
+        Args:
+            key (string): the request's Authorization header
+            response (HTTPResponse or AsyncResponse): response received
+        """
+        quota = parse_rate_limit(response)
+        retry_after = parse_retry_after(response) if response.status == TOO_MANY_REQUESTS else None
+        with self.__lock:
+            bucket = self.bucket(key)
+            if quota is not None:
+                rate, reset = quota
+                if rate == 0:
+                    bucket.pause(reset)     # Quota spent, nothing is sent until it resets
+                else:
+                    bucket.adapt(rate)
+            if response.status == TOO_MANY_REQUESTS:
+                if quota is None and bucket.get_rate() is not None:
+                    bucket.adapt(bucket.get_rate() / 2)
+                bucket.pause(retry_after if retry_after is not None else 1.0)
+
+
+def build_limiter():
+    """ Create the RateLimiter configured by RATE_LIMIT and TOKEN_RATE_LIMIT
+
+    Returns:
+        RateLimiter, or None if neither is set
+    """
+    if RATE_LIMIT > 0 or TOKEN_RATE_LIMIT > 0:
+        return RateLimiter()
+    return None
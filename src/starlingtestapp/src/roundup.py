@@ -0,0 +1,74 @@
+OUT = 'OUT'
+SETTLED = 'SETTLED'
+ROUND_TO = 100
+
+
+def round_up_amount(minor_units):
+    """ Round up needed to take an amount to the next multiple of 100.
+    Integer arithmetic only, so it is exact for any size of minorUnits
+
+    Args:
+        minor_units (int): transaction amount in minor units
+
+    Returns:
+        int: difference to the next multiple of 100, 0 if already a multiple
+    """
+    return -minor_units % ROUND_TO
+
+
+class RoundUpAccumulator:
+    """
+    This class keeps a running round up total over feed items.
+
+    Only outgoing, settled transactions are counted. Items can be added one at a time
+    (e.g. while a feed is being parsed) or as a whole list in a single pass.
+
+    Example:
+    accumulator = RoundUpAccumulator()
+    accumulator.extend(response['feedItems'])
+    accumulator.add('OUT', 'SETTLED', 435)
+    accumulator.get_total()
+    """
+    __slots__ = ('__total', '__count')
+
+    def __init__(self):
+        self.__total = 0
+        self.__count = 0
+
+    def add(self, direction, status, minor_units):
+        """ Add a single transaction
+
+        Args:
+            direction (string): IN or OUT
+            status (string): status of the transaction e.g. SETTLED
+            minor_units (int): amount in minor units
+
+        Returns:
+            bool: True if the transaction was counted
+        """
+        if direction == OUT and status == SETTLED:
+            self.__total += round_up_amount(minor_units)
+            self.__count += 1
+            return True
+        return False
+
+    def extend(self, feed_items):
+        """ Add a list of feed items from the Starling API in one pass
+
+        Args:
+            feed_items (list): feedItems from a transactions response
+        """
+        total = 0
+        count = 0
+        for item in feed_items:
+            if item['direction'] == OUT and item['status'] == SETTLED:
+                total += round_up_amount(item['amount']['minorUnits'])
+                count += 1
+        self.__total += total
+        self.__count += count
+
+    def get_total(self):
+        return self.__total
+
+    def get_count(self):
+        return self.__count
@@ -0,0 +1,262 @@
+"""Standalone round up server for Linux hosts, outside Lambda.
+
+Answers the same PUT /round requests as the API Gateway endpoint in template.yaml by
+turning each into an API Gateway proxy event for app.lambda_handler. A parent process
+listens and pre-forks SERVER_WORKERS worker processes which accept from the shared
+socket. Each worker keeps its RequestBuilder, connection pools and caches warm across
+requests and runs SERVER_THREADS requests at a time; when SERVER_QUEUE_SIZE more are
+waiting, further requests are answered 503 straight away. SIGTERM or SIGINT drains the
+requests already accepted before the workers exit.
+
+    python src/server.py --port 8080 --workers 4
+"""
+from http.server import BaseHTTPRequestHandler, HTTPServer
+from urllib.parse import urlsplit, parse_qsl
+import argparse
+import json
+import multiprocessing
+import os
+import queue
+import signal
+import socket
+import sys
+import threading
+import traceback
+import uuid
+
+SERVER_HOST = os.environ.get('SERVER_HOST', '127.0.0.1')
+SERVER_PORT = int(os.environ.get('SERVER_PORT', '8080'))
+SERVER_WORKERS = int(os.environ.get('SERVER_WORKERS', str(os.cpu_count() or 1)))   # Worker processes
+SERVER_THREADS = int(os.environ.get('SERVER_THREADS', '8'))            # Requests handled at once per worker
+SERVER_QUEUE_SIZE = int(os.environ.get('SERVER_QUEUE_SIZE', '64'))     # Requests waiting per worker before 503s
+SHUTDOWN_TIMEOUT = float(os.environ.get('SERVER_SHUTDOWN_TIMEOUT', '30'))   # Seconds to drain before workers are killed
+REQUEST_TIMEOUT = 60           # Seconds a client may take to send its request
+ROUTES = ('/round', '/round/')
+STOP_SIGNALS = {signal.SIGTERM, signal.SIGINT}
+BUSY_BODY = json.dumps({"error": "Server is busy"}).encode('utf-8')
+BUSY_RESPONSE = (b"HTTP/1.0 503 Service Unavailable\r\nContent-Type: application/json\r\nRetry-After: 1\r\n"
+                 b"Content-Length: " + str(len(BUSY_BODY)).encode('ascii') + b"\r\nConnection: close\r\n\r\n" + BUSY_BODY)
+ERROR_RESPONSE = {'statusCode': 502, 'headers': {'Content-Type': 'application/json'},     # API Gateway's answer
+                  'body': json.dumps({"message": "Internal server error"})}               # when the handler raises
+
+
+class Context:
+    """Stand-in for the Lambda context, with the attributes the handler reads"""
+    def __init__(self):
+        self.aws_request_id = str(uuid.uuid4())
+
+
+def build_event(method, target, headers, body):
+    """ Build the API Gateway proxy event of a request
+
+    Args:
+        method (string): HTTP method
+        target (string): path and query string
+        headers (dict): request headers
+        body (bytes): request body
+
+    Returns:
+        dict: event as API Gateway passes it to lambda_handler
+    """
+    parts = urlsplit(target)
+    return {
+        'httpMethod': method,
+        'path': parts.path,
+        'queryStringParameters': dict(parse_qsl(parts.query)) or None,
+        'headers': headers,
+        'body': body.decode('utf-8') if body else None,
+    }
+
+
+class RoundUpHandler(BaseHTTPRequestHandler):
+    """
+    This class answers one request on a worker thread. PUT /round goes to app.lambda_handler,
+    anything else gets API Gateway's answer for a route that does not exist.
+    """
+    server_version = "StarlingRoundUp"
+    timeout = REQUEST_TIMEOUT
+
+    def handle_request(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        if self.command == 'PUT' and urlsplit(self.path).path in ROUTES:
+            import app
+            event = build_event(self.command, self.path, dict(self.headers), body)
+            try:
+                response = app.lambda_handler(event, Context())
+            except Exception:
+                traceback.print_exc()
+                response = ERROR_RESPONSE
+        else:
+            response = {'statusCode': 403, 'headers': {'Content-Type': 'application/json'},
+                        'body': json.dumps({"message": "Missing Authentication Token"})}
+        data = (response.get('body') or '').encode('utf-8')
+        self.send_response(response['statusCode'])
+        for name, value in (response.get('headers') or {}).items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    do_GET = do_PUT = do_POST = do_DELETE = do_PATCH = handle_request
+
+    def log_message(self, format, *args):
+        pass
+
+
+class WorkerServer(HTTPServer):
+    """
+    This class serves a listening socket shared with other worker processes.
+
+    The accept loop hands connections to a fixed pool of threads through a bounded queue.
+    A connection that finds the queue full is answered 503 by the accept loop itself,
+    so a saturated worker sheds load instead of queueing without limit.
+    """
+    def __init__(self, listener, threads=SERVER_THREADS, queue_size=SERVER_QUEUE_SIZE):
+        super().__init__(listener.getsockname()[:2], RoundUpHandler, bind_and_activate=False)
+        self.socket.close()
+        self.socket = listener
+        self.__queue = queue.Queue(queue_size)
+        self.__threads = [threading.Thread(target=self.work, daemon=True) for _ in range(threads)]
+        for thread in self.__threads:
+            thread.start()
+
+    def get_request(self):
+        request, client_address = self.socket.accept()
+        request.setblocking(True)           # The shared listener is non-blocking, connections are not
+        return request, client_address
+
+    def process_request(self, request, client_address):
+        try:
+            self.__queue.put_nowait((request, client_address))
+        except queue.Full:
+            self.reject(request)
+
+    def reject(self, request):
+        """ Answer 503 without reading the request """
+        try:
+            request.sendall(BUSY_RESPONSE)
+        except OSError:
+            pass
+        self.shutdown_request(request)
+
+    def work(self):
+        while True:
+            item = self.__queue.get()
+            if item is None:
+                return
+            request, client_address = item
+            try:
+                self.finish_request(request, client_address)
+            except Exception:
+                self.handle_error(request, client_address)
+            finally:
+                self.shutdown_request(request)
+
+    def drain(self, timeout=SHUTDOWN_TIMEOUT):
+        """ Finish the requests already accepted, then stop the threads """
+        for _ in self.__threads:
+            self.__queue.put(None)          # After every queued request
+        for thread in self.__threads:
+            thread.join(timeout)
+
+    def server_close(self):
+        pass                                # The listening socket belongs to every worker
+
+
+def run_worker(listener, threads=SERVER_THREADS, queue_size=SERVER_QUEUE_SIZE):
+    """ Worker process: serve the shared socket until SIGTERM, then drain and exit """
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda signum, frame: stopping.set())
+    signal.signal(signal.SIGINT, signal.SIG_IGN)      # The parent turns Ctrl-C into SIGTERM
+    signal.pthread_sigmask(signal.SIG_UNBLOCK, STOP_SIGNALS)     # A SIGTERM sent while starting arrives now
+    import app
+    app.get_builder()                       # Warm before the first request
+    server = WorkerServer(listener, threads, queue_size)
+
+    def stop():
+        stopping.wait()
+        server.shutdown()
+
+    threading.Thread(target=stop, daemon=True).start()
+    server.serve_forever(poll_interval=0.5)
+    server.drain()
+    from metrics import recorder
+    recorder.flush()
+
+
+def create_listener(host=SERVER_HOST, port=SERVER_PORT):
+    """ Listening socket shared by the workers, non-blocking so a worker that loses the race to
+    accept a connection goes back to waiting """
+    listener = socket.create_server((host, port), backlog=1024)
+    listener.setblocking(False)
+    return listener
+
+
+class Supervisor:
+    """
+    This class pre-forks the workers, replaces any that die and stops them all on SIGTERM or SIGINT.
+
+    Example:
+    Supervisor(create_listener(port=8080), workers=4).run()
+    """
+    def __init__(self, listener, workers=SERVER_WORKERS, threads=SERVER_THREADS, queue_size=SERVER_QUEUE_SIZE,
+                 shutdown_timeout=SHUTDOWN_TIMEOUT):
+        self.__listener = listener
+        self.__workers = workers
+        self.__threads = threads
+        self.__queue_size = queue_size
+        self.__shutdown_timeout = shutdown_timeout
+        self.__context = multiprocessing.get_context('fork')      # Workers inherit the listening socket
+        self.__processes = []
+        self.__stopping = threading.Event()
+
+    def start_worker(self):
+        """ Fork a worker. The stop signals are blocked across the fork, so one sent before the worker
+        has its own handler waits for it instead of reaching the handler inherited from this process """
+        process = self.__context.Process(target=run_worker, args=(self.__listener, self.__threads, self.__queue_size),
+                                         daemon=True)
+        signal.pthread_sigmask(signal.SIG_BLOCK, STOP_SIGNALS)
+        try:
+            process.start()
+        finally:
+            signal.pthread_sigmask(signal.SIG_UNBLOCK, STOP_SIGNALS)
+        return process
+
+    def stop(self, *args):
+        self.__stopping.set()
+
+    def run(self):
+        """ Serve until SIGTERM or SIGINT, then wait for the workers to drain """
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+        self.__processes = [self.start_worker() for _ in range(self.__workers)]
+        while not self.__stopping.wait(1.0):
+            for index, process in enumerate(self.__processes):
+                if not process.is_alive():                      # Crashed, keep the pool full
+                    self.__processes[index] = self.start_worker()
+        for process in self.__processes:
+            process.terminate()                                 # SIGTERM, each worker drains
+        for process in self.__processes:
+            process.join(self.__shutdown_timeout)
+            if process.is_alive():
+                process.kill()
+        self.__listener.close()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default=SERVER_HOST)
+    parser.add_argument('--port', type=int, default=SERVER_PORT)
+    parser.add_argument('--workers', type=int, default=SERVER_WORKERS, help="worker processes")
+    parser.add_argument('--threads', type=int, default=SERVER_THREADS, help="requests handled at once per worker")
+    parser.add_argument('--queue-size', type=int, default=SERVER_QUEUE_SIZE, help="requests waiting per worker before 503s")
+    args = parser.parse_args()
+    listener = create_listener(args.host, args.port)
+    print("Round up server on http://%s:%d with %d workers" % (args.host, listener.getsockname()[1], args.workers))
+    sys.stdout.flush()
+    Supervisor(listener, args.workers, args.threads, args.queue_size).run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,108 @@
+import functools
+import os
+import threading
+
+SINGLE_FLIGHT = os.environ.get('SINGLE_FLIGHT', 'true').lower() == 'true'   # Share identical requests in flight
+
+
+class Call:
+    """
+    This class holds the outcome of a call that other threads are waiting for.
+    """
+    __slots__ = ('done', 'value', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.value = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    This class lets concurrent threads asking for the same key share a single call.
+
+    The first thread runs fetch, the others wait for its value or exception. The key is
+    forgotten as soon as the call returns, so nothing is cached here: a later caller starts
+    a new call (the metadata cache decides how long values are kept).
+    """
+    def __init__(self):
+        self.__calls = {}
+        self.__lock = threading.Lock()
+
+    def do(self, key, fetch):
+        """ Call fetch, or wait for the call already running for key
+
+        Args:
+            key (string): identifies the request e.g. a cache_key
+            fetch (callable): returns the value
+
+        Raises:
+            Exception: whatever fetch raised, in the caller and in every waiter
+
+        Returns:
+            (value, bool): the value and whether it was shared from another caller's call
+        """
+        with self.__lock:
+            call = self.__calls.get(key)
+            leader = call is None
+            if leader:
+                call = self.__calls[key] = Call()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.value, True
+        try:
+            call.value = fetch()
+        except BaseException as exc:
+            call.error = exc
+            raise
+        finally:
+            with self.__lock:
+                del self.__calls[key]
+            call.done.set()
+        return call.value, False
+
+    def __len__(self):
+        return len(self.__calls)
+
+
+class AsyncSingleFlight:
+    """
+    This class is SingleFlight for coroutines on one event loop.
+
+    The call runs as a task, so a cancelled caller does not cancel it for the others.
+    """
+    def __init__(self):
+        self.__tasks = {}
+
+    async def do(self, key, fetch):
+        """ Await fetch, or the call already running for key
+
+        Args:
+            key (string): identifies the request e.g. a cache_key
+            fetch (callable): returns an awaitable of the value
+
+        Returns:
+            (value, bool): the value and whether it was shared from another caller's call
+        """
+        import asyncio      # Only the async backend pays for the import
+        task = self.__tasks.get(key)
+        shared = task is not None and task.get_loop() is asyncio.get_running_loop()
+        if not shared:
+            task = asyncio.ensure_future(fetch())
+            self.__tasks[key] = task
+            task.add_done_callback(functools.partial(self.forget, key))
+        return await asyncio.shield(task), shared
+
+    def forget(self, key, task):
+        """ Drop a finished task, unless a newer call for the key has replaced it """
+        if self.__tasks.get(key) is task:
+            del self.__tasks[key]
+
+    def __len__(self):
+        return len(self.__tasks)
+
+
+flights = SingleFlight()
+async_flights = AsyncSingleFlight()
@@ -1,10 +1,31 @@
 from exceptions import GoalNotFoundException
-import math 
+from roundup import RoundUpAccumulator, ROUND_TO
+from metrics import recorder
+
+ELIGIBLE_ACCOUNT_TYPES = ('PRIMARY', 'ADDITIONAL')      # Accounts with a card feed to round up
+
+
+def eligible_accounts(response):
+    """ Every account of an accounts response which can be rounded up, in response order
+
+    Args:
+        response (dict): response from accounts request
+
+    Returns:
+        list: account dicts
+    """
+    return [account for account in response['accounts'] if account.get('accountType') in ELIGIBLE_ACCOUNT_TYPES]
+
 
 class User:
     """User class to encapsulate user infor from requests and functions related to the user
         Related functions are such as round ups and parsing account JSON
+
+        Attributes are kept in __slots__ rather than a per-instance __dict__, so a batch of
+        many users stays small
     """
+    __slots__ = ('__auth', '__savingsGoalUid', '__primary_index', '__accountUid', '__default_category',
+                 '__currency', 'transactions')
 
     def __init__(self, auth, savingsGoalUid):
         """Constructor, set auth token and a savingsGoalUiD
@@ -15,6 +36,11 @@ class User:
         """
         self.__auth = auth
         self.__savingsGoalUid = savingsGoalUid
+        self.__primary_index = None
+        self.__accountUid = None
+        self.__default_category = None
+        self.__currency = None
+        self.transactions = None
 
     def set_primary_account_index(self, json):
         """ Find index of primary account
@@ -27,6 +53,7 @@ class User:
                 self.__primary_index = i
                 break
 
+    @recorder.timed('parse_account')
     def parse_account(self, response):
         """ Parse account response json
 
@@ -34,9 +61,17 @@ class User:
             response (json): response from accounts request
         """
         self.set_primary_account_index(response)
-        self.set_accountUid(response['accounts'][self.__primary_index]['accountUid'])
-        self.set_default_category(response['accounts'][self.__primary_index]['defaultCategory'])
-        self.set_currency(response['accounts'][self.__primary_index]['currency'])
+        self.set_account(response['accounts'][self.__primary_index])
+
+    def set_account(self, account):
+        """ Use one account of an accounts response, e.g. one of eligible_accounts
+
+        Args:
+            account (dict): account from accounts request
+        """
+        self.set_accountUid(account['accountUid'])
+        self.set_default_category(account['defaultCategory'])
+        self.set_currency(account['currency'])
 
     def set_savingsGoalUid(self, savingsGoalUid):
         self.__savingsGoalUid = savingsGoalUid
@@ -67,15 +102,13 @@ class User:
 
     def parse_transaction_out_data(self, response):
         """ Parse transactional data for outgoing and settled transactions.
-        Creates an array of integers of transactiona mounts
+        The handlers do not keep the amounts, round_up_transactions sums them in one pass
 
         Args:
             response (json): json from response
         """
-        self.transactions = []
-        for each in response['feedItems']:
-            if each['direction'] == 'OUT' and each['status'] == 'SETTLED':
-                self.transactions.append(each['amount']['minorUnits'])
+        self.transactions = [each['amount']['minorUnits'] for each in response['feedItems']
+                             if each['direction'] == 'OUT' and each['status'] == 'SETTLED']
 
     def parse_balance_data(self, response):
         """ Function parses cleared balance
@@ -87,33 +120,67 @@ class User:
         balance = response['clearedBalance']['minorUnits']
         return balance
 
-    def search_savings_goals(self, goal_list, savingsUid):
-        """ A function to check savingsUid exists
+    @recorder.timed('search_savings_goals')
+    def search_savings_goals(self, goals, savingsUid):
+        """ A function to check savingsUid exists, with a single lookup
 
         Args:
-            goal_list (list): a list of goals the user has
+            goals (GoalRegistry): the goals the user has
             savingsUid (string): saving UUID
         """
-        for each in goal_list:
-            if each['savingsGoalUid'] == savingsUid:
-                return True
+        if savingsUid in goals:
+            return True
         raise GoalNotFoundException(savingsUid)
 
+    @recorder.timed('round_up_transactions')
     def round_up_transactions(self, response):
-        """" Actual round up functionality
+        """" Actual round up functionality.
+        Filters and rounds up the feed in a single pass with integer arithmetic
+
+        Args:
+            response (dict): response form Starling API
+
+        Returns:
+            int: total round up in minor units
+        """
+        accumulator = RoundUpAccumulator()
+        accumulator.extend(response['feedItems'])
+        return accumulator.get_total()
+
+    @recorder.timed('round_up_feeds')
+    def round_up_feeds(self, feeds):
+        """ Round up several feeds (e.g. windows of a date range), counting each feedItemUid once
+
+        Args:
+            feeds (iterable): lists of feed items
+
+        Returns:
+            int: total round up in minor units
+        """
+        accumulator = RoundUpAccumulator()
+        seen = set()
+        for feed_items in feeds:
+            for item in feed_items:
+                if item['feedItemUid'] not in seen:
+                    seen.add(item['feedItemUid'])
+                    accumulator.add(item['direction'], item['status'], item['amount']['minorUnits'])
+        return accumulator.get_total()
+
+    @recorder.timed('round_up_stream')
+    def round_up_stream(self, feed_items):
+        """ Round up feed items as they are parsed, see feed.iter_feed_items.
+        Only direction, status and amount of each item are kept, so memory stays flat
 
         Args:
-            response (): response form Starling API
+            feed_items (iterable): feed items from the Starling API
 
         Returns:
-            _type_: _description_
+            int: total round up in minor units
         """
-        self.parse_transaction_out_data(response)
-        round_ups = 0
-        for transaction_amount in self.transactions:
-            diff = self.round(transaction_amount) - transaction_amount
-            round_ups = round_ups + diff
-        return round_ups        
+        accumulator = RoundUpAccumulator()
+        for item in feed_items:
+            accumulator.add(item['direction'], item['status'], item['amount']['minorUnits'])
+        return accumulator.get_total()
 
     def round(self, x):
         """Round up to nearest 100. If a multiple of 100 then do not round up.
@@ -124,4 +191,4 @@ class User:
         Returns:
             int: rounded up number
         """
-        return int(math.ceil(x / 100.0)) * 100
\ No newline at end of file
+        return -(-x // ROUND_TO) * ROUND_TO
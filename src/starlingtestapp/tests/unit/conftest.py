@@ -0,0 +1,5 @@
+import os
+import sys
+
+# The lambda modules import each other by name (as they do in the Lambda runtime), so put src on the path
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "..", "src"))
@@ -0,0 +1,358 @@
+import json
+import os
+import subprocess
+import sys
+
+import app
+from cache import TTLCache
+from checkpoint import MemoryCheckpointStore
+from ledger import MemoryLedger
+from exceptions import AccountException
+from path import RequestBuilder
+from .stub_server import StubStarling
+
+ACCOUNT_UID = "acc-1"
+GOAL_UID = "goal-1"
+SRC = os.path.join(os.path.dirname(__file__), "..", "..", "src")
+
+
+class FakeResponse:
+    def __init__(self, status, body):
+        self.status = status
+        self.data = json.dumps(body).encode('utf-8')
+
+
+class FakeBuilder(RequestBuilder):
+    """ RequestBuilder answering from memory instead of the Starling API """
+
+    def __init__(self, feed_items=None):
+        super().__init__()
+        self.feed_items = feed_items if feed_items is not None else [
+            {"feedItemUid": "1", "direction": "OUT", "status": "SETTLED", "amount": {"minorUnits": 435}},
+            {"feedItemUid": "2", "direction": "OUT", "status": "SETTLED", "amount": {"minorUnits": 520}},
+            {"feedItemUid": "3", "direction": "IN", "status": "SETTLED", "amount": {"minorUnits": 87}},
+        ]
+        self.transfers = []
+        self.transfer_uids = []
+        self.transfer_status = 200
+        self.goals = [{"savingsGoalUid": GOAL_UID}]
+        self.accounts = [{"accountType": "PRIMARY", "accountUid": ACCOUNT_UID, "defaultCategory": "cat-1", "currency": "GBP"}]
+        self.balance = 10000
+        self.calls = []
+
+    def send_account_request(self, auth):
+        self.calls.append('accounts')
+        if auth != "good":
+            raise AccountException(FakeResponse(403, {"error": "invalid_token"}))
+        return FakeResponse(200, {"accounts": self.accounts})
+
+    def send_account_balance_request(self, auth, accountUid):
+        self.calls.append('balance')
+        return FakeResponse(200, {"clearedBalance": {"currency": "GBP", "minorUnits": self.balance},
+                                  "effectiveBalance": {"currency": "GBP", "minorUnits": self.balance}})
+
+    def send_transaction_request(self, auth, accountUid, categoryUid, changes_since, stream=False):
+        self.calls.append('feed')
+        self.time_parser(changes_since, 0)
+        return FakeResponse(200, {"feedItems": self.feed_items})
+
+    def send_transactions_between_request(self, auth, accountUid, categoryUid, min_timestamp, max_timestamp, stream=False):
+        self.calls.append('feed')
+        return FakeResponse(200, {"feedItems": [item for item in self.feed_items
+                                                if item.get("transactionTime", min_timestamp) >= min_timestamp]})
+
+    def send_get_savings_request(self, auth, accountUid):
+        self.calls.append('savings')
+        return FakeResponse(200, {"savingsGoalList": self.goals})
+
+    def send_put_savings_request(self, auth, accountUid, currency):
+        self.calls.append('create_goal')
+        return FakeResponse(200, {"savingsGoalUid": "goal-new", "success": True})
+
+    def send_transfer_round_up_request(self, auth, accountUid, savingsGoalUid, currency, amount, transfer_uid=None):
+        self.calls.append('transfer')
+        self.transfers.append((accountUid, savingsGoalUid, currency, amount))
+        self.transfer_uids.append(transfer_uid)
+        return FakeResponse(self.transfer_status, {"success": self.transfer_status == 200})
+
+
+def event(**params):
+    return {app.QUERY_STRING_PARAMETERS: params}
+
+
+class TestRoundUp:
+
+    def test_round_up_transferred(self):
+        builder = FakeBuilder()
+        status, body = app.round_up(event(Authorization="good", date="2022-10-20"), builder)
+
+        assert (status, body) == (200, {"success": True})
+        assert builder.transfers == [(ACCOUNT_UID, GOAL_UID, "GBP", 145)]
+
+    def test_errors_mapped(self):
+        builder = FakeBuilder()
+        assert app.round_up(event(date="2022-10-20"), builder) == (400, {"error": "No auth parameter"})
+        assert app.round_up(event(Authorization="bad", date="20"), builder) == (403, {"error": "invalid_token"})
+        assert app.round_up(event(Authorization="good", date="20"), builder) == (400, {"error": "Date is not in YYYY-MM-DD"})
+        assert app.round_up(event(Authorization="good", date="2022-10-20", savingsGoalUid="nope"), builder) == \
+            (400, {"error": "SavingsGoalUid is invalid."})
+        assert builder.transfers == []
+
+    def test_non_json_errors_mapped(self):
+        """ A gateway's HTML error page is answered, a 5xx that outlasted the retries as unavailable """
+        builder = FakeBuilder()
+        page = FakeResponse(502, None)
+        page.data = b"<html><body>502 Bad Gateway</body></html>"
+
+        def refused(*args, **kwargs):
+            raise AccountException(page)
+
+        builder.send_transaction_request = refused
+        assert app.round_up(event(Authorization="good", date="2022-10-20"), builder) == \
+            (503, {"error": "Starling API is unavailable."})
+        page.status = 403
+        assert app.round_up(event(Authorization="good", date="2022-10-20"), builder) == \
+            (403, {"error": "Starling API answered 403"})
+
+        builder = FakeBuilder()
+        page.status = 502
+        builder.send_transfer_round_up_request = lambda *args: page
+        assert app.round_up(event(Authorization="good", date="2022-10-20"), builder) == \
+            (502, {"error": "Starling API answered 502"})
+
+    def test_created_goal_taken_from_put_response(self):
+        """ A user without goals gets one created, without fetching the goal list again """
+        builder = FakeBuilder()
+        builder.goals = []
+        status, _ = app.round_up(event(Authorization="good", date="2022-10-20"), builder)
+
+        assert status == 200
+        assert builder.calls.count('savings') == 1 and builder.calls.count('create_goal') == 1
+        assert builder.transfers == [(ACCOUNT_UID, "goal-new", "GBP", 145)]
+
+    def test_goal_created_in_account_currency(self):
+        """ A goal in another currency would reject the transfer, so one in the account's currency is made """
+        builder = FakeBuilder()
+        builder.goals = [{"savingsGoalUid": "goal-eur", "totalSaved": {"currency": "EUR", "minorUnits": 0}}]
+
+        assert app.round_up(event(Authorization="good", date="2022-10-20"), builder)[0] == 200
+        assert builder.transfers == [(ACCOUNT_UID, "goal-new", "GBP", 145)]
+
+    def test_all_accounts_in_one_pass(self):
+        """ Every eligible account is rounded up from a single /accounts request """
+        builder = FakeBuilder()
+        builder.accounts = builder.accounts + [
+            {"accountType": "ADDITIONAL", "accountUid": "acc-2", "defaultCategory": "cat-2", "currency": "EUR"},
+            {"accountType": "LOAN", "accountUid": "acc-3", "defaultCategory": "cat-3", "currency": "GBP"}]
+        status, body = app.round_up(event(Authorization="good", date="2022-10-20", allAccounts="true"), builder)
+
+        assert status == 200
+        assert [(result['accountUid'], result['statusCode'], result['roundUp']) for result in body['accounts']] == [
+            (ACCOUNT_UID, 200, 145), ("acc-2", 200, 145)]
+        assert builder.calls.count('accounts') == 1
+        assert sorted(builder.transfers) == [(ACCOUNT_UID, GOAL_UID, "GBP", 145), ("acc-2", GOAL_UID, "EUR", 145)]
+
+    def test_all_accounts_partial_failure(self):
+        builder = FakeBuilder()
+        builder.accounts = builder.accounts + [
+            {"accountType": "ADDITIONAL", "accountUid": "acc-2", "defaultCategory": "cat-2", "currency": "GBP"}]
+        send_transfer = builder.send_transfer_round_up_request
+
+        def refuse_second(auth, accountUid, *args):
+            if accountUid == "acc-2":
+                raise AccountException(FakeResponse(403, {"error": "forbidden"}))
+            return send_transfer(auth, accountUid, *args)
+
+        builder.send_transfer_round_up_request = refuse_second
+        status, body = app.round_up(event(Authorization="good", date="2022-10-20", allAccounts="true"), builder)
+
+        assert status == app.MULTI_STATUS
+        assert [result['statusCode'] for result in body['accounts']] == [200, 403]
+        assert app.round_up(event(Authorization="good", date="2022-10-20", allAccounts="true", savingsGoalUid=GOAL_UID),
+                            builder)[0] == 400
+
+    def test_balance_checked_before_transfer(self, monkeypatch):
+        """ With a balance policy, a round up the balance cannot cover never reaches the PUT """
+        monkeypatch.setattr(app, 'BALANCE_POLICY', app.BALANCE_SKIP)
+        builder = FakeBuilder()
+        assert app.round_up(event(Authorization="good", date="2022-10-20"), builder) == (200, {"success": True})
+        assert 'balance' in builder.calls
+
+        builder.balance = 100
+        assert app.round_up(event(Authorization="good", date="2022-10-20"), builder) == \
+            (400, {"error": "Round up of 145 exceeds cleared balance of 100"})
+        assert len(builder.transfers) == 1
+
+    def test_balance_caps_transfer(self, monkeypatch):
+        monkeypatch.setattr(app, 'BALANCE_POLICY', app.BALANCE_CAP)
+        builder = FakeBuilder()
+        builder.balance = 100
+        assert app.round_up(event(Authorization="good", date="2022-10-20"), builder)[0] == 200
+        builder.balance = 0
+        assert app.round_up(event(Authorization="good", date="2022-10-20"), builder)[0] == 400
+
+        assert [transfer[3] for transfer in builder.transfers] == [100]
+        assert app.apply_balance_policy(app.BALANCE_CAP, 145, 1000) == 145
+
+    def test_broken_feed_stream_unavailable(self, monkeypatch):
+        """ A streamed feed that breaks off after the headers is answered 503, not raised """
+        monkeypatch.setattr(app, 'STREAM_FEED', True)
+        stub = StubStarling()
+        try:
+            stub.script = [(200, {'Content-Length': '5000'}, b'{"feedItems": [' + b' ' * 85),   # Closed early
+                           (200, {'Content-Encoding': 'gzip'}, b'not gzip at all'),
+                           (200, {}, b'{"feedItems": [{"feedItemUid": "1"')]
+            builder = FakeBuilder()
+            builder.send_transaction_request = RequestBuilder(base_url=stub.url).send_transaction_request
+            for _ in stub.script[:]:
+                assert app.round_up(event(Authorization="good", date="2022-10-20"), builder) == \
+                    (503, {"error": "Starling API is unavailable."})
+        finally:
+            stub.close()
+        assert builder.transfers == []
+
+    def test_cached_metadata_skips_requests(self):
+        """ A warm call only fetches the feed, and a bad goal refreshes the cached goal list """
+        builder = FakeBuilder()
+        cache = TTLCache()
+        app.round_up(event(Authorization="good", date="2022-10-20"), builder, cache)
+        builder.calls = []
+
+        assert app.round_up(event(Authorization="good", date="2022-10-20"), builder, cache)[0] == 200
+        assert builder.calls == ['feed', 'transfer']
+
+        builder.calls = []
+        app.round_up(event(Authorization="good", date="2022-10-20", savingsGoalUid="nope"), builder, cache)
+        assert sorted(builder.calls) == ['feed', 'savings']
+
+    def test_failed_goals_request_not_cached(self):
+        """ A refused goals request is answered with its error, and the next call asks again """
+        builder = FakeBuilder()
+        cache = TTLCache()
+        send_savings = builder.send_get_savings_request
+        builder.send_get_savings_request = lambda auth, accountUid: FakeResponse(403, {"error": "forbidden"})
+        assert app.round_up(event(Authorization="good", date="2022-10-20"), builder, cache) == (403, {"error": "forbidden"})
+
+        builder.send_get_savings_request = send_savings
+        assert app.round_up(event(Authorization="good", date="2022-10-20"), builder, cache) == (200, {"success": True})
+        assert builder.calls.count('savings') == 1
+        assert len(builder.transfers) == 1
+
+    def test_incremental_rounds_up_new_transactions_once(self):
+        feed = [{"feedItemUid": "1", "transactionTime": "2022-10-20T10:00:00.000Z", "direction": "OUT",
+                 "status": "SETTLED", "amount": {"minorUnits": 435}}]
+        builder = FakeBuilder(feed)
+        checkpoints = MemoryCheckpointStore()
+        incremental_event = event(Authorization="good", date="2022-10-20", incremental="true")
+
+        assert app.round_up(incremental_event, builder, None, checkpoints) == (200, {"success": True})
+        assert app.round_up(incremental_event, builder, None, checkpoints)[0] == 200
+        feed.append({"feedItemUid": "2", "transactionTime": "2022-10-21T10:00:00.000Z", "direction": "OUT",
+                     "status": "SETTLED", "amount": {"minorUnits": 520}})
+        app.round_up(incremental_event, builder, None, checkpoints)
+
+        assert [transfer[3] for transfer in builder.transfers] == [65, 80]
+
+    def test_date_range_split_and_deduplicated(self):
+        """ Every window returns the same items here, each must still be rounded up once """
+        builder = FakeBuilder()
+        status, _ = app.round_up(event(Authorization="good", date="2022-10-01", endDate="2022-10-31"), builder)
+
+        assert status == 200
+        assert builder.calls.count('feed') == 5
+        assert builder.transfers[0][3] == 145
+
+    def test_date_range_invalid(self):
+        builder = FakeBuilder()
+        assert app.round_up(event(Authorization="good", date="2022-10-20", endDate="2022-10-01"), builder)[0] == 400
+        assert builder.transfers == []
+
+    def test_ledger_answers_repeat_without_requests(self):
+        """ A re-run of a transferred week costs no HTTP calls once metadata is cached """
+        builder = FakeBuilder()
+        cache, ledger = TTLCache(), MemoryLedger()
+        week = event(Authorization="good", date="2022-10-20", savingsGoalUid=GOAL_UID)
+        first = app.round_up(week, builder, cache, None, ledger)
+        builder.calls = []
+
+        assert app.round_up(week, builder, cache, None, ledger) == first
+        assert builder.calls == []
+        assert len(builder.transfers) == 1
+
+    def test_failed_transfer_retried_with_same_uid(self):
+        builder = FakeBuilder()
+        ledger = MemoryLedger()
+        week = event(Authorization="good", date="2022-10-20")
+        builder.transfer_status = 500
+        assert app.round_up(week, builder, None, None, ledger)[0] == 500
+        builder.transfer_status = 200
+        assert app.round_up(week, builder, None, None, ledger)[0] == 200
+        app.round_up(week, builder, None, None, ledger)
+
+        assert len(builder.transfer_uids) == 2
+        assert builder.transfer_uids[0] == builder.transfer_uids[1] is not None
+
+    def test_period_spellings_share_ledger_entry(self):
+        """ Unpadded and padded dates are the same period, so the repeat is answered from the ledger """
+        builder = FakeBuilder()
+        ledger = MemoryLedger()
+        first = app.round_up(event(Authorization="good", date="2022-10-5", endDate="2022-10-9"), builder, None, None, ledger)
+
+        assert app.round_up(event(Authorization="good", date="2022-10-05", endDate="2022-10-09"), builder,
+                            None, None, ledger) == first
+        assert len(builder.transfers) == 1
+
+    def test_period_spellings_same_transfer_uid(self):
+        builder = FakeBuilder()
+        builder.transfer_status = 500
+        app.round_up(event(Authorization="good", date="2022-10-5"), builder, None, None, MemoryLedger())
+        app.round_up(event(Authorization="good", date="2022-10-05"), builder, None, None, MemoryLedger())
+
+        assert builder.transfer_uids[0] == builder.transfer_uids[1] is not None
+
+
+class TestBatchHandler:
+
+    def test_pool_fits_batch(self):
+        """ Every request a full batch has in flight can keep its connection in the shared pool """
+        import path
+        assert path.POOL_MAXSIZE >= app.BATCH_WORKERS * app.MAX_WORKERS
+
+    def test_results_in_job_order(self, monkeypatch):
+        builder = FakeBuilder()
+        monkeypatch.setattr(app, 'get_builder', lambda: builder)
+        monkeypatch.setattr(app, 'get_metadata_cache', lambda: None)
+        monkeypatch.setattr(app, 'get_transfer_ledger', lambda: None)
+        jobs = [{"Authorization": "good", "date": "2022-10-20"},
+                {"Authorization": "bad", "date": "2022-10-20"},
+                {"date": "2022-10-20"},
+                "not a job"]
+
+        response = app.batch_handler({"jobs": jobs}, None)
+        results = json.loads(response['body'])['results']
+
+        assert response['statusCode'] == 200
+        assert [result['statusCode'] for result in results] == [200, 403, 400, 400]
+        assert results[2]['body'] == {"error": "No auth parameter"}
+        assert len(builder.transfers) == 1
+
+    def test_jobs_from_api_gateway_body(self, monkeypatch):
+        monkeypatch.setattr(app, 'get_builder', lambda: FakeBuilder())
+        monkeypatch.setattr(app, 'get_metadata_cache', lambda: None)
+        monkeypatch.setattr(app, 'get_transfer_ledger', lambda: None)
+        response = app.batch_handler({"body": json.dumps({"jobs": []})}, None)
+        assert json.loads(response['body']) == {"results": []}
+
+        response = app.batch_handler({"body": "{}"}, None)
+        assert response['statusCode'] == 400
+
+
+class TestColdStart:
+
+    def test_input_error_does_not_load_http_stack(self):
+        """ A bad request on a cold container is answered before urllib3 or orjson is imported """
+        code = ("import sys, app\n"
+                "response = app.lambda_handler({'queryStringParameters': {'date': '2022-10-20'}}, None)\n"
+                "print(response['statusCode'], 'urllib3' in sys.modules, 'path' in sys.modules, 'orjson' in sys.modules)")
+        result = subprocess.run([sys.executable, "-c", code], cwd=SRC, capture_output=True, text=True, check=True)
+        assert result.stdout.split() == ['400', 'False', 'False', 'False']
@@ -0,0 +1,292 @@
+import asyncio
+import gzip
+import json
+
+import pytest
+
+import app
+import async_app
+import async_path
+from async_http import AsyncConnectionPool, Headers, HTTPError
+from async_path import AsyncRequestBuilder
+from cache import TTLCache
+from checkpoint import MemoryCheckpointStore
+from exceptions import AccountException, ServiceUnavailableException
+from ledger import MemoryLedger
+from path import TRANSFER
+from resilience import CircuitBreaker, RetryPolicy
+from .stub_server import StubStarling
+from .test_app import FakeBuilder, FakeResponse, event, ACCOUNT_UID, GOAL_UID
+
+
+class FakeAsyncBuilder(AsyncRequestBuilder):
+    """ AsyncRequestBuilder answering from the same memory as test_app.FakeBuilder """
+
+    def __init__(self, feed_items=None):
+        super().__init__()
+        self.fake = FakeBuilder(feed_items)
+
+    async def send_account_request(self, auth):
+        return self.fake.send_account_request(auth)
+
+    async def send_account_balance_request(self, auth, accountUid):
+        return self.fake.send_account_balance_request(auth, accountUid)
+
+    async def send_transaction_request(self, auth, accountUid, categoryUid, changes_since):
+        return self.fake.send_transaction_request(auth, accountUid, categoryUid, changes_since)
+
+    async def send_transactions_between_request(self, auth, accountUid, categoryUid, min_timestamp, max_timestamp):
+        return self.fake.send_transactions_between_request(auth, accountUid, categoryUid, min_timestamp, max_timestamp)
+
+    async def send_get_savings_request(self, auth, accountUid):
+        return self.fake.send_get_savings_request(auth, accountUid)
+
+    async def send_transfer_round_up_request(self, auth, accountUid, savingsGoalUid, currency, amount, transfer_uid=None):
+        return self.fake.send_transfer_round_up_request(auth, accountUid, savingsGoalUid, currency, amount, transfer_uid)
+
+
+@pytest.fixture
+def stub():
+    server = StubStarling(keep_alive=True)
+    yield server
+    server.close()
+
+
+class TestAsyncConnectionPool:
+
+    def test_keep_alive(self, stub):
+        """ Requests to the same host reuse one connection """
+        stub.script = [(200, {}, {"n": 1}), (201, {'X-Test': 'a'}, {"n": 2})]
+
+        async def send():
+            pool = AsyncConnectionPool()
+            first = await pool.request('GET', stub.url + "/one?a=1")
+            second = await pool.request('PUT', stub.url + "/two", {'Content-Type': 'application/json'}, '{"x": 1}')
+            await pool.close()
+            return first, second
+
+        first, second = asyncio.run(send())
+
+        assert (first.status, first.data) == (200, b'{"n": 1}')
+        assert (second.status, second.headers['x-test']) == (201, 'a')
+        assert [(method, path, body) for method, path, _, body in stub.requests] == [
+            ('GET', '/one?a=1', b''), ('PUT', '/two', b'{"x": 1}')]
+
+    def test_cancelled_exchange_closes_connection(self, stub):
+        """ A connection cancelled part way through a response is closed, not leaked or pooled """
+        connections = []
+
+        async def send():
+            pool = AsyncConnectionPool()
+            acquire, exchanging = pool.acquire, asyncio.Event()
+
+            async def tracked(key):
+                connections.append(await acquire(key))
+                return connections[-1]
+
+            async def unanswered(*args):
+                exchanging.set()
+                await asyncio.Event().wait()
+
+            pool.acquire, pool.exchange = tracked, unanswered
+            request = asyncio.ensure_future(pool.request('GET', stub.url + "/feed"))
+            await exchanging.wait()
+            request.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await request
+            return connections[0].writer.is_closing()
+
+        assert asyncio.run(send()) is True
+
+    def test_connection_closed_by_server(self):
+        """ An HTTP/1.0 server closes every connection, so each request opens a new one """
+        server = StubStarling()
+        server.script = [(200, {}, {"n": 1}), (200, {}, {"n": 2})]
+
+        async def send():
+            pool = AsyncConnectionPool()
+            return [(await pool.request('GET', server.url)).data for _ in range(2)]
+
+        try:
+            assert asyncio.run(send()) == [b'{"n": 1}', b'{"n": 2}']
+        finally:
+            server.close()
+
+    def test_connect_error(self):
+        with pytest.raises(HTTPError):
+            asyncio.run(AsyncConnectionPool(connect_timeout=1).request('GET', "http://127.0.0.1:1/"))
+
+    def test_read_chunked(self):
+        async def read():
+            reader = asyncio.StreamReader()
+            reader.feed_data(b"4\r\nWiki\r\n5;ext=1\r\npedia\r\n0\r\nTrailer: x\r\n\r\n")
+            reader.feed_eof()
+            return await AsyncConnectionPool().read_chunked(reader)
+
+        assert asyncio.run(read()) == b"Wikipedia"
+
+    def test_headers_ignore_case(self):
+        headers = Headers([('Retry-After', '2')])
+
+        assert headers.get('retry-after') == headers['RETRY-AFTER'] == '2'
+        assert 'Retry-after' in headers
+
+
+class TestAsyncRequestBuilder:
+
+    def test_same_requests_as_sync(self, stub):
+        """ Both backends build the same URL, headers and body """
+        builder = AsyncRequestBuilder(base_url=stub.url)
+        asyncio.run(builder.send_transfer_round_up_request("token", ACCOUNT_UID, GOAL_UID, "GBP", 145, "uid-1"))
+        method, path, headers, body = stub.requests[0]
+
+        assert (method, path) == ('PUT', "/api/v2/account/acc-1/savings-goals/goal-1/add-money/uid-1")
+        assert headers['Authorization'] == 'Bearer token'
+        assert body.decode('utf-8') == builder.build_transfer_body("GBP", 145)
+
+    def test_gzip_feed(self, stub):
+        feed = {"feedItems": [{"feedItemUid": "1"}] * 100}
+        stub.script = [(200, {'Content-Encoding': 'gzip'}, gzip.compress(json.dumps(feed).encode('utf-8')))]
+        builder = AsyncRequestBuilder(base_url=stub.url, compression=True)
+        response = asyncio.run(builder.send_transaction_request("token", ACCOUNT_UID, "cat-1", "2022-10-20"))
+
+        assert stub.requests[0][2]['Accept-Encoding'].startswith('gzip')
+        assert app.json_encoder(response) == feed
+
+    def test_account_error_mapped(self, stub):
+        stub.script = [(403, {}, {"error": "invalid_token"})]
+        with pytest.raises(AccountException) as info:
+            asyncio.run(AsyncRequestBuilder(base_url=stub.url).send_account_request("bad"))
+
+        assert info.value.response.status == 403
+        assert app.json_encoder(info.value.response) == {"error": "invalid_token"}
+
+    def test_retry_after_503(self, stub):
+        stub.script = [(503, {'Retry-After': '0'}, {}), (200, {}, {"success": True})]
+        builder = AsyncRequestBuilder(base_url=stub.url)
+        response = asyncio.run(builder.send_transfer_round_up_request("token", ACCOUNT_UID, GOAL_UID, "GBP", 1, "uid-1"))
+
+        assert response.status == 200
+        assert stub.requests[0][1] == stub.requests[1][1]       # Same transfer UID on the retry
+
+    def test_cancelled_trial_released(self, monkeypatch):
+        """ A half open trial cancelled by gather_or_cancel must not keep the circuit open for good """
+        breakers = []
+
+        def breaker():
+            breakers.append(CircuitBreaker(threshold=1, reset_timeout=0))
+            return breakers[-1]
+
+        async def refused(*args, **kwargs):
+            raise HTTPError("refused")
+
+        async def unanswered(*args, **kwargs):
+            await asyncio.Event().wait()
+
+        async def send():
+            builder = AsyncRequestBuilder(policies={TRANSFER: RetryPolicy(max_attempts=1)})
+            builder.http.request = refused
+            with pytest.raises(ServiceUnavailableException):
+                await builder.send_request(TRANSFER, 'PUT', builder.build_account_url(), {})
+            builder.http.request = unanswered
+            trial = asyncio.ensure_future(builder.send_request(TRANSFER, 'PUT', builder.build_account_url(), {}))
+            await asyncio.sleep(0)
+            trial.cancel()
+            with pytest.raises(asyncio.CancelledError):
+                await trial
+
+        monkeypatch.setattr(async_path, 'CircuitBreaker', breaker)
+        asyncio.run(send())
+        assert all(breaker.allow() for breaker in breakers)
+
+    def test_unreachable(self):
+        builder = AsyncRequestBuilder(base_url="http://127.0.0.1:1", policies={TRANSFER: RetryPolicy(max_attempts=1)})
+        with pytest.raises(ServiceUnavailableException):
+            asyncio.run(builder.send_transfer_round_up_request("token", ACCOUNT_UID, GOAL_UID, "GBP", 1))
+
+
+class TestAsyncRoundUp:
+
+    def test_matches_sync_round_up(self):
+        builder = FakeAsyncBuilder()
+        status, body = asyncio.run(async_app.round_up(event(Authorization="good", date="2022-10-20"), builder))
+
+        assert (status, body) == app.round_up(event(Authorization="good", date="2022-10-20"), FakeBuilder())
+        assert builder.fake.transfers == [(ACCOUNT_UID, GOAL_UID, "GBP", 145)]
+
+    def test_errors_mapped(self):
+        assert asyncio.run(async_app.round_up(event(Authorization="bad", date="2022-10-20"), FakeAsyncBuilder())) == \
+            (403, {"error": "invalid_token"})
+        assert asyncio.run(async_app.round_up(event(Authorization="good", date="2022-13-20"), FakeAsyncBuilder()))[0] == 400
+
+    def test_failed_goals_request_not_cached(self):
+        builder, cache = FakeAsyncBuilder(), TTLCache()
+        send_savings = builder.fake.send_get_savings_request
+        builder.fake.send_get_savings_request = lambda auth, accountUid: FakeResponse(403, {"error": "forbidden"})
+        assert asyncio.run(async_app.round_up(event(Authorization="good", date="2022-10-20"), builder, cache)) == \
+            (403, {"error": "forbidden"})
+
+        builder.fake.send_get_savings_request = send_savings
+        assert asyncio.run(async_app.round_up(event(Authorization="good", date="2022-10-20"), builder, cache))[0] == 200
+        assert builder.fake.calls.count('savings') == 1
+
+    def test_all_accounts(self):
+        builder = FakeAsyncBuilder()
+        builder.fake.accounts = builder.fake.accounts + [
+            {"accountType": "ADDITIONAL", "accountUid": "acc-2", "defaultCategory": "cat-2", "currency": "GBP"}]
+        request = event(Authorization="good", date="2022-10-20", allAccounts="true")
+
+        status, body = asyncio.run(async_app.round_up(request, builder))
+
+        assert status == 200
+        assert [(result['accountUid'], result['roundUp']) for result in body['accounts']] == [(ACCOUNT_UID, 145), ("acc-2", 145)]
+        assert builder.fake.calls.count('accounts') == 1
+
+    def test_balance_policy(self, monkeypatch):
+        monkeypatch.setattr(async_app, 'BALANCE_POLICY', app.BALANCE_CAP)
+        builder = FakeAsyncBuilder()
+        builder.fake.balance = 100
+
+        assert asyncio.run(async_app.round_up(event(Authorization="good", date="2022-10-20"), builder))[0] == 200
+        assert builder.fake.transfers == [(ACCOUNT_UID, GOAL_UID, "GBP", 100)]
+
+        monkeypatch.setattr(async_app, 'BALANCE_POLICY', app.BALANCE_SKIP)
+        status, body = asyncio.run(async_app.round_up(event(Authorization="good", date="2022-10-20"), builder))
+        assert (status, body) == (400, {"error": "Round up of 145 exceeds cleared balance of 100"})
+        assert len(builder.fake.transfers) == 1
+
+    def test_incremental_shares_checkpoint_steps(self):
+        feed = [{"feedItemUid": "1", "transactionTime": "2022-10-20T10:00:00.000Z", "direction": "OUT",
+                 "status": "SETTLED", "amount": {"minorUnits": 435}}]
+        builder, checkpoints = FakeAsyncBuilder(feed), MemoryCheckpointStore()
+        request = event(Authorization="good", date="2022-10-20", incremental="true")
+
+        assert asyncio.run(async_app.round_up(request, builder, None, checkpoints)) == (200, {"success": True})
+        assert asyncio.run(async_app.round_up(request, builder, None, checkpoints)) == (200, app.NO_NEW_TRANSACTIONS)
+        assert builder.fake.transfers == [(ACCOUNT_UID, GOAL_UID, "GBP", 65)]
+
+    def test_ledger_answers_rerun(self):
+        builder, ledger = FakeAsyncBuilder(), MemoryLedger()
+        request = event(Authorization="good", date="2022-10-20", savingsGoalUid=GOAL_UID)
+        first = asyncio.run(async_app.round_up(request, builder, ledger=ledger))
+        second = asyncio.run(async_app.round_up(request, builder, ledger=ledger))
+
+        assert first == second == (200, {"success": True})
+        assert len(builder.fake.transfers) == 1
+
+    def test_batch_handler(self, monkeypatch):
+        builder = FakeAsyncBuilder()
+        monkeypatch.setattr(async_app, 'get_async_builder', lambda: builder)
+        monkeypatch.setattr(async_app, 'get_metadata_cache', lambda: None)
+        monkeypatch.setattr(async_app, 'get_transfer_ledger', lambda: None)
+        jobs = [{"Authorization": "good", "date": "2022-10-20"}] * 50 + [{"Authorization": "bad", "date": "2022-10-20"}, "x"]
+        response = async_app.batch_handler({"jobs": jobs}, None)
+        results = json.loads(response['body'])['results']
+
+        assert [result['statusCode'] for result in results] == [200] * 50 + [403, 400]
+        assert len(builder.fake.transfers) == 50
+
+    def test_lambda_handler_input_error(self):
+        response = async_app.lambda_handler({}, None)
+
+        assert response['statusCode'] == 400
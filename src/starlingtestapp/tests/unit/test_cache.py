@@ -0,0 +1,43 @@
+import time
+
+from cache import TTLCache, SQLiteCache, cache_key, get_or_fetch, ACCOUNTS, SAVINGS
+
+
+class TestCache:
+
+    def test_key_does_not_hold_token(self):
+        key = cache_key(SAVINGS, "secret-token", "acc-1")
+        assert "secret-token" not in key
+        assert key.endswith(":savings:acc-1")
+
+    def test_ttl_expiry(self):
+        cache = TTLCache(ttl=0.01)
+        cache.set("key", {"a": 1})
+        assert cache.get("key") == {"a": 1}
+        time.sleep(0.02)
+        assert cache.get("key") is None
+
+    def test_least_recently_used_evicted(self):
+        cache = TTLCache(maxsize=2)
+        cache.set("a", 1)
+        cache.set("b", 2)
+        cache.get("a")
+        cache.set("c", 3)
+        assert (cache.get("a"), cache.get("b"), cache.get("c")) == (1, None, 3)
+
+    def test_sqlite_backend(self, tmp_path):
+        path = str(tmp_path / "cache.sqlite")
+        cache = SQLiteCache(path)
+        cache.set(cache_key(ACCOUNTS, "token"), {"accounts": []})
+        cache.set(cache_key(ACCOUNTS, "other"), {"accounts": [1]})
+
+        assert SQLiteCache(path).get(cache_key(ACCOUNTS, "token")) == {"accounts": []}   # Survives a new process
+        cache.invalidate_token("token")
+        assert cache.get(cache_key(ACCOUNTS, "token")) is None
+        assert cache.get(cache_key(ACCOUNTS, "other")) == {"accounts": [1]}
+
+    def test_get_or_fetch(self):
+        cache = TTLCache()
+        assert get_or_fetch(cache, "key", lambda: 1) == (1, False)
+        assert get_or_fetch(cache, "key", lambda: 2) == (1, True)
+        assert get_or_fetch(None, "key", lambda: 3) == (3, False)
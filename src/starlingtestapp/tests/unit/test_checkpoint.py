@@ -0,0 +1,41 @@
+from checkpoint import Checkpoint, SQLiteCheckpointStore, checkpoint_key
+
+START = "2022-10-20T00:00:00.000Z"
+
+
+def item(uid, time, minor_units, status="SETTLED", direction="OUT"):
+    return {"feedItemUid": uid, "transactionTime": "2022-10-%sT00:00:00.000Z" % time, "direction": direction,
+            "status": status, "amount": {"minorUnits": minor_units}}
+
+
+class TestCheckpoint:
+
+    def test_transactions_counted_once(self):
+        checkpoint = Checkpoint(START)
+        assert checkpoint.round_up([item("1", 20, 435), item("2", 21, 520, direction="IN")]) == 65
+        assert checkpoint.round_up([item("1", 20, 435), item("3", 22, 150)]) == 50
+        assert checkpoint.get_timestamp() == "2022-10-22T00:00:00.000Z"
+
+    def test_pending_transaction_fetched_until_settled(self):
+        checkpoint = Checkpoint(START)
+        assert checkpoint.round_up([item("1", 20, 435, status="PENDING"), item("2", 22, 520)]) == 80
+        assert checkpoint.get_window_start() == "2022-10-20T00:00:00.000Z"
+
+        assert checkpoint.round_up([item("1", 20, 435), item("2", 22, 520)]) == 65
+        assert checkpoint.get_window_start() == "2022-10-22T00:00:00.000Z"
+
+    def test_declined_transaction_forgotten(self):
+        checkpoint = Checkpoint(START)
+        checkpoint.round_up([item("1", 20, 435, status="PENDING"), item("2", 22, 520)])
+        assert checkpoint.round_up([item("1", 20, 435, status="DECLINED")]) == 0
+        assert checkpoint.get_window_start() == "2022-10-22T00:00:00.000Z"
+
+    def test_sqlite_store(self, tmp_path):
+        path = str(tmp_path / "checkpoints.sqlite")
+        checkpoint = Checkpoint(START)
+        checkpoint.round_up([item("1", 21, 435)])
+        SQLiteCheckpointStore(path).save(checkpoint_key("acc", "cat"), checkpoint)
+
+        loaded = SQLiteCheckpointStore(path).load(checkpoint_key("acc", "cat"))
+        assert loaded.to_dict() == checkpoint.to_dict()
+        assert SQLiteCheckpointStore(path).load(checkpoint_key("acc", "other")) is None
@@ -0,0 +1,76 @@
+import json
+
+import pytest
+
+import codec
+from codec import OrjsonCodec, StdlibCodec, build_codec, decode_response, has_long_number
+
+
+class CountingResponse:
+    def __init__(self, body):
+        self.__data = json.dumps(body).encode('utf-8')
+        self.reads = 0
+
+    @property
+    def data(self):
+        self.reads += 1
+        return self.__data
+
+
+class TestCodec:
+
+    def test_decoded_once(self):
+        response = CountingResponse({"feedItems": [{"amount": {"minorUnits": 435}}]})
+        first = decode_response(response)
+
+        assert decode_response(response) is first
+        assert response.reads == 1
+
+    def test_stdlib_backend(self):
+        assert isinstance(build_codec('json'), StdlibCodec)
+
+    def test_orjson_matches_stdlib(self):
+        pytest.importorskip('orjson')
+        fast, slow = build_codec('orjson'), StdlibCodec()
+        document = {"feedItems": [{"feedItemUid": "1", "amount": {"minorUnits": 2 ** 63 - 1}}], "name": "café"}
+
+        assert isinstance(fast, OrjsonCodec)
+        assert fast.loads(slow.dumps(document)) == slow.loads(fast.dumps(document)) == document
+
+    def test_refused_documents_fall_back(self):
+        """ orjson refuses to encode integers over 64 bits and invalid documents still raise ValueError """
+        pytest.importorskip('orjson')
+        fast = build_codec('orjson')
+
+        assert fast.loads(b'{"minorUnits": 9223372036854775807}') == {"minorUnits": 2 ** 63 - 1}
+        assert json.loads(fast.dumps({"minorUnits": 2 ** 70})) == {"minorUnits": 2 ** 70}
+        with pytest.raises(ValueError):
+            fast.loads(b'{"broken": ')
+
+    def test_big_integers_decoded_exactly(self):
+        """ orjson would read integers beyond 64 bits as floats """
+        pytest.importorskip('orjson')
+        fast = build_codec('orjson')
+        document = {"minorUnits": 2 ** 64, "negative": -2 ** 63 - 1, "amounts": [1, 10 ** 30]}
+
+        assert fast.loads(json.dumps(document).encode('utf-8')) == document
+        assert fast.loads(json.dumps(document)) == document
+        assert fast.loads(b'{"minorUnits": 18446744073709551615, "uid": "1234567890123456789012"}') == \
+            {"minorUnits": 2 ** 64 - 1, "uid": "1234567890123456789012"}
+
+    def test_long_numbers_found(self):
+        assert has_long_number(b'[1, -9223372036854775809]')
+        assert has_long_number(b'12345678901234567890')
+        assert not has_long_number(b'{"uid": "d80657fd0910949945404068639dcdc1", "minorUnits": 435}')
+        assert not has_long_number(b'{"rate": 1.12345678901234567890}')
+
+    def test_dumps_returns_str(self):
+        assert json.loads(codec.dumps({"success": True})) == {"success": True}
+        assert isinstance(codec.dumps({}), str)
+
+    def test_dumps_same_cold_and_warm(self, monkeypatch):
+        monkeypatch.setattr(codec, 'codec', None)
+        cold = codec.dumps({"a": 1})
+        codec.loads(b'{}')
+
+        assert codec.dumps({"a": 1}) == cold == '{"a": 1}'
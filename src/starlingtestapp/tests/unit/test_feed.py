@@ -0,0 +1,93 @@
+import gzip
+import json
+import pytest
+
+from feed import FeedParser, iter_feed_items
+from metrics import ListSink, recorder
+from path import RequestBuilder
+from user import User
+from .stub_server import StubStarling
+
+ITEMS = [
+    {"feedItemUid": "1", "direction": "OUT", "status": "SETTLED", "amount": {"minorUnits": 435},
+     "counterPartyName": "Café £ [ok], {fine}"},
+    {"feedItemUid": "2", "direction": "IN", "status": "SETTLED", "amount": {"minorUnits": 87}},
+    {"feedItemUid": "3", "direction": "OUT", "status": "SETTLED", "amount": {"minorUnits": 520}},
+]
+BODY = json.dumps({"feedItems": ITEMS}, ensure_ascii=False, indent=1).encode('utf-8')
+
+
+class FakeStreamResponse:
+    def __init__(self, body):
+        self.body = body
+        self.released = False
+
+    def stream(self, chunk_size):
+        for start in range(0, len(self.body), chunk_size):
+            yield self.body[start:start + chunk_size]
+
+    def release_conn(self):
+        self.released = True
+
+
+class TestFeedParser:
+
+    @pytest.mark.parametrize("chunk_size", [1, 2, 7, 64, len(BODY)])
+    def test_items_parsed_across_chunks(self, chunk_size):
+        """ Items, keys and multi-byte characters may be split anywhere """
+        response = FakeStreamResponse(BODY)
+        assert list(iter_feed_items(response, chunk_size)) == ITEMS
+        assert response.released
+
+    def test_empty_feed(self):
+        assert list(iter_feed_items(FakeStreamResponse(b'{"feedItems": []}'))) == []
+
+    def test_truncated_body(self):
+        response = FakeStreamResponse(BODY[:-20])
+        with pytest.raises(ValueError):
+            list(iter_feed_items(response))
+        assert response.released
+
+    def test_missing_feed_items(self):
+        parser = FeedParser()
+        assert parser.feed(b'{"error": "invalid_token"}') == []
+        with pytest.raises(ValueError):
+            parser.close()
+
+    def test_round_up_stream(self):
+        assert User("auth", None).round_up_stream(iter_feed_items(FakeStreamResponse(BODY), 5)) == 145
+
+
+class TestCompressedFeed:
+
+    @pytest.fixture()
+    def stub(self):
+        server = StubStarling()
+        yield server
+        server.close()
+
+    def test_gzip_feed_streamed(self, stub):
+        """ The feed is decompressed while parsed, and bytes on the wire and decoded are recorded """
+        body = json.dumps({"feedItems": ITEMS * 500}).encode('utf-8')
+        compressed = gzip.compress(body)
+        stub.script = [(200, {'Content-Encoding': 'gzip'}, compressed)]
+        sink = ListSink()
+        recorder.enable(sink)
+        try:
+            builder = RequestBuilder(base_url=stub.url, compression=True)
+            response = builder.send_transaction_request("token", "acc-1", "cat-1", "2022-10-20", stream=True)
+            items = list(iter_feed_items(response, 1024))
+            recorder.flush()
+        finally:
+            recorder.disable()
+        stages = dict(sink.emitted)
+
+        assert items == ITEMS * 500
+        assert stub.requests[0][2]['Accept-Encoding'].startswith('gzip')
+        assert stages['transactions']['WireBytes'] == [len(compressed)]
+        assert stages['feed_stream']['PayloadBytes'] == [len(body)]
+        assert stages['feed_stream']['WireBytes'] == [len(compressed)]
+
+    def test_not_asked_for_by_default(self, stub):
+        RequestBuilder(base_url=stub.url, compression=False).send_transaction_request("token", "acc-1", "cat-1", "2022-10-20")
+        assert 'gzip' not in stub.requests[0][2].get('Accept-Encoding', '')
@@ -0,0 +1,27 @@
+from goals import GoalRegistry
+
+
+def goal(uid, name="Holiday", currency="GBP"):
+    return {"savingsGoalUid": uid, "name": name, "totalSaved": {"currency": currency, "minorUnits": 0}}
+
+
+class TestGoalRegistry:
+
+    def test_lookups(self):
+        goals = GoalRegistry.from_response({"savingsGoalList": [goal("a"), goal("b", "Car"), goal("c", "Car")]})
+
+        assert "b" in goals and "z" not in goals
+        assert goals.get("c")["name"] == "Car"
+        assert goals.find("Car", "GBP")["savingsGoalUid"] == "b"
+        assert goals.find("Car", "EUR") is None
+        assert len(goals) == 3
+
+    def test_default_goal_prefers_account_currency(self):
+        goals = GoalRegistry([goal("eur", currency="EUR"), goal("gbp"), {"savingsGoalUid": "bare"}])
+
+        assert goals.default_goal("GBP")["savingsGoalUid"] == "gbp"
+        assert goals.default_goal("USD")["savingsGoalUid"] == "bare"
+        assert GoalRegistry().default_goal("GBP") is None
+
+    def test_no_default_goal_in_other_currency(self):
+        assert GoalRegistry([goal("eur", currency="EUR"), goal("usd", currency="USD")]).default_goal("GBP") is None
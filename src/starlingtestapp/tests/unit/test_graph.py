@@ -0,0 +1,55 @@
+import threading
+import pytest
+
+from graph import RequestGraph
+
+
+class TestRequestGraph:
+
+    def test_results_passed_to_dependants(self):
+        """ Each node receives the results of the nodes it depends on """
+        graph = RequestGraph(max_workers=4)
+        graph.add('account', lambda results: 'acc')
+        graph.add('feed', lambda results: results['account'] + '-feed', depends_on=['account'])
+        graph.add('goals', lambda results: results['account'] + '-goals', depends_on=['account'])
+        graph.add('transfer', lambda results: (results['feed'], results['goals']), depends_on=['feed', 'goals'])
+
+        assert graph.run()['transfer'] == ('acc-feed', 'acc-goals')
+
+    def test_independent_nodes_run_together(self):
+        """ Siblings only finish if both are in flight at the same time """
+        barrier = threading.Barrier(2, timeout=5)
+        graph = RequestGraph(max_workers=2)
+        graph.add('account', lambda results: None)
+        graph.add('feed', lambda results: barrier.wait(), depends_on=['account'])
+        graph.add('goals', lambda results: barrier.wait(), depends_on=['account'])
+
+        results = graph.run()
+        assert sorted([results['feed'], results['goals']]) == [0, 1]
+
+    def test_sequential_mode_keeps_order(self):
+        """ One worker runs nodes in the order they were added """
+        order = []
+        graph = RequestGraph(max_workers=1)
+        graph.add('a', lambda results: order.append('a'))
+        graph.add('b', lambda results: order.append('b'), depends_on=['a'])
+        graph.add('c', lambda results: order.append('c'))
+        graph.run()
+
+        assert order == ['a', 'b', 'c']
+
+    def test_exception_propagates(self):
+        """ An exception in a node is raised by run and its dependants never start """
+        started = []
+        graph = RequestGraph(max_workers=4)
+        graph.add('account', lambda results: 1 / 0)
+        graph.add('feed', lambda results: started.append('feed'), depends_on=['account'])
+
+        with pytest.raises(ZeroDivisionError):
+            graph.run()
+        assert started == []
+
+    def test_unknown_dependency(self):
+        graph = RequestGraph()
+        with pytest.raises(ValueError):
+            graph.add('feed', lambda results: None, depends_on=['account'])
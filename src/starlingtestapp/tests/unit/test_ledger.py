@@ -0,0 +1,19 @@
+from ledger import SQLiteLedger, ledger_key, transfer_uid, is_done
+
+
+class TestLedger:
+
+    def test_transfer_uid_deterministic(self):
+        key = ledger_key("acc", "goal", "2022-10-20")
+        assert transfer_uid(key) == transfer_uid(ledger_key("acc", "goal", "2022-10-20"))
+        assert transfer_uid(key) != transfer_uid(ledger_key("acc", "goal", "2022-10-27"))
+
+    def test_sqlite_ledger(self, tmp_path):
+        path = str(tmp_path / "ledger.sqlite")
+        key = ledger_key("acc", "goal", "2022-10-20")
+        SQLiteLedger(path).record(key, transfer_uid(key), 200, {"success": True})
+
+        entry = SQLiteLedger(path).get(key)
+        assert entry == {"transferUid": transfer_uid(key), "status": 200, "body": {"success": True}}
+        assert is_done(entry)
+        assert not is_done(SQLiteLedger(path).get(ledger_key("acc", "goal", "2022-10-27")))
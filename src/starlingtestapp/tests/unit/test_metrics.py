@@ -0,0 +1,128 @@
+import io
+import json
+import threading
+import pytest
+from concurrent.futures import ThreadPoolExecutor
+
+import app
+import path
+from metrics import EMFSink, ListSink, Recorder, recorder, NULL_TIMER
+from path import RequestBuilder
+from resilience import RetryPolicy
+from .stub_server import StubStarling
+from .test_app import FakeBuilder, FakeResponse, event
+
+
+@pytest.fixture()
+def sink():
+    sink = ListSink()
+    recorder.enable(sink)
+    yield sink
+    recorder.disable()
+
+
+class TestRecorder:
+
+    def test_disabled_records_nothing(self):
+        disabled = Recorder()
+        assert disabled.timer('stage') is NULL_TIMER
+        assert disabled.timed('stage')(lambda: 1)() == 1
+        disabled.record('stage', 1.0)
+        disabled.flush()
+
+    def test_values_grouped_by_stage(self):
+        sink = ListSink()
+        enabled = Recorder(sink)
+        with enabled.timer('accounts') as timer:
+            timer.size = 10
+        enabled.record('accounts', 0.5, size=20, retries=2)
+        enabled.flush()
+        enabled.flush()
+
+        assert len(sink.emitted) == 1
+        stage, values = sink.emitted[0]
+        assert stage == 'accounts'
+        assert values['PayloadBytes'] == [10, 20]
+        assert values['Retries'] == [2]
+        assert values['Latency'][1] == 500.0
+
+    def test_null_timer_keeps_no_state(self):
+        """ The disabled timer is shared, so a size set on it must not stick """
+        app.json_encoder(FakeResponse(200, {"accounts": []}))
+        with Recorder().timer('stage') as timer:
+            timer.size = 10
+
+        assert timer is NULL_TIMER and NULL_TIMER.size is None
+        assert not hasattr(NULL_TIMER, '__dict__')
+
+    def test_invocations_flushed_separately(self):
+        sink = ListSink()
+        enabled = Recorder(sink)
+        both_recorded = threading.Barrier(2)
+
+        def invoke(stage):
+            with enabled.invocation():
+                enabled.record(stage, 1.0)
+                both_recorded.wait()
+
+        threads = [threading.Thread(target=invoke, args=(stage,)) for stage in ('first', 'second')]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        assert sorted(stage for stage, _ in sink.emitted) == ['first', 'second']
+        assert all(values['Latency'] == [1000.0] for _, values in sink.emitted)
+
+    def test_bound_threads_join_invocation(self):
+        sink = ListSink()
+        enabled = Recorder(sink)
+        with enabled.invocation():
+            with ThreadPoolExecutor(max_workers=2) as executor:
+                list(executor.map(enabled.bind(lambda seconds: enabled.record('window', seconds)), [1.0, 2.0]))
+            assert sink.emitted == []
+        enabled.flush()
+
+        assert [stage for stage, _ in sink.emitted] == ['window']
+        assert sorted(sink.emitted[0][1]['Latency']) == [1000.0, 2000.0]
+
+    def test_emf_document(self):
+        stream = io.StringIO()
+        EMFSink(stream, "Test").emit('feed', {'Latency': [1.5]})
+        document = json.loads(stream.getvalue())
+
+        assert document['Stage'] == 'feed'
+        assert document['Latency'] == [1.5]
+        assert document['_aws']['CloudWatchMetrics'][0]['Namespace'] == "Test"
+        assert document['_aws']['CloudWatchMetrics'][0]['Metrics'] == [{"Name": "Latency", "Unit": "Milliseconds"}]
+
+    def test_lambda_handler_flushes_its_invocation(self, sink, monkeypatch):
+        monkeypatch.setattr(app, 'get_builder', FakeBuilder)
+        monkeypatch.setattr(app, 'get_metadata_cache', lambda: None)
+        monkeypatch.setattr(app, 'get_transfer_ledger', lambda: None)
+        recorder.record('outside', 1.0)
+        app.lambda_handler(event(Authorization="good", date="2022-10-20"), None)
+
+        stages = {stage for stage, _ in sink.emitted}
+        assert {'handler', 'parse_account', 'json_decode'} <= stages and 'outside' not in stages
+
+    def test_handler_stages_recorded(self, sink):
+        app.round_up(event(Authorization="good", date="2022-10-20"), FakeBuilder())
+        recorder.flush()
+
+        stages = {stage for stage, _ in sink.emitted}
+        assert {'parse_account', 'round_up_transactions', 'json_decode'} <= stages
+
+    def test_request_retries_and_size_recorded(self, sink):
+        stub = StubStarling()
+        try:
+            stub.script = [(503, {}, {}), (200, {}, {"accounts": []})]
+            builder = RequestBuilder(base_url=stub.url, policies={path.ACCOUNTS: RetryPolicy(base_delay=0)})
+            builder.send_account_request("token")
+        finally:
+            stub.close()
+        recorder.flush()
+
+        assert sink.emitted[0][0] == 'accounts'
+        assert sink.emitted[0][1]['Retries'] == [1]
+        assert sink.emitted[0][1]['PayloadBytes'] == [len(b'{"accounts": []}')]
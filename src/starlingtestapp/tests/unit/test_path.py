@@ -0,0 +1,65 @@
+import pytest
+
+import path
+from exceptions import DateFormatException, InputException
+from path import RequestBuilder, get_builder
+from .stub_server import StubStarling
+
+
+class TestRequestBuilder:
+
+    def test_headers_are_per_request(self):
+        """ Building headers for one user must not leak into another request """
+        builder = RequestBuilder()
+        first = builder.build_header("token-a", 'application/json')
+        second = builder.build_header("token-b")
+
+        assert first['Authorization'] == 'Bearer token-a'
+        assert first['Content-Type'] == 'application/json'
+        assert second == {'Accept': 'application/json', 'Authorization': 'Bearer token-b'}
+
+    def test_shared_builder_is_reused(self):
+        assert get_builder() is get_builder()
+
+    def test_evict_idle(self):
+        """ Connections are only dropped once the pool has been idle past the timeout """
+        assert RequestBuilder(idle_timeout=60).evict_idle() is False
+        assert RequestBuilder(idle_timeout=-1).evict_idle() is True
+
+    def test_health_check(self):
+        stub = StubStarling()
+        try:
+            builder = RequestBuilder(base_url=stub.url)
+            assert builder.health_check() is True
+            assert stub.requests[0][:2] == ('HEAD', "/api/v2/accounts")
+        finally:
+            stub.close()
+        assert RequestBuilder(base_url="http://127.0.0.1:1").health_check() is False
+
+    def test_idle_shared_builder_not_checked(self, monkeypatch):
+        """ get_builder only drops idle connections, it sends nothing while holding the lock """
+        stub = StubStarling()
+        try:
+            builder = RequestBuilder(idle_timeout=-1, base_url=stub.url)
+            monkeypatch.setattr(path, '_shared_builder', builder)
+            assert get_builder() is builder
+            assert stub.requests == []
+        finally:
+            stub.close()
+
+    def test_split_date_range(self):
+        """ Windows cover the range up to midnight after the end date """
+        windows = RequestBuilder().split_date_range("2022-01-30", "2022-02-13", 7)
+
+        assert windows == [("2022-01-30T00:00:00.000Z", "2022-02-06T00:00:00.000Z"),
+                           ("2022-02-06T00:00:00.000Z", "2022-02-13T00:00:00.000Z"),
+                           ("2022-02-13T00:00:00.000Z", "2022-02-14T00:00:00.000Z")]
+
+    def test_split_date_range_invalid(self):
+        builder = RequestBuilder()
+        with pytest.raises(DateFormatException):
+            builder.split_date_range("2022-01-30", "2022-02")
+        with pytest.raises(InputException):
+            builder.split_date_range("2022-01-30", "2022-01-29")
+        with pytest.raises(InputException):
+            builder.split_date_range("2022-01-01", "2023-12-31")
@@ -0,0 +1,66 @@
+import json
+
+import app
+import profiling
+from profiling import Profiler, NULL_PROFILER
+from .test_app import FakeBuilder, event
+
+
+class Context:
+    aws_request_id = "request-1"
+
+
+def handle(monkeypatch, request):
+    monkeypatch.setattr(app, 'get_builder', lambda: FakeBuilder())
+    monkeypatch.setattr(app, 'get_metadata_cache', lambda: None)
+    monkeypatch.setattr(app, 'get_transfer_ledger', lambda: None)
+    return app.lambda_handler(request, Context())
+
+
+class TestProfiling:
+
+    def test_off_by_default(self, monkeypatch):
+        monkeypatch.setattr(profiling, 'PROFILE', 'off')
+        assert profiling.profile(True) is NULL_PROFILER
+        monkeypatch.setattr(profiling, 'PROFILE', 'param')
+        assert profiling.profile(False) is NULL_PROFILER
+        assert isinstance(profiling.profile(True), Profiler)
+        profiling.active.release()              # Taken for the profiler, which is not run here
+
+    def test_requested_invocation_profiled(self, monkeypatch, tmp_path):
+        """ Graph nodes run on worker threads, their functions must still be in the report """
+        output = tmp_path / "profile.jsonl"
+        monkeypatch.setattr(profiling, 'PROFILE', 'param')
+        monkeypatch.setattr(profiling, 'PROFILE_OUTPUT', str(output))
+        monkeypatch.setattr(profiling, 'PROFILE_TOP', 5)
+
+        assert handle(monkeypatch, event(Authorization="good", date="2022-10-20"))['statusCode'] == 200
+        assert not output.exists()
+        assert handle(monkeypatch, event(Authorization="good", date="2022-10-20", profile="true"))['statusCode'] == 200
+        report = json.loads(output.read_text())
+
+        assert report['profile'] == "request-1"
+        assert report['threads'] > 1
+        assert len(report['functions']) == len(report['allocations']) == 5
+        assert 'user.round_up_transactions' in report['stages']
+        assert report['peak_kib'] > 0
+
+    def test_one_profile_at_a_time(self, monkeypatch, tmp_path):
+        """ A second invocation while one is profiled runs unprofiled rather than sharing the hooks """
+        monkeypatch.setattr(profiling, 'PROFILE', 'all')
+        monkeypatch.setattr(profiling, 'PROFILE_OUTPUT', str(tmp_path / "profile.jsonl"))
+        monkeypatch.setattr(profiling, 'PROFILE_MEMORY', False)
+
+        with profiling.profile(label="first") as first:
+            assert profiling.profile(label="second") is NULL_PROFILER
+        assert first.report['profile'] == "first"
+        assert isinstance(profiling.profile(), Profiler)
+        profiling.active.release()
+
+    def test_report_without_memory(self, capsys):
+        with Profiler("label", top=3, memory=False, output='log') as profiler:
+            sorted(range(1000), key=lambda value: -value)
+        line = json.loads(capsys.readouterr().out)
+
+        assert line == profiler.report
+        assert len(line['functions']) == 3 and 'allocations' not in line
@@ -0,0 +1,140 @@
+import time
+
+import pytest
+
+import path
+from exceptions import ServiceUnavailableException
+from path import RequestBuilder
+from resilience import CircuitBreaker, RetryPolicy, RateLimiter, TokenBucket
+from .stub_server import StubStarling
+
+FAST = RetryPolicy(max_attempts=3, base_delay=0, max_delay=0)
+
+
+@pytest.fixture()
+def stub():
+    server = StubStarling()
+    yield server
+    server.close()
+
+
+@pytest.fixture()
+def builder(stub):
+    return RequestBuilder(base_url=stub.url, policies={endpoint: FAST for endpoint in
+                                                       [path.ACCOUNTS, path.SAVINGS_GOALS, path.TRANSFER]})
+
+
+class TestRetries:
+
+    def test_get_retried_after_server_error(self, stub, builder):
+        stub.script = [(503, {}, {}), (502, {}, {}), (200, {}, {"accounts": []})]
+        response = builder.send_account_request("token")
+
+        assert response.status == 200
+        assert len(stub.requests) == 3
+
+    def test_retry_after_respected(self, stub, builder):
+        stub.script = [(429, {'Retry-After': '0'}, {}), (200, {}, {"savingsGoalList": []})]
+        assert builder.send_get_savings_request("token", "acc").status == 200
+        assert len(stub.requests) == 2
+
+    def test_gives_up_after_max_attempts(self, stub, builder):
+        stub.script = [(500, {}, {})] * 5
+        assert builder.send_get_savings_request("token", "acc").status == 500
+        assert len(stub.requests) == 3
+
+    def test_transfer_uid_reused_across_attempts(self, stub, builder):
+        stub.script = [(503, {}, {}), (200, {}, {"success": True})]
+        builder.send_transfer_round_up_request("token", "acc", "goal", "GBP", 145)
+
+        urls = [request[1] for request in stub.requests]
+        assert len(urls) == 2 and urls[0] == urls[1]
+        assert "/add-money/" in urls[0]
+
+    def test_create_goal_not_retried(self, stub, builder):
+        stub.script = [(503, {}, {}), (200, {}, {})]
+        assert builder.send_put_savings_request("token", "acc", "GBP").status == 503
+        assert len(stub.requests) == 1
+
+    def test_connection_error(self):
+        builder = RequestBuilder(base_url="http://127.0.0.1:9", policies={path.ACCOUNTS: FAST})
+        with pytest.raises(ServiceUnavailableException):
+            builder.send_account_request("token")
+
+
+class TestCircuitBreaker:
+
+    def test_open_circuit_fails_fast(self, stub, builder):
+        """ The circuit opens after 5 failures in a row, part way through the second request """
+        stub.script = [(500, {}, {})] * 10
+        assert builder.send_get_savings_request("token", "acc").status == 500
+        with pytest.raises(ServiceUnavailableException):
+            builder.send_get_savings_request("token", "acc")
+        with pytest.raises(ServiceUnavailableException):
+            builder.send_get_savings_request("token", "acc")
+        assert len(stub.requests) == 5
+
+    def test_half_open_trial(self):
+        breaker = CircuitBreaker(threshold=1, reset_timeout=0)
+        breaker.record_failure()
+        assert breaker.get_state() == CircuitBreaker.HALF_OPEN
+        assert breaker.allow() is True
+        assert breaker.allow() is False       # Only one trial at a time
+        breaker.record_success()
+        assert breaker.get_state() == CircuitBreaker.CLOSED
+
+
+class Response:
+    def __init__(self, status, headers):
+        self.status = status
+        self.headers = headers
+
+
+class TestRateLimiter:
+
+    def test_token_bucket_paces_after_burst(self):
+        bucket = TokenBucket(rate=10, burst=2)
+        now = time.monotonic()
+        for _ in range(2):
+            assert bucket.wait_time(now) == 0
+            bucket.take()
+        assert bucket.wait_time(now) == pytest.approx(0.1, abs=0.01)
+        assert bucket.wait_time(now + 0.1) == pytest.approx(0, abs=1e-6)
+
+    def test_transfers_use_the_reserve(self):
+        """ With one token left, a read waits and a transfer is sent """
+        limiter = RateLimiter(rate=1, burst=3, token_rate=0, reserve=1)
+        assert limiter.delay("Bearer a") == 0
+        assert limiter.delay("Bearer b") == 0
+        assert limiter.delay("Bearer c") > 0
+        assert limiter.delay("Bearer c", priority=True) == 0
+
+    def test_per_token_bucket(self):
+        limiter = RateLimiter(rate=0, token_rate=1, token_burst=1, reserve=0)
+        assert limiter.delay("Bearer a") == 0
+        assert limiter.delay("Bearer a") > 0
+        assert limiter.delay("Bearer b") == 0
+
+    def test_adapts_to_quota_headers(self):
+        limiter = RateLimiter(rate=0, token_rate=0, token_burst=1, reserve=0)
+        assert limiter.delay("Bearer a") == limiter.delay("Bearer a") == 0       # Unlimited until Starling says
+        limiter.update("Bearer a", Response(200, {'X-RateLimit-Remaining': '20', 'X-RateLimit-Reset': '10'}))
+        limiter.delay("Bearer a")
+        assert limiter.delay("Bearer a") == pytest.approx(0.5, abs=0.05)        # 2 requests per second
+
+    def test_429_pauses_token(self):
+        limiter = RateLimiter(rate=0, token_rate=10, token_burst=5)
+        limiter.update("Bearer a", Response(429, {'Retry-After': '3'}))
+        assert limiter.delay("Bearer a", priority=True) == pytest.approx(3, abs=0.05)
+        assert limiter.delay("Bearer b") == 0
+
+    def test_builder_paced(self, stub):
+        """ Every attempt, retries included, is paced and sees the 429 """
+        stub.script = [(429, {'Retry-After': '0.2'}, {}), (200, {}, {"accounts": []})]
+        limiter = RateLimiter(rate=0, token_rate=100)
+        builder = RequestBuilder(base_url=stub.url, policies={path.ACCOUNTS: FAST}, limiter=limiter)
+        start = time.monotonic()
+
+        assert builder.send_account_request("token").status == 200
+        assert time.monotonic() - start >= 0.2
+        assert len(stub.requests) == 2
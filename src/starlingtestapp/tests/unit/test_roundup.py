@@ -0,0 +1,54 @@
+from roundup import RoundUpAccumulator, round_up_amount
+from user import User
+
+
+def item(minor_units, direction="OUT", status="SETTLED"):
+    return {"direction": direction, "status": status, "amount": {"minorUnits": minor_units}}
+
+
+class TestRoundUp:
+
+    def test_round_up_amount(self):
+        assert [round_up_amount(x) for x in [1, 99, 100, 101, 435, 0]] == [99, 1, 0, 99, 65, 0]
+
+    def test_exact_for_large_amounts(self):
+        """ Float division loses precision above 2**53, integer arithmetic does not """
+        amount = 2 ** 60 + 1
+        assert round_up_amount(amount) == 100 - amount % 100
+        assert User("auth", None).round(amount) == amount + round_up_amount(amount)
+
+    def test_feed_paths_exact_for_large_amounts(self):
+        """ The accumulator and the user round up go through round_up_amount, whatever the size """
+        amounts = [2 ** 60 * 100 + 1, 2 ** 70 * 100 + 35]
+        accumulator = RoundUpAccumulator()
+        accumulator.extend([item(amount) for amount in amounts])
+        accumulator.add("OUT", "SETTLED", amounts[0])
+
+        assert accumulator.get_total() == 99 + 65 + 99
+        assert User("auth", None).round_up_transactions({"feedItems": [item(amount) for amount in amounts]}) == 99 + 65
+
+    def test_only_out_settled_counted(self):
+        accumulator = RoundUpAccumulator()
+        accumulator.extend([item(435), item(520), item(87, direction="IN"), item(150, status="PENDING")])
+        assert accumulator.add("OUT", "SETTLED", 1) is True
+        assert accumulator.add("IN", "SETTLED", 1) is False
+
+        assert accumulator.get_total() == 65 + 80 + 99
+        assert accumulator.get_count() == 3
+
+    def test_user_round_up(self):
+        response = {"feedItems": [item(435), item(520), item(100)]}
+        assert User("auth", None).round_up_transactions(response) == 145
+
+    def test_user_is_slotted(self):
+        user = User("auth", None)
+
+        assert not hasattr(user, '__dict__')
+        assert user.get_accountUid() is None
+
+    def test_parsed_transactions_exact(self):
+        """ Amounts which do not fit in 64 bits are kept as they are """
+        user = User("auth", None)
+        user.parse_transaction_out_data({"feedItems": [item(2 ** 63), item(520), item(87, direction="IN")]})
+
+        assert user.transactions == [2 ** 63, 520]
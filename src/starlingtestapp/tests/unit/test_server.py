@@ -0,0 +1,107 @@
+import json
+import signal
+import subprocess
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+import urllib3
+
+import app
+from server import WorkerServer, build_event, create_listener
+from .test_app import FakeBuilder, SRC
+
+http = urllib3.PoolManager(retries=False)
+
+
+@pytest.fixture()
+def worker(monkeypatch):
+    """ A WorkerServer on a local port answering round ups from FakeBuilder """
+    monkeypatch.setattr(app, 'get_builder', lambda: FakeBuilder())
+    monkeypatch.setattr(app, 'get_metadata_cache', lambda: None)
+    monkeypatch.setattr(app, 'get_transfer_ledger', lambda: None)
+    servers = []
+
+    def start(threads=2, queue_size=4):
+        listener = create_listener('127.0.0.1', 0)
+        worker_server = WorkerServer(listener, threads, queue_size)
+        threading.Thread(target=worker_server.serve_forever, args=(0.05,), daemon=True).start()
+        servers.append((worker_server, listener))
+        return "http://127.0.0.1:%d" % listener.getsockname()[1]
+
+    yield start
+    for worker_server, listener in servers:
+        worker_server.shutdown()
+        worker_server.drain(1)
+        listener.close()
+
+
+class TestServer:
+
+    def test_build_event(self):
+        event = build_event('PUT', "/round?Authorization=good&date=2022-10-20", {'Host': 'x'}, b'')
+
+        assert event['httpMethod'] == 'PUT' and event['path'] == '/round'
+        assert app.get_inputs(event) == ("good", "2022-10-20", None)
+        assert build_event('PUT', "/round", {}, b'{}')['queryStringParameters'] is None
+
+    def test_round_up_request(self, worker):
+        url = worker()
+        response = http.request('PUT', url + "/round?Authorization=good&date=2022-10-20")
+
+        assert response.status == 200
+        assert json.loads(response.data) == {"success": True}
+        assert http.request('PUT', url + "/round?date=2022-10-20").status == 400
+        assert http.request('GET', url + "/round?Authorization=good&date=2022-10-20").status == 403
+
+    def test_handler_error_answered_502(self, worker, monkeypatch):
+        """ An exception out of lambda_handler gets API Gateway's 502, not a dropped connection """
+        def broken_handler(event, context):
+            raise KeyError('savingsGoalList')
+
+        monkeypatch.setattr(app, 'lambda_handler', broken_handler)
+        response = http.request('PUT', worker() + "/round?Authorization=good&date=2022-10-20")
+
+        assert response.status == 502
+        assert json.loads(response.data) == {"message": "Internal server error"}
+
+    def test_full_queue_answered_503(self, worker, monkeypatch):
+        """ With the one thread busy and the one queue slot taken, the next request is shed """
+        started, release = threading.Event(), threading.Event()
+
+        def slow_handler(event, context):
+            started.set()
+            release.wait(5)
+            return app.response_builder(200, {"success": True})
+
+        monkeypatch.setattr(app, 'lambda_handler', slow_handler)
+        url = worker(threads=1, queue_size=1)
+        with ThreadPoolExecutor(max_workers=2) as executor:
+            first = executor.submit(http.request, 'PUT', url + "/round")
+            assert started.wait(5)
+            queued = executor.submit(http.request, 'PUT', url + "/round")
+            time.sleep(0.2)                                 # Let the accept loop queue it
+            shed = http.request('PUT', url + "/round")
+            release.set()
+
+            assert shed.status == 503 and shed.headers['Retry-After'] == '1'
+            assert first.result().status == queued.result().status == 200
+
+
+class TestPreforkedServer:
+
+    def test_workers_serve_and_drain_on_sigterm(self):
+        process = subprocess.Popen([sys.executable, "server.py", "--port", "0", "--workers", "2"], cwd=SRC,
+                                   stdout=subprocess.PIPE, text=True)
+        try:
+            url = process.stdout.readline().split()[4]
+            responses = [http.request('PUT', url + "/round?date=2022-10-20") for _ in range(4)]
+            assert [response.status for response in responses] == [400] * 4
+            process.send_signal(signal.SIGTERM)
+            assert process.wait(10) == 0
+        finally:
+            if process.poll() is None:
+                process.kill()
+            process.stdout.close()
@@ -0,0 +1,131 @@
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pytest
+
+from cache import TTLCache, get_or_fetch, get_or_fetch_async
+from exceptions import AccountException
+from singleflight import SingleFlight, AsyncSingleFlight
+from .test_app import FakeResponse
+
+CALLERS = 8
+
+
+def run_together(function):
+    """ Call function from CALLERS threads at once, returning results or exceptions """
+    def call():
+        try:
+            return function()
+        except Exception as exc:
+            return exc
+
+    with ThreadPoolExecutor(max_workers=CALLERS) as executor:
+        return list(executor.map(lambda _: call(), range(CALLERS)))
+
+
+class BlockedFetch:
+    """ Fetch that holds its callers until every other caller has arrived """
+
+    def __init__(self, result=None, error=None):
+        self.result = result
+        self.error = error
+        self.calls = 0
+        self.arrived = threading.Semaphore(0)
+
+    def __call__(self):
+        self.calls += 1
+        for _ in range(CALLERS):            # Every caller has reached do, and after a moment waits on the key
+            self.arrived.acquire(timeout=5)
+        time.sleep(0.05)
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class TestSingleFlight:
+
+    def test_concurrent_callers_share_one_call(self):
+        flight = SingleFlight()
+        fetch = BlockedFetch({"accounts": []})
+
+        def do():
+            fetch.arrived.release()
+            return flight.do("key", fetch)
+
+        results = run_together(do)
+
+        assert fetch.calls == 1
+        assert all(value is fetch.result for value, _ in results)
+        assert sorted(shared for _, shared in results) == [False] + [True] * (CALLERS - 1)
+        assert len(flight) == 0
+
+    def test_error_reaches_every_waiter(self):
+        flight = SingleFlight()
+        error = AccountException(FakeResponse(403, {"error": "invalid_token"}))
+        fetch = BlockedFetch(error=error)
+
+        def do():
+            fetch.arrived.release()
+            return flight.do("key", fetch)
+
+        assert run_together(do) == [error] * CALLERS
+        assert fetch.calls == 1 and len(flight) == 0
+
+    def test_finished_call_not_reused(self):
+        flight = SingleFlight()
+        assert flight.do("key", lambda: 1) == (1, False)
+        assert flight.do("key", lambda: 2) == (2, False)
+
+    def test_get_or_fetch_caches_shared_result(self):
+        cache = TTLCache()
+        fetch = BlockedFetch({"savingsGoalList": []})
+
+        def do():
+            fetch.arrived.release()
+            return get_or_fetch(cache, "token:savings:acc-1", fetch)
+
+        results = run_together(do)
+
+        assert fetch.calls == 1
+        assert results == [(fetch.result, False)] * CALLERS
+        assert get_or_fetch(cache, "token:savings:acc-1", fetch) == (fetch.result, True)
+
+
+class TestAsyncSingleFlight:
+
+    def test_concurrent_callers_share_one_call(self):
+        calls = []
+
+        async def fetch():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return {"accounts": []}
+
+        async def run():
+            return await asyncio.gather(*[get_or_fetch_async(None, "token:accounts", fetch) for _ in range(CALLERS)])
+
+        results = asyncio.run(run())
+
+        assert len(calls) == 1
+        assert results == [({"accounts": []}, False)] * CALLERS
+
+    def test_error_and_cancelled_leader(self):
+        flight = AsyncSingleFlight()
+
+        async def fetch():
+            await asyncio.sleep(0.01)
+            raise AccountException(FakeResponse(403, {"error": "invalid_token"}))
+
+        async def run():
+            leader = asyncio.ensure_future(flight.do("key", fetch))
+            await asyncio.sleep(0)
+            waiter = asyncio.ensure_future(flight.do("key", fetch))
+            leader.cancel()                 # The call goes on for the waiter
+            with pytest.raises(AccountException):
+                await waiter
+            return leader.cancelled()
+
+        assert asyncio.run(run())
+        assert len(flight) == 0